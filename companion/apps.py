@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class CompanionConfig(AppConfig):
+    name = 'companion'
+
+    def ready(self):
+        from . import signals
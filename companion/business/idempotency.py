@@ -0,0 +1,171 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.files.base import File
+from django.db import IntegrityError, transaction
+from django.http import QueryDict
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+from companion.models import IdempotencyKey
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+class IdempotencyKeyInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = _('A request with this idempotency key is still being processed.')
+    default_code = 'idempotency_key_in_progress'
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = _('This idempotency key was already used for a different request.')
+    default_code = 'idempotency_key_reused'
+
+
+class IdempotencyBusiness:
+    """
+    Run a view at most once per (user, idempotency key).
+    The first response is stored and replayed for retries until the key expires
+    (see `IDEMPOTENCY_KEY_TTL`).
+    Responses of requests that failed with an exception or a server error are not stored,
+    so that those requests can be retried.
+    A key held for longer than `IDEMPOTENCY_KEY_LEASE` (e.g. its worker crashed) is taken over by retries.
+    """
+    def __init__(self, request, key):
+        self.request = request
+        self.key = key
+
+    def get_response(self, view):
+        self._validate_key()
+
+        record = self._lock()
+        if record is None:
+            return self._replay(self._get_existing())
+
+        try:
+            response = view()
+        except Exception:
+            record.delete()
+            raise
+
+        if response.status_code >= 500:
+            record.delete()
+        else:
+            record.status_code = response.status_code
+            record.response_data = response.data
+            record.save(update_fields=['status_code', 'response_data'])
+        return response
+
+    def _validate_key(self):
+        if len(self.key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise ValidationError({
+                IDEMPOTENCY_KEY_HEADER: _('Ensure this value has at most %d characters.') % IDEMPOTENCY_KEY_MAX_LENGTH
+            })
+
+    def _lock(self):
+        """
+        Claim the key for this request.
+        Return None if the key is held by another request, or was already used.
+        """
+        self._delete_if_expired()
+        record = IdempotencyKey(
+            user=self.request.user,
+            key_hash=self.key_hash,
+            request_hash=self.request_hash,
+        )
+        try:
+            with transaction.atomic():
+                record.save(force_insert=True)
+        except IntegrityError:
+            return self._take_over()
+        return record
+
+    def _take_over(self):
+        """
+        Claim the key from the request holding it, if its lease expired.
+        """
+        record = self._get_existing()
+        lease_expired_time = timezone.now() - settings.IDEMPOTENCY_KEY_LEASE
+        if (
+            record is None or
+            not record.is_processing() or
+            record.request_hash != self.request_hash or
+            record.create_time >= lease_expired_time
+        ):
+            return None
+
+        # Of concurrent retries, only the first one to update the record takes it over
+        now = timezone.now()
+        taken_over = IdempotencyKey.objects.filter(
+            pk=record.pk,
+            status_code__isnull=True,
+            create_time=record.create_time,
+        ).update(create_time=now)
+        if not taken_over:
+            return None
+        record.create_time = now
+        return record
+
+    def _get_existing(self):
+        return IdempotencyKey.objects.filter(user=self.request.user, key_hash=self.key_hash).first()
+
+    def _delete_if_expired(self):
+        expired_time = timezone.now() - settings.IDEMPOTENCY_KEY_TTL
+        IdempotencyKey.objects.filter(
+            user=self.request.user,
+            key_hash=self.key_hash,
+            create_time__lt=expired_time,
+        ).delete()
+
+    def _replay(self, record):
+        if record is None:
+            # Previous request failed and released the key right after we tried to claim it
+            raise IdempotencyKeyInProgress()
+        if record.request_hash != self.request_hash:
+            raise IdempotencyKeyReused()
+        if record.is_processing():
+            raise IdempotencyKeyInProgress()
+
+        return Response(
+            record.response_data,
+            status=record.status_code,
+            headers={REPLAYED_HEADER: 'true'},
+        )
+
+    @property
+    def key_hash(self):
+        return _sha256(self.key)
+
+    @cached_property
+    def request_hash(self):
+        data = self.request.data
+        if isinstance(data, QueryDict):
+            # Form and multipart data, keep every value of repeated keys
+            data = dict(data.lists())
+        data = json.dumps(data, sort_keys=True, default=_hashable_value)
+        return _sha256(f'{self.request.method} {self.request.path} {data}')
+
+
+def _sha256(value):
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def _hashable_value(value):
+    if isinstance(value, File):
+        # Uploads are told apart by their content, not their client-chosen name
+        digest = hashlib.sha256()
+        value.seek(0)
+        for chunk in value.chunks():
+            digest.update(chunk)
+        value.seek(0)
+        return f'{value.size} {digest.hexdigest()}'
+    return str(value)
@@ -1,7 +1,34 @@
 from .filters import downgrade_host_not_allowed_error
 
+FILE_HANDLER_CLASSES = {
+    'size': 'logging.handlers.RotatingFileHandler',
+    'time': 'logging.handlers.TimedRotatingFileHandler',
+    # Rotated by another program (e.g. logrotate), files are reopened once moved
+    'external': 'logging.handlers.WatchedFileHandler',
+}
+
+
+def logging_config(base_dir, rotation='external', max_bytes=10485760, when='midnight', backup_count=10, json=False):
+    """
+    Records of app loggers are written to files (rotated by size, by time, or externally, see `rotation`)
+    and mailed to admins, by the `async` handler in a background thread.
+    Rotating by size or time is only safe with a single process writing the files:
+    each process would rotate them on its own, losing records of the others.
+    """
+    def file_handler(level, filename):
+        handler = {
+            'level': level,
+            'class': FILE_HANDLER_CLASSES[rotation],
+            'filename': base_dir / 'logs' / filename,
+            'filters': ['downgrade_host_not_allowed_error', 'require_debug_false'],
+            'formatter': 'json' if json else 'verbose',
+        }
+        if rotation == 'size':
+            handler.update(maxBytes=max_bytes, backupCount=backup_count)
+        elif rotation == 'time':
+            handler.update(when=when, backupCount=backup_count)
+        return handler
 
-def logging_config(base_dir):
     return {
         'version': 1,
         'disable_existing_loggers': False,
@@ -15,6 +42,9 @@ def logging_config(base_dir):
                 'format': '[{server_time}] {message}',
                 'style': '{',
             },
+            'json': {
+                '()': 'companion.logger.formatters.JSONFormatter',
+            },
         },
         'filters': {
             'require_debug_false': {
@@ -39,36 +69,24 @@ def logging_config(base_dir):
                 'class': 'logging.StreamHandler',
                 'formatter': 'django.server',
             },
-            'file_info': {
-                'level': 'INFO',
-                'class': 'logging.FileHandler',
-                'filename': base_dir / 'logs/info.log',
-                'filters': ['downgrade_host_not_allowed_error', 'require_debug_false'],
-                'formatter': 'verbose',
-            },
-            'file_warning': {
-                'level': 'WARNING',
-                'class': 'logging.FileHandler',
-                'filename': base_dir / 'logs/warning.log',
-                'filters': ['downgrade_host_not_allowed_error', 'require_debug_false'],
-                'formatter': 'verbose',
-            },
-            'file_error': {
-                'level': 'ERROR',
-                'class': 'logging.FileHandler',
-                'filename': base_dir / 'logs/error.log',
-                'filters': ['downgrade_host_not_allowed_error', 'require_debug_false'],
-                'formatter': 'verbose',
-            },
+            'file_info': file_handler('INFO', 'info.log'),
+            'file_warning': file_handler('WARNING', 'warning.log'),
+            'file_error': file_handler('ERROR', 'error.log'),
             'mail_admins': {
                 'level': 'ERROR',
                 'class': 'django.utils.log.AdminEmailHandler',
                 'filters': ['downgrade_host_not_allowed_error', 'require_debug_false'],
             },
+            # Emits records with the handlers above, in a background thread
+            'async': {
+                'level': 'INFO',
+                'class': 'companion.logger.handlers.AsyncHandler',
+                'handlers': ['file_info', 'file_warning', 'file_error', 'mail_admins'],
+            },
         },
         'loggers': {
             'django': {
-                'handlers': ['console', 'file_info', 'file_warning', 'file_error', 'mail_admins'],
+                'handlers': ['console', 'async'],
                 'level': 'INFO',
             },
             'django.server': {
@@ -77,15 +95,15 @@ def logging_config(base_dir):
                 'propagate': False,
             },
             'companion': {
-                'handlers': ['console', 'file_info', 'file_warning', 'file_error', 'mail_admins'],
+                'handlers': ['console', 'async'],
                 'level': 'INFO',
             },
             'split_the_bill': {
-                'handlers': ['console', 'file_info', 'file_warning', 'file_error', 'mail_admins'],
+                'handlers': ['console', 'async'],
                 'level': 'INFO',
             },
             'user': {
-                'handlers': ['console', 'file_info', 'file_warning', 'file_error', 'mail_admins'],
+                'handlers': ['console', 'async'],
                 'level': 'INFO',
             },
         }
@@ -0,0 +1,19 @@
+import json
+import logging
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per line, for log collectors.
+    """
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
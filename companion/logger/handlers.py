@@ -0,0 +1,58 @@
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+
+class AsyncHandler(QueueHandler):
+    """
+    Only put records in a queue, they are emitted by `handlers` (names of other configured handlers)
+    in a background thread, so that logging never waits for files or emails.
+
+    The thread is started at the first record of each process:
+    processes forked afterwards (e.g. gunicorn or celery workers) start their own.
+    """
+    def __init__(self, handlers):
+        super().__init__(queue.SimpleQueue())
+        self.handler_names = handlers
+        self.listener = None
+        self.pid = None
+
+    def emit(self, record):
+        if self.pid != os.getpid():
+            self.start()
+        super().emit(record)
+
+    def prepare(self, record):
+        # Unlike `QueueHandler`, records are not formatted here: they stay in this process so don't need pickling,
+        # and handlers get exception info as is (e.g. `AdminEmailHandler` renders the traceback).
+        # Only the message is frozen, before arguments change.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def start(self):
+        with self.lock:
+            # Checked again under the lock: threads logging their first records at once would each start a listener
+            if self.pid == os.getpid():
+                return
+            # A forked process doesn't have the parent's thread, nor the records it had queued
+            self.queue = queue.SimpleQueue()
+            # Handlers configured by `dictConfig` are registered by name
+            handlers = [logging._handlers[name] for name in self.handler_names]
+            self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+            self.listener.start()
+            self.pid = os.getpid()
+        # Emit queued records before exiting
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self.listener is not None and self.pid == os.getpid():
+            self.listener.stop()
+        self.listener = None
+        self.pid = None
+
+    def close(self):
+        self.stop()
+        super().close()
@@ -0,0 +1,41 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure latency of a query made like in a request (with request started/finished signals), '
+        'opening a new DB connection for each request vs reusing a persistent one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        conn_max_age = connection.settings_dict['CONN_MAX_AGE']
+        try:
+            for label, max_age in [('New connection per request', 0), ('Persistent connection', None)]:
+                connection.close()
+                connection.settings_dict['CONN_MAX_AGE'] = max_age
+                timings = [self.time_request(connection) for _ in range(options['requests'])]
+                self.stdout.write(
+                    f'{label}: mean {statistics.mean(timings) * 1000:.2f} ms, '
+                    f'p95 {statistics.quantiles(timings, n=20)[-1] * 1000:.2f} ms'
+                )
+        finally:
+            connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+            connection.close()
+
+    def time_request(self, connection):
+        start = time.perf_counter()
+        request_started.send(sender=self.__class__)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        request_finished.send(sender=self.__class__)
+        return time.perf_counter() - start
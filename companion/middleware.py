@@ -0,0 +1,103 @@
+import json
+import logging
+import random
+import time
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+
+from companion.utils.db import (mark_user_wrote, read_from_replicas,
+                                user_wrote_recently)
+from companion.utils.prometheus import observe_request
+from companion.utils.request_metrics import RequestMetrics, get_request_metrics
+from user.authentication import get_token_user_id
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure where time of requests goes: total, view (rendering included), serialization (see `time_serialization`),
+    JSON rendering, DB queries and cache hits/misses (see `RequestMetrics`).
+    Only a sample of requests (`REQUEST_METRICS_SAMPLE_RATE`) is instrumented, as wrapping every DB query has a cost:
+    their details are sent in `Server-Timing` header (shown by browsers' dev tools) and logged,
+    and their number of DB queries is recorded for `/metrics`. Latency of all requests is recorded for `/metrics`.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.REQUEST_METRICS_SAMPLE_RATE:
+            start = time.perf_counter()
+            response = self.get_response(request)
+            observe_request(request, response, time.perf_counter() - start)
+            return response
+
+        metrics = RequestMetrics()
+        with metrics.collect():
+            start = time.perf_counter()
+            response = self.get_response(request)
+            end = time.perf_counter()
+        metrics.timings['total'] = end - start
+        if hasattr(request, '_metrics_view_start'):
+            metrics.timings['view'] = end - request._metrics_view_start
+
+        observe_request(request, response, metrics.timings['total'], db_queries=metrics.counts['db'])
+        response['Server-Timing'] = self.get_server_timing(metrics)
+        logger.info('Request metrics: %s', json.dumps(self.get_log_data(request, response, metrics)))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if get_request_metrics() is not None:
+            request._metrics_view_start = time.perf_counter()
+
+    def get_server_timing(self, metrics):
+        entries = [
+            f'{name};dur={metrics.timings[name] * 1000:.1f}'
+            for name in ['total', 'view', 'serialize', 'render']
+            if name in metrics.timings
+        ]
+        entries.append(f'db;dur={metrics.timings["db"] * 1000:.1f};desc="{metrics.counts["db"]} queries"')
+        entries.append(f'cache;desc="{metrics.counts["cache_hits"]} hits, {metrics.counts["cache_misses"]} misses"')
+        return ', '.join(entries)
+
+    def get_log_data(self, request, response, metrics):
+        resolver_match = request.resolver_match
+        return {
+            'method': request.method,
+            'path': request.path,
+            'view': resolver_match.view_name if resolver_match else None,
+            'status': response.status_code,
+            **{f'{name}_ms': round(duration * 1000, 1) for name, duration in metrics.timings.items()},
+            'db_queries': metrics.counts['db'],
+            'cache_hits': metrics.counts['cache_hits'],
+            'cache_misses': metrics.counts['cache_misses'],
+        }
+
+
+class ReplicaMiddleware:
+    """
+    Reads of safe-method requests go to replicas (see `ReplicaRouter`),
+    unless the user wrote less than `DATABASE_REPLICA_STICKY_SECONDS` ago, so that they always see their own writes.
+    The user is known from their access token before authentication (which may itself read the DB),
+    so only users authenticated by JWT are sticky.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        if request.method in SAFE_METHODS:
+            user_id = get_token_user_id(request)
+            if user_id is None or not user_wrote_recently(user_id):
+                with read_from_replicas():
+                    return self.get_response(request)
+            return self.get_response(request)
+
+        response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            mark_user_wrote(user.pk)
+        return response
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+
+class IdempotencyKey(models.Model):
+    """
+    First response of a mutating request sent with an "Idempotency-Key" header,
+    so that retries of that request are replayed instead of executed again.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key_hash = models.CharField(max_length=64)  # sha256 of the client's key, so size is fixed
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)  # null while the request is being processed
+    response_data = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    create_time = models.DateTimeField(auto_now_add=True, db_index=True)  # Reset when a retry takes the key over
+
+    class Meta:
+        unique_together = ['user', 'key_hash']
+
+    def is_processing(self):
+        return self.status_code is None
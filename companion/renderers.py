@@ -1,8 +1,17 @@
 from django.conf import settings
 from django.template import loader
+from rest_framework import renderers
 from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.reverse import reverse
 
+from companion.utils.request_metrics import timer
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timer('render'):
+            return super().render(data, accepted_media_type=accepted_media_type, renderer_context=renderer_context)
+
 
 class CustomBrowsableAPIRenderer(BrowsableAPIRenderer):
     def get_filter_form(self, data, view, request):
@@ -0,0 +1,34 @@
+import time
+
+from celery.signals import task_failure, task_postrun, task_prerun
+from django.core.signals import request_started
+from django.dispatch import receiver
+
+from companion.utils.db import close_unusable_connections
+from companion.utils.prometheus import TASK_DURATION, TASK_FAILURES
+
+# Tasks being run by this process: task id -> start time
+_task_start_times = {}
+
+
+@receiver(request_started)
+@receiver(task_prerun)
+def check_db_connections(**kwargs):
+    close_unusable_connections()
+
+
+@receiver(task_prerun)
+def start_task_timer(task_id, **kwargs):
+    _task_start_times[task_id] = time.perf_counter()
+
+
+@receiver(task_postrun)
+def observe_task_duration(task_id, task, **kwargs):
+    start_time = _task_start_times.pop(task_id, None)
+    if start_time is not None:
+        TASK_DURATION.labels(task.name).observe(time.perf_counter() - start_time)
+
+
+@receiver(task_failure)
+def count_task_failure(sender, **kwargs):
+    TASK_FAILURES.labels(sender.name).inc()
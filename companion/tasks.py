@@ -0,0 +1,17 @@
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from companion.models import IdempotencyKey
+from companion.utils.db import delete_in_batches
+
+PRUNE_BATCH_SIZE = 1000
+
+
+@shared_task
+def prune_idempotency_keys_task():
+    return prune_idempotency_keys()
+
+def prune_idempotency_keys(batch_size=PRUNE_BATCH_SIZE):
+    expired_time = timezone.now() - settings.IDEMPOTENCY_KEY_TTL
+    return delete_in_batches(IdempotencyKey.objects.filter(create_time__lt=expired_time), batch_size)
@@ -1,7 +1,41 @@
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from copy import copy
+from datetime import timedelta
+from logging.handlers import QueueListener
+from unittest.mock import Mock, patch
+
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from django.utils import timezone
 
+from freezegun import freeze_time
 from model_bakery import baker
+from prometheus_client import REGISTRY
+
+from companion.logger.formatters import JSONFormatter
+from companion.logger.handlers import AsyncHandler
+from companion.models import IdempotencyKey
+from companion.tasks import prune_idempotency_keys, prune_idempotency_keys_task
+from companion.utils.cache import FileBasedCache
+from companion.utils.db import (close_unusable_connections, read_from_primary,
+                                read_from_replicas)
+from companion.utils.request_metrics import RequestMetrics
+from companion.utils.storage import ContentAddressedFileSystemStorage
+from companion.utils.testing import MediaTestCase
+from split_the_bill.models import Event
 
 User = get_user_model()
 
@@ -25,3 +59,380 @@ class CompanionTestCase(APITestCase):
         self.client.force_authenticate(user=user)
         res = self.client.get('/split-the-bill/events/?format=api')
         self.assertNotEqual(res.content, b'<a href="http://testserver/api-auth/login/?format=api">Login</a>')
+
+
+class CloseUnusableConnectionsTestCase(APITestCase):
+    def make_connection(self, usable, health_checks=True, **kwargs):
+        return Mock(**{
+            'connection': object(),
+            'in_atomic_block': False,
+            'settings_dict': {'CONN_HEALTH_CHECKS': health_checks},
+            'is_usable.return_value': usable,
+            **kwargs,
+        })
+
+    def test_close_unusable_connections(self):
+        unusable = self.make_connection(usable=False)
+        usable = self.make_connection(usable=True)
+        not_checked = self.make_connection(usable=False, health_checks=False)
+        in_transaction = self.make_connection(usable=False, in_atomic_block=True)
+        not_connected = self.make_connection(usable=False, connection=None)
+
+        with patch('companion.utils.db.connections') as connections:
+            connections.all.return_value = [unusable, usable, not_checked, in_transaction, not_connected]
+            close_unusable_connections()
+
+        unusable.close.assert_called_once()
+        for connection in [usable, not_checked, in_transaction, not_connected]:
+            connection.close.assert_not_called()
+        not_checked.is_usable.assert_not_called()
+        not_connected.is_usable.assert_not_called()
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTestCase(MediaTestCase):
+    databases = {'default', 'replica'}
+    url = '/split-the-bill/events/'
+
+    def setUp(self):
+        cache.clear()
+        # Replica isn't replicated in tests: it only has the user, not what is written to default
+        self.user = baker.make(User)
+        User.objects.using('replica').bulk_create([copy(self.user)])
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def get_event_names(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        return [event['name'] for event in res.json()['results']]
+
+    def test_safe_requests_read_from_replica(self):
+        event = baker.make(Event, creator=self.user)
+        event.members.add(self.user)
+        self.assertListEqual(self.get_event_names(), [])
+
+        with read_from_replicas():
+            self.assertFalse(Event.objects.exists())
+        self.assertTrue(Event.objects.exists())
+
+    def test_writes_go_to_primary(self):
+        with read_from_replicas():
+            user = User.objects.get(pk=self.user.pk)
+            baker.make(Event, creator=user)
+        self.assertFalse(Event.objects.using('replica').exists())
+        self.assertTrue(Event.objects.using('default').exists())
+
+    def test_read_your_writes(self):
+        res = self.client.post(self.url, {'name': 'Grove Street'})
+        self.assertEqual(res.status_code, 201)
+        self.assertListEqual(self.get_event_names(), ['Grove Street'])
+
+        # Once sticky period is over
+        cache.clear()
+        self.assertListEqual(self.get_event_names(), [])
+
+    def test_sync_reads_from_primary(self):
+        event = baker.make(Event, creator=self.user)
+        event.members.add(self.user)
+
+        res = self.client.get('/split-the-bill/sync/')
+        self.assertEqual(res.status_code, 200)
+        self.assertListEqual([event['pk'] for event in res.json()['events']['updated']], [event.pk])
+
+        with read_from_replicas(), read_from_primary():
+            self.assertTrue(Event.objects.exists())
+
+
+class RequestMetricsTestCase(APITestCase):
+    url = '/split-the-bill/events/'
+
+    def setUp(self):
+        self.client.force_authenticate(user=baker.make(User))
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=1)
+    def test_sampled_request(self):
+        with self.assertLogs('companion.middleware', 'INFO') as logs:
+            res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+
+        server_timing = res['Server-Timing']
+        for name in ['total', 'view', 'serialize', 'render', 'db']:
+            self.assertRegex(server_timing, rf'\b{name};dur=\d+\.\d\b')
+        queries = int(re.search(r'db;dur=[\d.]+;desc="(\d+) queries"', server_timing)[1])
+        self.assertGreater(queries, 0)
+
+        data = json.loads(logs.records[0].args[0])
+        self.assertEqual(data['view'], 'event-list')
+        self.assertEqual(data['status'], 200)
+        self.assertEqual(data['db_queries'], queries)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+    def test_not_sampled_request(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('Server-Timing', res)
+
+    def test_collect(self):
+        metrics = RequestMetrics()
+        with metrics.collect():
+            User.objects.count()
+            cache.get('missing')
+        User.objects.count()
+        self.assertEqual(metrics.counts['db'], 1)
+        self.assertEqual(metrics.counts['cache_misses'], 1)
+
+
+@override_settings(METRICS_TOKEN='secret')
+class MetricsTestCase(APITestCase):
+    url = '/metrics'
+
+    def get_metrics(self):
+        res = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(res.status_code, 200)
+        return res.content.decode()
+
+    def test_token_required(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 404)
+        res = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(res.status_code, 404)
+
+        with override_settings(METRICS_TOKEN=''):
+            res = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer ')
+            self.assertEqual(res.status_code, 404)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=1)
+    def test_request_metrics(self):
+        self.client.force_authenticate(user=baker.make(User))
+        self.client.get('/split-the-bill/events/')
+        self.client.force_authenticate(user=None)
+
+        metrics = self.get_metrics()
+        self.assertIn('http_request_duration_seconds_count{method="GET",status="200",view="event-list"}', metrics)
+        self.assertIn('http_request_db_queries_count{view="event-list"}', metrics)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+    def test_request_metrics__not_sampled(self):
+        def get_count(metric, labels):
+            return REGISTRY.get_sample_value(metric, labels) or 0
+
+        latency_labels = {'view': 'group-list', 'method': 'GET', 'status': '200'}
+        latencies = get_count('http_request_duration_seconds_count', latency_labels)
+        db_queries = get_count('http_request_db_queries_count', {'view': 'group-list'})
+
+        self.client.force_authenticate(user=baker.make(User))
+        with patch.object(RequestMetrics, 'collect') as mock_collect:
+            res = self.client.get('/split-the-bill/groups/')
+        self.assertEqual(res.status_code, 200)
+        mock_collect.assert_not_called()
+
+        # Latency of every request, DB queries are only counted for sampled ones
+        self.assertEqual(get_count('http_request_duration_seconds_count', latency_labels), latencies + 1)
+        self.assertEqual(get_count('http_request_db_queries_count', {'view': 'group-list'}), db_queries)
+
+    def test_task_metrics(self):
+        name = prune_idempotency_keys_task.name
+
+        def get_count(metric):
+            return REGISTRY.get_sample_value(metric, {'task': name}) or 0
+
+        durations = get_count('celery_task_duration_seconds_count')
+        failures = get_count('celery_task_failures_total')
+
+        prune_idempotency_keys_task.apply()
+        with patch('companion.tasks.prune_idempotency_keys', side_effect=ValueError):
+            prune_idempotency_keys_task.apply()
+
+        self.assertEqual(get_count('celery_task_duration_seconds_count'), durations + 2)
+        self.assertEqual(get_count('celery_task_failures_total'), failures + 1)
+
+    def test_multiprocess(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        # Each process writes its own metrics to the shared directory
+        script = "from prometheus_client import Counter; Counter('test_events', 'Test.').inc(3)"
+        for _ in range(2):
+            subprocess.run([sys.executable, '-c', script], env={**os.environ, 'PROMETHEUS_MULTIPROC_DIR': directory},
+                           check=True)
+
+        with patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': directory}):
+            metrics = self.get_metrics()
+        self.assertIn('test_events_total 6.0', metrics)
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        record.emit_thread = threading.current_thread()
+        self.records.append(record)
+
+
+class AsyncHandlerTestCase(APITestCase):
+    def setUp(self):
+        self.target = _ListHandler()
+        self.target.set_name('test_async_target')
+        self.handler = AsyncHandler(['test_async_target'])
+        self.addCleanup(self.handler.close)
+        self.addCleanup(self.target.close)
+
+        self.logger = logging.getLogger('companion.tests.async')
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def test_records_are_emitted_in_background(self):
+        arg = ['mutable']
+        try:
+            raise ValueError('Oops')
+        except ValueError:
+            self.logger.exception('Failed: %s', arg)
+        arg.append('changed')
+        self.handler.stop()
+
+        record, = self.target.records
+        self.assertIsNot(record.emit_thread, threading.current_thread())
+        self.assertEqual(record.getMessage(), "Failed: ['mutable']")
+        self.assertIs(record.exc_info[0], ValueError)
+
+    def test_restarted_after_fork(self):
+        self.logger.info('Before')
+        listener = self.handler.listener
+
+        # As in a forked process
+        self.handler.pid = -1
+        self.logger.info('After')
+        self.assertIsNot(self.handler.listener, listener)
+        listener.stop()
+        self.handler.stop()
+
+        self.assertEqual([record.getMessage() for record in self.target.records], ['Before', 'After'])
+
+    def test_started_once_by_concurrent_threads(self):
+        barrier = threading.Barrier(4)
+
+        def log():
+            barrier.wait()
+            # Not through `Handler.handle`, which holds the lock
+            self.handler.emit(logging.makeLogRecord({'msg': 'First', 'levelno': logging.INFO}))
+
+        with patch('companion.logger.handlers.QueueListener', wraps=QueueListener) as mock_listener:
+            threads = [threading.Thread(target=log) for _ in range(barrier.parties)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.handler.stop()
+
+        mock_listener.assert_called_once()
+        self.assertEqual(len(self.target.records), barrier.parties)
+
+
+class JSONFormatterTestCase(APITestCase):
+    def test_format(self):
+        try:
+            raise ValueError('Oops')
+        except ValueError:
+            record = logging.getLogger('companion').makeRecord(
+                'companion', logging.ERROR, __file__, 1, 'Failed: %s', ('thing',), sys.exc_info(),
+            )
+
+        data = json.loads(JSONFormatter().format(record))
+        self.assertEqual(data['level'], 'ERROR')
+        self.assertEqual(data['logger'], 'companion')
+        self.assertEqual(data['message'], 'Failed: thing')
+        self.assertIn('ValueError: Oops', data['exception'])
+
+
+class PruneIdempotencyKeysTestCase(APITestCase):
+    def test__prune_expired_keys_in_batches(self):
+        user = baker.make(User)
+        with freeze_time(timezone.now() - settings.IDEMPOTENCY_KEY_TTL - timedelta(minutes=1)):
+            baker.make(IdempotencyKey, user=user, _quantity=5)
+        fresh_keys = baker.make(IdempotencyKey, user=user, _quantity=2)
+
+        with self.assertNumQueries(3 * 2 + 1):  # 3 batches (2, 2, 1) of select + delete, then nothing left
+            deleted_count = prune_idempotency_keys(batch_size=2)
+
+        self.assertEqual(deleted_count, 5)
+        self.assertQuerysetEqual(
+            IdempotencyKey.objects.order_by('pk'),
+            [key.pk for key in fresh_keys],
+            transform=lambda key: key.pk,
+        )
+
+
+class ContentAddressedStorageTestCase(APITestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.storage = ContentAddressedFileSystemStorage(location=directory)
+
+    def test__concurrent_saves_of_same_content(self):
+        name = self.storage.save('files/a.txt', ContentFile(b'content'))
+
+        # Another process stored the same content between the check and the write
+        with patch.object(self.storage, 'exists', side_effect=[False, True, True]):
+            self.assertEqual(self.storage.save('files/b.txt', ContentFile(b'content')), name)
+        self.assertEqual(self.storage.listdir(os.path.dirname(name))[1], [os.path.basename(name)])
+
+
+class CacheTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_namespaces(self):
+        caches['jwt_user'].set('key', 1)
+        self.assertEqual(caches['jwt_user'].get('key'), 1)
+        self.assertIsNone(caches['throttle'].get('key'))
+        self.assertIsNone(cache.get('key'))
+
+        with override_settings(CACHES={
+            alias: {**params, 'VERSION': params['VERSION'] + 1}
+            for alias, params in settings.CACHES.items()
+        }):
+            self.assertIsNone(caches['jwt_user'].get('key'))
+
+    def get_cache_metrics(self):
+        return {
+            (namespace, name): REGISTRY.get_sample_value(f'cache_{name}_total', {'namespace': namespace}) or 0
+            for namespace in ['user_search', 'default']
+            for name in ['hits', 'misses']
+        }
+
+    def test_metrics(self):
+        before = self.get_cache_metrics()
+        caches['user_search'].set('a', 1)
+        caches['user_search'].get('a')
+        caches['user_search'].get('b')
+        caches['user_search'].get_many(['a', 'b', 'c'])
+        cache.get('a')
+
+        after = self.get_cache_metrics()
+        self.assertEqual({key: after[key] - before[key] for key in after}, {
+            ('user_search', 'hits'): 2,
+            ('user_search', 'misses'): 3,
+            ('default', 'hits'): 0,
+            ('default', 'misses'): 1,
+        })
+
+    def test_file_based_cache_incr_is_atomic(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        def incr():
+            # Own instance, like another process
+            file_cache = FileBasedCache(directory, {})
+            for _ in range(50):
+                file_cache.add('counter', 0)
+                file_cache.incr('counter')
+
+        threads = [threading.Thread(target=incr) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(FileBasedCache(directory, {}).get('counter'), 200)
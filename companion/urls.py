@@ -22,6 +22,7 @@ from . import root_endpoints, views
 
 urlpatterns = [
     path('', views.RootAPIView.as_view()),
+    path('metrics', views.metrics, name='companion-metrics'),
     path('test-error-logging/', views.TestErrorLoggingAPIView.as_view(), name='companion-test-error-logging'),
     path(root_endpoints.USER, include('user.urls')),
     path(root_endpoints.SPLIT_THE_BILL, include('split_the_bill.urls')),
@@ -31,4 +32,4 @@ urlpatterns = [
 ]
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    urlpatterns += static(settings.MEDIA_URL, view=views.serve_media, document_root=settings.MEDIA_ROOT)
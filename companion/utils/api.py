@@ -1,5 +1,9 @@
 import functools
 
+from rest_framework.permissions import SAFE_METHODS
+
+from companion.business.idempotency import IDEMPOTENCY_KEY_HEADER, IdempotencyBusiness
+
 
 def extra_action_urls(extra_actions_or_viewset):
     has_extra_actions = isinstance(extra_actions_or_viewset, dict)
@@ -50,3 +54,42 @@ def extra_action_urls(extra_actions_or_viewset):
         return decorator
     else:
         return decorator(extra_actions_or_viewset)
+
+
+def idempotent(ViewSet):
+    """
+    Let clients safely retry mutating requests (create, update, destroy, and POST/PUT/PATCH/DELETE extra actions)
+    by sending an "Idempotency-Key" header: the first response for each key is replayed for retries
+    instead of running the action again.
+    Requests without the header, or from anonymous users, are handled as usual.
+    """
+    handler_names = [
+        name for name in ['create', 'update', 'partial_update', 'destroy']
+        if hasattr(ViewSet, name)
+    ]
+    for action in ViewSet.get_extra_actions():
+        handler_names.extend(
+            handler_name for method, handler_name in action.mapping.items()
+            if method.upper() not in SAFE_METHODS
+        )
+
+    def make_idempotent(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+            if (
+                not key or
+                request.method in SAFE_METHODS or
+                not request.user.is_authenticated
+            ):
+                return method(self, request, *args, **kwargs)
+
+            business = IdempotencyBusiness(request, key)
+            return business.get_response(lambda: method(self, request, *args, **kwargs))
+
+        return wrapper
+
+    for name in set(handler_names):
+        setattr(ViewSet, name, make_idempotent(getattr(ViewSet, name)))
+
+    return ViewSet
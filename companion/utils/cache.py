@@ -0,0 +1,95 @@
+import hashlib
+import os
+
+from django.core.cache.backends import filebased
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.files import locks
+from django.utils.module_loading import import_string
+
+from companion.utils.prometheus import CACHE_HITS, CACHE_MISSES
+from companion.utils.request_metrics import get_request_metrics
+
+LOCK_STRIPES = 64
+
+_MISSING = object()
+
+
+class InstrumentedCache:
+    """
+    Cache backend wrapping another one (`OPTIONS['BACKEND']`),
+    counts hits and misses of reads (`CACHE_HITS` and `CACHE_MISSES`), by namespace (`KEY_PREFIX` of the cache),
+    and in metrics of current request (see `RequestMetrics`).
+    """
+    def __init__(self, location, params):
+        params = params.copy()
+        options = params.get('OPTIONS', {}).copy()
+        backend = options.pop('BACKEND')
+        params['OPTIONS'] = options
+
+        self.namespace = params.get('KEY_PREFIX') or 'default'
+        self.backend = import_string(backend)(location, params)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def __contains__(self, key):
+        return key in self.backend
+
+    def get(self, key, default=None, version=None):
+        value = self.backend.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._count(misses=1)
+            return default
+        self._count(hits=1)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = self.backend.get_many(keys, version=version)
+        self._count(hits=len(values), misses=len(keys) - len(values))
+        return values
+
+    def _count(self, hits=0, misses=0):
+        request_metrics = get_request_metrics()
+        if hits:
+            CACHE_HITS.labels(self.namespace).inc(hits)
+            if request_metrics is not None:
+                request_metrics.counts['cache_hits'] += hits
+        if misses:
+            CACHE_MISSES.labels(self.namespace).inc(misses)
+            if request_metrics is not None:
+                request_metrics.counts['cache_misses'] += misses
+
+
+class FileBasedCache(filebased.FileBasedCache):
+    """
+    Like Django's, but `add`, `incr` and `decr` are atomic across processes (keys are locked by a file lock),
+    so that a single server can share its cache between processes without a cache server.
+    """
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._lock(key, version):
+            return super().add(key, value, timeout=timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        with self._lock(key, version):
+            return super().incr(key, delta=delta, version=version)
+
+    def _lock(self, key, version):
+        # Keys share a few lock files, rather than leaving a lock file behind for each key
+        fname = self._key_to_file(key, version)
+        stripe = int(hashlib.md5(fname.encode()).hexdigest(), 16) % LOCK_STRIPES
+        self._createdir()
+        return _FileLock(os.path.join(self._dir, f'{stripe}.lock'))
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.file = open(self.path, 'ab')
+        locks.lock(self.file, locks.LOCK_EX)
+
+    def __exit__(self, *exc_info):
+        locks.unlock(self.file)
+        self.file.close()
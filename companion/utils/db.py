@@ -0,0 +1,106 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.connection import ConnectionProxy
+
+cache = ConnectionProxy(caches, 'db_router')
+
+_use_replicas = ContextVar('use_replicas', default=False)
+
+
+class ReplicaRouter:
+    """
+    Inside `read_from_replicas()` (e.g. safe-method requests, see `ReplicaMiddleware`),
+    reads go to a random replica of `DATABASE_REPLICAS`. Other reads, and all writes, go to the primary database.
+    """
+    def db_for_read(self, model, **hints):
+        if _use_replicas.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        # Even for relations of instances read from a replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Even for instances read from a replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary database
+        return True
+
+
+@contextmanager
+def read_from_replicas():
+    """
+    Send reads to replicas, which may lag behind the primary database:
+    only for code which doesn't need to see the latest writes (e.g. reporting tasks).
+    Also usable as a decorator.
+    """
+    token = _use_replicas.set(True)
+    try:
+        yield
+    finally:
+        _use_replicas.reset(token)
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Send reads to the primary database, even inside `read_from_replicas()`:
+    for code which must see the latest writes.
+    Also usable as a decorator.
+    """
+    token = _use_replicas.set(False)
+    try:
+        yield
+    finally:
+        _use_replicas.reset(token)
+
+
+def mark_user_wrote(user_id):
+    """
+    `user_id` has just written, they must read from the primary database for `DATABASE_REPLICA_STICKY_SECONDS`.
+    """
+    if settings.DATABASE_REPLICAS:
+        cache.set(f'wrote:{user_id}', True, timeout=settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+
+def user_wrote_recently(user_id):
+    return bool(settings.DATABASE_REPLICAS) and cache.get(f'wrote:{user_id}', False)
+
+
+def close_unusable_connections():
+    """
+    Close persistent DB connections (see `CONN_MAX_AGE`) which can no longer be used,
+    e.g. the DB server restarted or dropped them after being idle (MySQL's `wait_timeout`),
+    so that they are reopened instead of failing the next query.
+
+    Only for databases with `CONN_HEALTH_CHECKS`: a check costs a round trip to the DB server.
+    Django only checks connections after errors, `CONN_HEALTH_CHECKS` is only supported natively since Django 4.1.
+    """
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        if not connection.settings_dict.get('CONN_HEALTH_CHECKS'):
+            continue
+        if not connection.is_usable():
+            connection.close()
+
+
+def delete_in_batches(queryset, batch_size):
+    """
+    Delete rows of `queryset`, `batch_size` rows at a time so that each DELETE only holds locks briefly.
+    Return number of deleted rows.
+    """
+    model = queryset.model
+    deleted_count = 0
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        count, _deleted = model._default_manager.filter(pk__in=pks).delete()
+        deleted_count += count
+    return deleted_count
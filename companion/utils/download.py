@@ -0,0 +1,28 @@
+from io import BytesIO
+
+import requests
+from django.core.files.base import File
+
+CHUNK_SIZE = 64 * 2 ** 10
+
+
+class DownloadTooLarge(Exception):
+    pass
+
+
+def download(url, name, max_size, timeout):
+    """
+    Download `url` in memory (as `File` named `name`), chunk by chunk,
+    stopping as soon as it exceeds `max_size` bytes (raise `DownloadTooLarge`).
+    Raise `requests.RequestException` if download fails.
+    """
+    buffer = BytesIO()
+    with requests.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(CHUNK_SIZE):
+            if buffer.tell() + len(chunk) > max_size:
+                raise DownloadTooLarge(url)
+            buffer.write(chunk)
+
+    buffer.seek(0)
+    return File(buffer, name=name)
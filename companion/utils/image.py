@@ -0,0 +1,96 @@
+from io import BytesIO
+
+from django.core.exceptions import ValidationError
+from django.core.files.images import ImageFile
+from django.utils.translation import gettext_lazy as _
+from PIL import Image, ImageOps
+
+# Formats Pillow can read but not write, and what to write instead (others fall back, see `get_save_format`)
+SAVE_FORMATS = {
+    'MPO': 'JPEG',  # Multi-picture JPEG of some cameras, the first picture is the JPEG image
+}
+JPEG_MODES = ['1', 'L', 'RGB', 'CMYK']
+
+
+def validate_image_header(file, formats, max_pixels):
+    """
+    Check format and dimensions of image `file` by reading its header only, pixels are not decoded.
+    Images with more than `max_pixels` pixels are rejected,
+    as decoding them would take too much memory (e.g. decompression bombs).
+    Return format of the image.
+    """
+    try:
+        with Image.open(file, formats=formats) as image:
+            image_format = image.format
+            width, height = image.size
+    except (OSError, SyntaxError, Image.DecompressionBombError):
+        raise ValidationError(
+            _('Upload a valid image. Supported formats: %(formats)s.'),
+            code='invalid_image',
+            params={'formats': ', '.join(formats)},
+        )
+    finally:
+        file.seek(0)
+
+    if width * height > max_pixels:
+        raise ValidationError(
+            _('Image is too large (%(width)sx%(height)s), it must have at most %(max_pixels)s pixels.'),
+            code='image_too_large',
+            params={'width': width, 'height': height, 'max_pixels': max_pixels},
+        )
+    return image_format
+
+
+def make_thumbnails(file, sizes, image_format=None):
+    """
+    Decode image `file` once, return a downscaled copy (as `ImageFile`) for each (width, height) in `sizes`.
+    Like `Image.thumbnail`, aspect ratio is kept and images are never enlarged.
+    Copies are saved in `image_format` (e.g. "WEBP"), or in the same format as `file` if not given
+    (or a format Pillow can write, see `get_save_format`), and named "image.<format>".
+    """
+    max_size = (
+        max(width for width, _height in sizes),
+        max(height for _width, height in sizes),
+    )
+
+    with Image.open(file) as image:
+        image_format = image_format or get_save_format(image)
+        # JPEG only: let the decoder downscale by a power of 2, much faster than decoding full size
+        image.draft(image.mode, max_size)
+        image = ImageOps.exif_transpose(image)
+        if image.mode == 'CMYK' and image_format != 'JPEG':
+            # e.g. some JPEGs from print workflows, only JPEG can be written in CMYK
+            image = image.convert('RGB')
+        elif image_format == 'JPEG' and image.mode not in JPEG_MODES:
+            # e.g. palette images of formats falling back to JPEG
+            image = image.convert('RGB')
+        elif image_format == 'PNG' and image.mode == 'PA':
+            image = image.convert('RGBA')
+
+        thumbnails = []
+        for width, height in sizes:
+            thumbnail = image.copy()
+            thumbnail.thumbnail((width, height))
+            thumbnails.append(_to_image_file(thumbnail, image_format))
+
+    return thumbnails
+
+
+def get_save_format(image):
+    """
+    Format to save copies of `image` in: its own format if Pillow can write it (or its closest one, see `SAVE_FORMATS`),
+    else PNG if it has transparency, JPEG otherwise (e.g. PSD, FLI, DCX).
+    """
+    image_format = SAVE_FORMATS.get(image.format, image.format)
+    Image.init()  # Register writers of all formats
+    if image_format in Image.SAVE:
+        return image_format
+    if image.mode in ['RGBA', 'LA', 'PA'] or 'transparency' in image.info:
+        return 'PNG'
+    return 'JPEG'
+
+
+def _to_image_file(image, image_format):
+    buffer = BytesIO()
+    image.save(buffer, format=image_format)
+    return ImageFile(buffer, name=f'image.{image_format.lower()}')
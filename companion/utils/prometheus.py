@@ -0,0 +1,51 @@
+import os
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                               Counter, Histogram, generate_latest,
+                               multiprocess)
+
+# With several processes (e.g. gunicorn workers, celery worker), set `PROMETHEUS_MULTIPROC_DIR` environment variable
+# to a directory shared by all of them, which must be emptied before they start:
+# each process then writes its metrics to files there, and `/metrics` aggregates them
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Latency of requests, by view (e.g. "event-settle"), method and status.',
+    ['view', 'method', 'status'],
+)
+REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries', 'Number of DB queries of sampled requests (see REQUEST_METRICS_SAMPLE_RATE), by view.',
+    ['view'],
+    buckets=[0, 1, 2, 3, 5, 10, 20, 50, 100, float('inf')],
+)
+CACHE_HITS = Counter('cache_hits', 'Cache reads which found the key, by namespace.', ['namespace'])
+CACHE_MISSES = Counter('cache_misses', 'Cache reads which did not find the key, by namespace.', ['namespace'])
+TASK_DURATION = Histogram(
+    'celery_task_duration_seconds', 'Duration of Celery tasks, by task name.',
+    ['task'],
+    buckets=[0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, float('inf')],
+)
+TASK_FAILURES = Counter('celery_task_failures', 'Celery tasks which raised an exception, by task name.', ['task'])
+
+
+def observe_request(request, response, duration, db_queries=None):
+    """
+    Record latency of a request, and its number of DB queries if they were counted (sampled requests only).
+    """
+    resolver_match = request.resolver_match
+    # Never label by path: each distinct label makes a new time series
+    view = resolver_match.view_name if resolver_match else 'unmatched'
+    REQUEST_LATENCY.labels(view, request.method, response.status_code).observe(duration)
+    if db_queries is not None:
+        REQUEST_DB_QUERIES.labels(view).observe(db_queries)
+
+
+def export():
+    """
+    Return metrics (of all processes in multiprocess mode) in Prometheus text format, and its content type.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,89 @@
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Where time of a request goes: `timings` (seconds) and `counts` by name,
+    e.g. "db" time and query count, collected by `collect()`.
+    """
+    def __init__(self):
+        self.timings = defaultdict(float)
+        self.counts = Counter()
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+
+    @contextmanager
+    def collect(self):
+        """
+        Make these the metrics of code inside this block (see `get_request_metrics`), queries of all databases included.
+        """
+        token = _current.set(self)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self._execute))
+                yield self
+        finally:
+            _current.reset(token)
+
+    def _execute(self, execute, sql, params, many, context):
+        self.counts['db'] += 1
+        with self.timer('db'):
+            return execute(sql, params, many, context)
+
+
+def get_request_metrics():
+    """
+    Return metrics being collected for current request, or None if it isn't instrumented (e.g. not sampled).
+    """
+    return _current.get()
+
+
+@contextmanager
+def timer(name):
+    """
+    Add time spent inside this block to `name` timing of current request, if it is instrumented.
+    """
+    metrics = get_request_metrics()
+    if metrics is None:
+        yield
+        return
+    with metrics.timer(name):
+        yield
+
+
+def time_serialization(serializer):
+    """
+    Add time spent in `serializer.data` (e.g. nested serializers, related objects loaded meanwhile)
+    to "serialize" timing of current request. Return `serializer`.
+    """
+    # Only the root serializer is timed: an instance attribute, nested serializers keep their method
+    to_representation = serializer.to_representation
+
+    def timed_to_representation(instance):
+        with timer('serialize'):
+            return to_representation(instance)
+
+    serializer.to_representation = timed_to_representation
+    return serializer
+
+
+class SerializationTimingMixin:
+    """
+    View mixin, serializers it makes are timed, see `time_serialization`.
+    """
+    def get_serializer(self, *args, **kwargs):
+        return time_serialization(super().get_serializer(*args, **kwargs))
@@ -0,0 +1,56 @@
+import mimetypes
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseRedirect)
+from django.utils.cache import add_never_cache_headers
+
+from companion.utils.storage import (PRIVATE_IMMUTABLE_CACHE_CONTROL,
+                                     is_content_addressed)
+
+
+def sendfile(storage, name):
+    """
+    Response with file `name` of `storage`, access to it must be checked beforehand.
+
+    Python workers don't stream the file.
+    If `storage` isn't on the local filesystem (e.g. S3), clients are redirected to a signed URL of the file,
+    which expires after `PROTECTED_MEDIA_URL_EXPIRE` seconds.
+    Otherwise its transfer is handed to the front proxy according to `PROTECTED_MEDIA_SERVER` setting:
+    - "nginx": "X-Accel-Redirect" header, to `PROTECTED_MEDIA_INTERNAL_URL` + `name`
+    - "apache": "X-Sendfile" header (also works with lighttpd), to the file's path
+    - "django": no proxy, Django streams the file (development)
+    """
+    if not _is_local(storage):
+        response = HttpResponseRedirect(storage.url(name, expire=settings.PROTECTED_MEDIA_URL_EXPIRE))
+        # The signed URL expires, the redirect must not be reused
+        add_never_cache_headers(response)
+        return response
+
+    server = settings.PROTECTED_MEDIA_SERVER
+    if server == 'nginx':
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = quote(settings.PROTECTED_MEDIA_INTERNAL_URL + name)
+    elif server == 'apache':
+        response = HttpResponse()
+        response['X-Sendfile'] = storage.path(name)
+    else:
+        try:
+            response = FileResponse(storage.open(name))
+        except FileNotFoundError:
+            raise Http404
+
+    content_type, _encoding = mimetypes.guess_type(name)
+    response['Content-Type'] = content_type or 'application/octet-stream'
+    if is_content_addressed(name):
+        response['Cache-Control'] = PRIVATE_IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def _is_local(storage):
+    try:
+        storage.path('')
+    except NotImplementedError:
+        return False
+    return True
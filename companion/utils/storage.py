@@ -0,0 +1,209 @@
+import hashlib
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage, get_storage_class
+from django.db import transaction
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+from storages.backends.s3boto3 import S3Boto3Storage
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+PRIVATE_IMMUTABLE_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+
+# "<dir>/<first 2 characters of hash>/<sha256 hash>.<ext>"
+CONTENT_ADDRESSED_NAME_PATTERN = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+class ContentAddressedStorageMixin:
+    """
+    Storage mixin, files are named by the hash of their content, in the directory given by the field's `upload_to`.
+    So identical files are only stored once, and a file never changes once written:
+    it can be cached forever by clients (see `is_content_addressed`).
+
+    As a file may be shared by many rows, never delete it directly,
+    unreferenced files are removed by `sweep_unreferenced_files` instead.
+    """
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        name = self.get_content_addressed_name(name, content)
+        if not self.exists(name):
+            try:
+                return super().save(name, content, max_length=max_length)
+            except FileExistsError:
+                # Stored meanwhile by a concurrent save of the same content
+                pass
+        # Same content already stored, make sure it isn't swept as outdated in the meantime
+        self.touch(name)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # Never add a suffix to a taken name (e.g. "<hash>_a1b2c3d.jpg"): a file of this name has the same content
+        return name
+
+    def get_content_addressed_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+
+        digest = digest.hexdigest()
+        dirname = posixpath.dirname(name.replace('\\', '/'))
+        ext = posixpath.splitext(name)[1].lower()
+        return posixpath.join(dirname, digest[:2], digest + ext)
+
+    def touch(self, name):
+        pass
+
+
+@deconstructible
+class ContentAddressedFileSystemStorage(ContentAddressedStorageMixin, FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # `_save` asks for another name when the file was created meanwhile, instead of retrying the same name forever
+        if self.exists(name):
+            raise FileExistsError(f'{name} already exists.')
+        return name
+
+    def touch(self, name):
+        os.utime(self.path(name))
+
+
+@deconstructible
+class ContentAddressedS3Storage(ContentAddressedStorageMixin, S3Boto3Storage):
+    """
+    Works with any S3-compatible service, see `AWS_S3_ENDPOINT_URL` setting.
+    """
+    cache_control = IMMUTABLE_CACHE_CONTROL
+
+    def get_object_parameters(self, name):
+        params = super().get_object_parameters(name)
+        # Even if `AWS_S3_OBJECT_PARAMETERS` sets another one, these objects never change
+        params['CacheControl'] = self.cache_control
+        return params
+
+    def touch(self, name):
+        # S3 objects can't be modified, copying the object onto itself refreshes its modification time
+        obj = self.bucket.Object(self._normalize_name(self._clean_name(name)))
+        obj.copy_from(
+            CopySource={'Bucket': self.bucket_name, 'Key': obj.key},
+            MetadataDirective='REPLACE',
+            ContentType=obj.content_type,
+            Metadata=obj.metadata,
+            **self.get_object_parameters(name),
+        )
+
+
+class PrivateS3StorageMixin:
+    """
+    S3 storage mixin, objects are stored in the private bucket (`AWS_PRIVATE_STORAGE_BUCKET_NAME` setting),
+    only readable with short-lived signed URLs, so they must only be handed out after checking access.
+    """
+    def get_default_settings(self):
+        return {
+            **super().get_default_settings(),
+            'bucket_name': settings.AWS_PRIVATE_STORAGE_BUCKET_NAME,
+            'default_acl': 'private',
+            'querystring_auth': True,
+            'custom_domain': None,  # URLs of a custom domain (e.g. a CDN) aren't signed
+        }
+
+
+@deconstructible
+class PrivateS3Storage(PrivateS3StorageMixin, S3Boto3Storage):
+    pass
+
+
+@deconstructible
+class ContentAddressedPrivateS3Storage(PrivateS3StorageMixin, ContentAddressedS3Storage):
+    cache_control = PRIVATE_IMMUTABLE_CACHE_CONTROL
+
+
+def content_addressed_storage():
+    """
+    Storage of public content addressed fields (e.g. avatars),
+    its class is given by `CONTENT_ADDRESSED_FILE_STORAGE` setting.
+    """
+    return get_storage_class(settings.CONTENT_ADDRESSED_FILE_STORAGE)()
+
+
+def private_content_addressed_storage():
+    """
+    Storage of private content addressed fields (e.g. QR codes of events),
+    its class is given by `PRIVATE_CONTENT_ADDRESSED_FILE_STORAGE` setting.
+    """
+    return get_storage_class(settings.PRIVATE_CONTENT_ADDRESSED_FILE_STORAGE)()
+
+
+def is_content_addressed(name):
+    return bool(CONTENT_ADDRESSED_NAME_PATTERN.search(name))
+
+
+def delete_if_unreferenced(model, field_name, name):
+    """
+    Delete file `name` of a content addressed field once the current DB transaction is committed,
+    unless another row still references it.
+    """
+    def delete():
+        if not model._default_manager.filter(**{field_name: name}).exists():
+            model._meta.get_field(field_name).storage.delete(name)
+
+    if name:
+        transaction.on_commit(delete)
+
+
+def sweep_unreferenced_files(model, field_name, grace_period, batch_size):
+    """
+    Delete files in the directory of `model.field_name` which no row references,
+    checking `batch_size` files at a time so that memory use doesn't depend on the number of files.
+    Files modified less than `grace_period` ago are kept, their rows may not be committed yet.
+    Return number of deleted files.
+    """
+    field = model._meta.get_field(field_name)
+    storage = field.storage
+    directory = posixpath.dirname(field.generate_filename(None, 'file'))
+    expired_time = timezone.now() - grace_period
+
+    deleted_count = 0
+    for names in _batched(_walk(storage, directory), batch_size):
+        referenced_names = set(
+            model._default_manager.filter(**{f'{field_name}__in': names})
+                                  .values_list(field_name, flat=True)
+        )
+        for name in names:
+            if name in referenced_names:
+                continue
+            if storage.get_modified_time(name) > expired_time:
+                continue
+            storage.delete(name)
+            deleted_count += 1
+    return deleted_count
+
+
+def _walk(storage, directory):
+    try:
+        dirs, files = storage.listdir(directory)
+    except FileNotFoundError:  # Nothing stored yet (S3 has no directories, it never raises)
+        return
+    for file in files:
+        yield posixpath.join(directory, file)
+    for dir_ in dirs:
+        yield from _walk(storage, posixpath.join(directory, dir_))
+
+
+def _batched(iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
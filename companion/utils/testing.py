@@ -1,6 +1,7 @@
 import shutil
 
 from django.conf import settings
+from django.test import override_settings
 from rest_framework.test import APITestCase
 
 
@@ -13,12 +14,14 @@ class MediaTestCase(APITestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
-        cls._media_root = settings.MEDIA_ROOT
         cls._temp_media_root = settings.MEDIA_ROOT / 'test_media_feel_free_to_delete'
-        settings.MEDIA_ROOT = cls._temp_media_root
+        # Unlike assigning the setting, this also resets the location cached by storages
+        cls._media_root_override = override_settings(MEDIA_ROOT=cls._temp_media_root)
+        cls._media_root_override.enable()
 
     @classmethod
     def tearDownClass(cls):
+        # Before `super()`, in reverse order of `setUpClass`, not to restore settings overridden by the subclass
+        cls._media_root_override.disable()
         super().tearDownClass()
-        settings.MEDIA_ROOT = cls._media_root
         shutil.rmtree(cls._temp_media_root, ignore_errors=True)
@@ -0,0 +1,79 @@
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+from rest_framework import throttling
+
+
+class SlidingWindowRateThrottle(throttling.SimpleRateThrottle):
+    """
+    Unlike DRF's throttles, which keep a list of request times per client and rewrite it on every request,
+    only 2 counters are kept per client (current and previous window), updated by atomic increments
+    on the shared cache, so that limits are enforced across processes.
+
+    Sliding window counter: requests of the previous window are assumed evenly spread,
+    so the number of requests in the last `duration` seconds is estimated as
+    previous count * (part of previous window still in the sliding window) + current count.
+
+    Scopes without rate (in `DEFAULT_THROTTLE_RATES`) are not throttled.
+    """
+    cache = ConnectionProxy(caches, 'throttle')
+
+    def get_rate(self):
+        return self.THROTTLE_RATES.get(self.scope)
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        self.elapsed = self.now / self.duration - window  # Part of current window elapsed
+        current_key = f'{self.key}:{window}'
+
+        # Kept for 2 windows: as current window, then as previous one
+        self.cache.add(current_key, 0, timeout=2 * self.duration)
+        try:
+            self.current_count = self.cache.incr(current_key)
+        except ValueError:  # Evicted in between
+            self.cache.set(current_key, 1, timeout=2 * self.duration)
+            self.current_count = 1
+        self.previous_count = self.cache.get(f'{self.key}:{window - 1}', 0)
+
+        if self.previous_count * (1 - self.elapsed) + self.current_count > self.num_requests:
+            # Rejected requests are not counted
+            self.cache.decr(current_key)
+            self.current_count -= 1
+            return self.throttle_failure()
+        return self.throttle_success()
+
+    def throttle_success(self):
+        return True
+
+    def wait(self):
+        """
+        Seconds until next request is allowed.
+        """
+        until_next_window = self.duration * (1 - self.elapsed)
+        if self.current_count >= self.num_requests or not self.previous_count:
+            return until_next_window
+
+        # Time for previous window's weight to drop enough to count one more request
+        wait = self.duration * (1 - self.elapsed - (self.num_requests - self.current_count - 1) / self.previous_count)
+        return min(max(wait, 0), until_next_window)
+
+
+class AnonRateThrottle(throttling.AnonRateThrottle, SlidingWindowRateThrottle):
+    pass
+
+
+class UserRateThrottle(throttling.UserRateThrottle, SlidingWindowRateThrottle):
+    pass
+
+
+class ScopedRateThrottle(throttling.ScopedRateThrottle, SlidingWindowRateThrottle):
+    """
+    Throttle views (or actions) with a `throttle_scope` attribute, by their own rate.
+    """
@@ -0,0 +1,39 @@
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = _('Uploaded file is too large.')
+    default_code = 'payload_too_large'
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Stream uploaded files to temporary files chunk by chunk (never kept in memory),
+    and stop as soon as a file exceeds `max_size` bytes.
+    """
+    def __init__(self, *args, max_size=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_size = max_size
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.max_size is not None and start + len(raw_data) > self.max_size:
+            raise PayloadTooLarge()
+        return super().receive_data_chunk(raw_data, start)
+
+
+class TemporaryFileUploadMixin:
+    """
+    ViewSet mixin, uploaded files are streamed to temporary files (see `LimitedTemporaryFileUploadHandler`).
+    """
+    def get_max_upload_size(self):
+        return None
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [
+            LimitedTemporaryFileUploadHandler(request, max_size=self.get_max_upload_size())
+        ]
+        return super().initialize_request(request, *args, **kwargs)
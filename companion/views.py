@@ -1,12 +1,40 @@
 from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.static import serve
 from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 from rest_framework.views import APIView
 
+from companion.utils import prometheus
+from companion.utils.storage import IMMUTABLE_CACHE_CONTROL, is_content_addressed
+
 from . import root_endpoints
 
 
+def serve_media(request, path, **kwargs):
+    """
+    Serve media files in development.
+    Content addressed files never change, so let clients cache them forever.
+    """
+    response = serve(request, path, **kwargs)
+    if is_content_addressed(path):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def metrics(request):
+    """
+    Metrics for Prometheus, only for scrapers sending `Authorization: Bearer <METRICS_TOKEN>`.
+    """
+    expected = f'Bearer {settings.METRICS_TOKEN}'
+    if not settings.METRICS_TOKEN or not constant_time_compare(request.headers.get('Authorization', ''), expected):
+        raise Http404
+    content, content_type = prometheus.export()
+    return HttpResponse(content, content_type=content_type)
+
+
 class RootAPIView(APIView):
     permission_classes = [AllowAny]
 
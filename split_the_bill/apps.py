@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SplitTheBillConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'split_the_bill'
+
+    def ready(self):
+        from . import signals
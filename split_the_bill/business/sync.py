@@ -0,0 +1,137 @@
+import hashlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from split_the_bill.models import (Event, EventInvitation, Settlement,
+                                   Tombstone, Transaction)
+
+TOKEN_SALT = 'split_the_bill.sync'
+
+
+class SyncTokenInvalid(Exception):
+    pass
+
+
+class SyncBusiness:
+    """
+    Delta sync for offline-first clients.
+
+    The token returned by the server remembers when the client last synced,
+    and which events the user participated in at that time.
+    Next sync only returns rows created, updated (by `update_time`) or deleted (by `Tombstone`) since then,
+    minus `SYNC_OVERLAP`: rows committed late (their time is set before commit) are not missed,
+    but rows already returned by last sync may be returned again.
+
+    A full sync ("reset") is returned instead when:
+    - There is no token (first sync)
+    - The user joined or left events since last sync (their older rows must be added/removed)
+    - The token is older than tombstones are kept (`SYNC_TOMBSTONE_TTL`), so some deletions may be lost
+    """
+    def __init__(self, user):
+        self.user = user
+        self.until = timezone.now()
+        self.event_pks = list(user.events_participated.values_list('pk', flat=True))
+
+    def get_changes(self, token=None):
+        since = self.parse_token(token) if token else None
+        if since is not None:
+            since -= settings.SYNC_OVERLAP
+        deleted = self.get_deleted(since)
+
+        return {
+            'token': self.make_token(),
+            'reset': since is None,
+            'events': {
+                'updated': self.get_events(since),
+                'deleted': deleted[Event._meta.model_name],
+            },
+            'transactions': {
+                'updated': self.get_transactions(since),
+                'deleted': deleted[Transaction._meta.model_name],
+            },
+            'event_invitations': {
+                'updated': self.get_event_invitations(since),
+                'deleted': deleted[EventInvitation._meta.model_name],
+            },
+            'settlements': {
+                'updated': self.get_settlements(since),
+                'deleted': deleted[Settlement._meta.model_name],
+            },
+        }
+
+    def get_events(self, since):
+        events = Event.objects.filter(pk__in=self.event_pks)
+        return self._changed(events, since)\
+                   .select_related('creator')\
+                   .prefetch_related('members')
+
+    def get_transactions(self, since):
+        transactions = Transaction.objects.filter(event__in=self.event_pks)
+        return self._changed(transactions, since)\
+                   .select_related('from_user', 'to_user')
+
+    def get_event_invitations(self, since):
+        invitations = EventInvitation.objects.filter(Q(event__in=self.event_pks) | Q(user=self.user))
+        return self._changed(invitations, since)\
+                   .select_related('user')
+
+    def get_settlements(self, since):
+        settlements = Settlement.objects.filter(event__in=self.event_pks)
+        return self._changed(settlements, since)\
+                   .select_related('from_user', 'to_user')
+
+    def get_deleted(self, since):
+        deleted = defaultdict(list)
+        if since is None:
+            return deleted
+
+        tombstones = Tombstone.objects.filter(
+            Q(event_pk__in=self.event_pks) | Q(user_pk=self.user.pk),
+            delete_time__gt=since,
+            delete_time__lte=self.until,
+        ).values_list('model_name', 'object_pk')
+
+        for model_name, object_pk in tombstones:
+            deleted[model_name].append(object_pk)
+        return deleted
+
+    def _changed(self, queryset, since):
+        queryset = queryset.filter(update_time__lte=self.until)
+        if since is not None:
+            queryset = queryset.filter(update_time__gt=since)
+        return queryset
+
+    def make_token(self):
+        return signing.dumps(
+            {'until': self.until.isoformat(), 'events': self.events_digest},
+            salt=TOKEN_SALT,
+        )
+
+    def parse_token(self, token):
+        """
+        Return the time of last sync, or None if a full sync is needed.
+        """
+        try:
+            data = signing.loads(token, salt=TOKEN_SALT)
+            since = parse_datetime(data['until'])
+            events_digest = data['events']
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            raise SyncTokenInvalid
+
+        if since is None:
+            raise SyncTokenInvalid
+        if events_digest != self.events_digest:
+            return None
+        if since < self.until - settings.SYNC_TOMBSTONE_TTL:
+            return None
+        return since
+
+    @property
+    def events_digest(self):
+        pks = ','.join(str(pk) for pk in sorted(self.event_pks))
+        return hashlib.sha256(pks.encode()).hexdigest()[:16]
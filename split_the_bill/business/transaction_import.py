@@ -0,0 +1,181 @@
+import codecs
+import csv
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.utils.functional import cached_property
+from django.utils.translation import gettext as _
+from rest_framework import serializers
+
+from split_the_bill.models import Transaction, TransactionImport
+from split_the_bill.serializers.transaction import validate_transaction_logic
+
+CSV_COLUMNS = ['transaction_type', 'from_user', 'to_user', 'amount', 'description']
+
+
+class TransactionImportBusiness:
+    """
+    Import transactions of an event from a CSV file.
+
+    The file is read row by row, so memory usage does not depend on file size:
+    1st pass validates every row (and reports progress),
+    2nd pass inserts rows in fixed-size batches inside a single DB transaction,
+    so either all rows are imported or none are.
+
+    Columns: transaction_type, from_user, to_user, amount, description
+    `from_user` and `to_user` are emails of event's members, leave empty for null.
+    """
+    batch_size = 500
+    max_errors = 50
+
+    def __init__(self, transaction_import):
+        self.transaction_import = transaction_import
+        self.event = transaction_import.event
+
+    @cached_property
+    def member_pks_by_email(self):
+        return dict(self.event.members.values_list('email', 'pk'))
+
+    def run(self, file):
+        file.seek(0)
+        errors = self.validate(file)
+        if errors:
+            self._update(status=TransactionImport.Statuses.FAIL, errors=errors)
+            return
+
+        self._update(status=TransactionImport.Statuses.IMPORTING)
+        file.seek(0)
+        try:
+            created_rows = self.create_transactions(file)
+        except serializers.ValidationError as e:
+            # Event's members changed between validating and importing
+            errors = [{'line': None, 'errors': _flatten_errors(e.detail)}]
+            self._update(status=TransactionImport.Statuses.FAIL, errors=errors)
+        else:
+            self._update(status=TransactionImport.Statuses.SUCCESS, created_rows=created_rows)
+
+    def validate(self, file):
+        self._update(status=TransactionImport.Statuses.VALIDATING, processed_rows=0)
+
+        errors = []
+        processed_rows = 0
+        try:
+            for line_number, row in self.read_rows(file):
+                try:
+                    self.parse_row(row)
+                except serializers.ValidationError as e:
+                    errors.append({'line': line_number, 'errors': _flatten_errors(e.detail)})
+                    if len(errors) >= self.max_errors:
+                        break
+
+                processed_rows += 1
+                if processed_rows % self.batch_size == 0:
+                    self._update(processed_rows=processed_rows)
+        except serializers.ValidationError as e:
+            errors.append({'line': 1, 'errors': _flatten_errors(e.detail)})
+        except (UnicodeDecodeError, csv.Error):
+            errors.append({'line': processed_rows + 1, 'errors': [_('File must be a UTF-8 encoded CSV file.')]})
+
+        self._update(processed_rows=processed_rows)
+        return errors
+
+    def create_transactions(self, file):
+        created_rows = 0
+        batch = []
+
+        with transaction.atomic():
+            for _line_number, row in self.read_rows(file):
+                batch.append(self.parse_row(row))
+                if len(batch) >= self.batch_size:
+                    Transaction.objects.bulk_create(batch)
+                    created_rows += len(batch)
+                    batch = []
+
+            if batch:
+                Transaction.objects.bulk_create(batch)
+                created_rows += len(batch)
+
+        return created_rows
+
+    def read_rows(self, file):
+        lines = codecs.iterdecode(file, 'utf-8-sig')
+        reader = csv.DictReader(lines)
+
+        missing_columns = [column for column in CSV_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing_columns:
+            raise serializers.ValidationError(
+                _('Missing columns: %s.') % ', '.join(missing_columns)
+            )
+
+        for row in reader:
+            yield reader.line_num, row
+
+    def parse_row(self, row):
+        transaction_type = self._get_value(row, 'transaction_type')
+        if transaction_type not in Transaction.Types.values:
+            valid_choices = ', '.join(f'"{choice}"' for choice in Transaction.Types.values)
+            raise serializers.ValidationError(
+                _('"%(input)s" is not a valid choice. Valid choices are %(choices)s.') % {
+                    'input': transaction_type,
+                    'choices': valid_choices,
+                }
+            )
+
+        from_user = self._get_member_pk(self._get_value(row, 'from_user'))
+        to_user = self._get_member_pk(self._get_value(row, 'to_user'))
+        if from_user and from_user == to_user:
+            raise serializers.ValidationError(
+                _("`from_user` and `to_user` must be different.")
+            )
+        validate_transaction_logic(transaction_type, from_user, to_user)
+
+        return Transaction(
+            event=self.event,
+            transaction_type=transaction_type,
+            from_user_id=from_user,
+            to_user_id=to_user,
+            amount=self._parse_amount(self._get_value(row, 'amount')),
+            description=self._get_value(row, 'description'),
+        )
+
+    def _get_member_pk(self, email):
+        if not email:
+            return None
+        try:
+            return self.member_pks_by_email[email]
+        except KeyError:
+            raise serializers.ValidationError(
+                _("`from_user` and `to_user` must be one of event's members.")
+            )
+
+    @staticmethod
+    def _parse_amount(value):
+        try:
+            amount = int(value)
+        except ValueError:
+            amount = 0
+        if amount < 1:
+            raise serializers.ValidationError(
+                _('`amount` must be a whole number greater than or equal to 1.')
+            )
+        # Like the transaction serializer, also check the DB's range of integers, so it doesn't fail on insert
+        try:
+            Transaction._meta.get_field('amount').run_validators(amount)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages)
+        return amount
+
+    @staticmethod
+    def _get_value(row, column):
+        return (row.get(column) or '').strip()
+
+    def _update(self, **fields):
+        for field, value in fields.items():
+            setattr(self.transaction_import, field, value)
+        self.transaction_import.save(update_fields=[*fields, 'update_time'])
+
+
+def _flatten_errors(detail):
+    if isinstance(detail, dict):
+        detail = [error for errors in detail.values() for error in errors]
+    return [str(error) for error in detail]
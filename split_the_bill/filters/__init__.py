@@ -2,3 +2,4 @@ from .event import EventFilter
 from .event_invitation import EventInvitationFilter
 from .settlement import SettlementFilter
 from .transaction import TransactionFilter
+from .transaction_import import TransactionImportFilter
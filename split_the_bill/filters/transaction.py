@@ -24,7 +24,8 @@ class TransactionFilter(filters.FilterSet):
     def qs(self):
         parent = super().qs
         events = self.request.user.events_participated.all()
+        # `event` is rendered as a hyperlink which only needs `event_id`,
+        # so only users are joined
         qs = parent.filter(event__in=events)\
-                   .select_related('from_user', 'to_user', 'event')\
-                   .prefetch_related('event__members')
+                   .select_related('from_user', 'to_user')
         return qs
@@ -0,0 +1,19 @@
+from django_filters import rest_framework as filters
+
+from split_the_bill.models import TransactionImport
+
+
+class TransactionImportFilter(filters.FilterSet):
+    class Meta:
+        model = TransactionImport
+        fields = {
+            'event': ['exact'],
+            'status': ['in'],
+        }
+
+    @property
+    def qs(self):
+        parent = super().qs
+        events = self.request.user.events_participated.all()
+        qs = parent.filter(event__in=events)
+        return qs
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.7 on 2026-10-19 10:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('split_the_bill', '0013_transaction_description'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+                ('update_time', models.DateTimeField(auto_now=True)),
+                ('file', models.FileField(blank=True, upload_to='split_the_bill/transaction_import/%Y/%m')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('validating', 'Validating'), ('importing', 'Importing'), ('success', 'Success'), ('fail', 'Fail')], default='pending', max_length=10)),
+                ('processed_rows', models.PositiveIntegerField(default=0)),
+                ('created_rows', models.PositiveIntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('creator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transaction_imports', to=settings.AUTH_USER_MODEL)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transaction_imports', to='split_the_bill.event')),
+            ],
+            options={
+                'ordering': ['-create_time'],
+            },
+        ),
+    ]
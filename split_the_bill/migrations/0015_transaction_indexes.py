@@ -0,0 +1,21 @@
+# Generated by Django 3.2.7 on 2026-10-19 10:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('split_the_bill', '0014_transactionimport'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['event', 'create_time'], name='transaction_event_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['event', 'transaction_type', 'amount'], name='transaction_event_type_idx'),
+        ),
+    ]
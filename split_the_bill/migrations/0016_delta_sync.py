@@ -0,0 +1,60 @@
+# Generated by Django 3.2.7 on 2026-10-19 10:29
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('split_the_bill', '0015_transaction_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(max_length=32)),
+                ('object_pk', models.BigIntegerField()),
+                ('event_pk', models.BigIntegerField(null=True)),
+                ('user_pk', models.BigIntegerField(null=True)),
+                ('delete_time', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='settlement',
+            name='create_time',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='settlement',
+            name='update_time',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='eventinvitation',
+            index=models.Index(fields=['event', 'update_time'], name='invitation_event_update_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventinvitation',
+            index=models.Index(fields=['user', 'update_time'], name='invitation_user_update_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='settlement',
+            index=models.Index(fields=['event', 'update_time'], name='settlement_event_update_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['event', 'update_time'], name='transaction_event_update_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['event_pk', 'delete_time'], name='tombstone_event_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['user_pk', 'delete_time'], name='tombstone_user_time_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.7 on 2026-10-19 10:33
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('split_the_bill', '0016_delta_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='receipt',
+            field=models.ImageField(blank=True, upload_to='split_the_bill/transaction/receipt/%Y/%m', validators=[django.core.validators.validate_image_file_extension]),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='receipt_image',
+            field=models.ImageField(blank=True, upload_to='split_the_bill/transaction/receipt_image/%Y/%m'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='receipt_thumbnail',
+            field=models.ImageField(blank=True, upload_to='split_the_bill/transaction/receipt_thumbnail/%Y/%m'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='receipt_status',
+            field=models.CharField(blank=True, choices=[('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], max_length=10),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.7 on 2026-10-19 10:49
+
+import companion.utils.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('split_the_bill', '0017_transaction_receipt'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='qr_code',
+            field=models.ImageField(storage=companion.utils.storage.content_addressed_storage, upload_to='split_the_bill/event/qr_code'),
+        ),
+    ]
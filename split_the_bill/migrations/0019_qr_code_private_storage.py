@@ -0,0 +1,19 @@
+# Generated by Django 3.2.7 on 2026-10-19 12:40
+
+import companion.utils.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('split_the_bill', '0018_content_addressed_media'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='qr_code',
+            field=models.ImageField(storage=companion.utils.storage.private_content_addressed_storage, upload_to='split_the_bill/event/qr_code'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.7 on 2026-10-19 13:05
+
+import companion.utils.storage
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('split_the_bill', '0019_qr_code_private_storage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='qr_code',
+            field=models.ImageField(db_index=True, storage=companion.utils.storage.private_content_addressed_storage, upload_to='split_the_bill/event/qr_code'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='receipt',
+            field=models.ImageField(blank=True, db_index=True, upload_to='split_the_bill/transaction/receipt/%Y/%m', validators=[django.core.validators.validate_image_file_extension]),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='receipt_image',
+            field=models.ImageField(blank=True, db_index=True, upload_to='split_the_bill/transaction/receipt_image/%Y/%m'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='receipt_thumbnail',
+            field=models.ImageField(blank=True, db_index=True, upload_to='split_the_bill/transaction/receipt_thumbnail/%Y/%m'),
+        ),
+    ]
@@ -3,3 +3,5 @@ from .event_invitation import EventInvitation
 from .group import Group
 from .settlement import Settlement
 from .transaction import Transaction
+from .transaction_import import TransactionImport
+from .tombstone import Tombstone
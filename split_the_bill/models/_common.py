@@ -1,9 +1,13 @@
 from django.db import models
 
+from split_the_bill.querysets._common import TimeStampQuerySet
+
 
 class TimeStamp(models.Model):
     create_time = models.DateTimeField(auto_now_add=True)
     update_time = models.DateTimeField(auto_now=True)
 
+    objects = TimeStampQuerySet.as_manager()
+
     class Meta:
         abstract = True
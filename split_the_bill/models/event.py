@@ -1,13 +1,15 @@
 import secrets
-import uuid
+from io import BytesIO
 
 import qrcode
-from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
 from django.db import models
 from rest_framework.generics import get_object_or_404
 from rest_framework.reverse import reverse
 
+from companion.utils.storage import (delete_if_unreferenced,
+                                     private_content_addressed_storage)
 from companion.utils.url import update_url_params
 
 from ._common import TimeStamp
@@ -21,7 +23,11 @@ class Event(TimeStamp):
     creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='events_created')
     members = models.ManyToManyField(User, related_name='events_participated')
     invited_users = models.ManyToManyField(User, through=EventInvitation, related_name='events_invited_to')
-    qr_code = models.ImageField(upload_to='split_the_bill/event/qr_code/%Y/%m')
+    qr_code = models.ImageField(
+        upload_to='split_the_bill/event/qr_code',
+        storage=private_content_addressed_storage,
+        db_index=True,  # Looked up by name when served (see `EventMediaView`)
+    )
     join_token = models.CharField(max_length=255, unique=True)
     is_settled = models.BooleanField(default=False)
 
@@ -45,25 +51,23 @@ class Event(TimeStamp):
         self.invited_users.remove(*users)
 
     def create_qr_code(self, request, reset_token=False):
+        old_qr_code = self.qr_code.name
         if reset_token:
             self.join_token = self.create_join_token()
-            self.qr_code.delete(save=False)
 
         join_url = reverse('event-join-with-qr', request=request)
         join_url = update_url_params(join_url, {'token': self.join_token})
         qr_code = qrcode.make(data=join_url)
 
-        random_img_name = uuid.uuid4().hex
-        img_name = f'{random_img_name}.png'
-        filename = self.qr_code.field.generate_filename(self, img_name)
-
-        path = settings.MEDIA_ROOT / filename
-        path.parent.mkdir(parents=True, exist_ok=True)
-        qr_code.save(path)
-
-        self.qr_code = filename
+        buffer = BytesIO()
+        qr_code.save(buffer)
+        # Files are named by their content, see `private_content_addressed_storage`
+        self.qr_code.save('qr_code.png', ContentFile(buffer.getvalue()), save=False)
         self.save()
 
+        if old_qr_code != self.qr_code.name:
+            delete_if_unreferenced(Event, 'qr_code', old_qr_code)
+
     @staticmethod
     def create_join_token():
         return secrets.token_urlsafe(nbytes=10)
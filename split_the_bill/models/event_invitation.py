@@ -18,6 +18,10 @@ class EventInvitation(TimeStamp):
 
     class Meta:
         unique_together = ['event', 'user']
+        indexes = [
+            models.Index(fields=['event', 'update_time'], name='invitation_event_update_idx'),
+            models.Index(fields=['user', 'update_time'], name='invitation_user_update_idx'),
+        ]
 
     def is_pending(self):
         return self.status == self.Statuses.PENDING
@@ -2,12 +2,13 @@ from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.db import models
 
+from ._common import TimeStamp
 from .event import Event
 
 User = get_user_model()
 
 
-class Settlement(models.Model):
+class Settlement(TimeStamp):
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='settlements')
     is_paid = models.BooleanField(default=False)
     from_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='settlements_to_pay')
@@ -16,6 +17,9 @@ class Settlement(models.Model):
 
     class Meta:
         ordering = ['event', 'amount']
+        indexes = [
+            models.Index(fields=['event', 'update_time'], name='settlement_event_update_idx'),
+        ]
 
     @classmethod
     def create_from_cashflows(cls, event, cashflows):
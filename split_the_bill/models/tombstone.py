@@ -0,0 +1,31 @@
+from django.db import models
+
+
+class Tombstone(models.Model):
+    """
+    Record of a deleted row, so that clients doing delta sync can delete it too.
+    Plain integer columns (instead of foreign keys) are used because referenced rows may be deleted as well.
+    """
+    model_name = models.CharField(max_length=32)
+    object_pk = models.BigIntegerField()
+    event_pk = models.BigIntegerField(null=True)
+    user_pk = models.BigIntegerField(null=True)
+    delete_time = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['event_pk', 'delete_time'], name='tombstone_event_time_idx'),
+            models.Index(fields=['user_pk', 'delete_time'], name='tombstone_user_time_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.model_name} {self.object_pk} | {self.delete_time}'
+
+    @classmethod
+    def create_for(cls, instance, event_pk=None, user_pk=None):
+        return cls.objects.create(
+            model_name=instance._meta.model_name,
+            object_pk=instance.pk,
+            event_pk=event_pk,
+            user_pk=user_pk,
+        )
@@ -1,8 +1,15 @@
+import uuid
+from pathlib import Path
+
 from django.contrib.auth import get_user_model
-from django.core.validators import MinValueValidator
+from django.core.validators import (MinValueValidator,
+                                    validate_image_file_extension)
 from django.db import models
 from django.db.models.enums import TextChoices
+from django.utils import timezone
+from PIL import Image
 
+from companion.utils.image import make_thumbnails
 from split_the_bill.querysets.transaction import TransactionQuerySet
 
 from ._common import TimeStamp
@@ -10,6 +17,11 @@ from .event import Event
 
 User = get_user_model()
 
+RECEIPT_IMAGE_WIDTH = 1280
+RECEIPT_IMAGE_HEIGHT = 1280
+RECEIPT_THUMBNAIL_WIDTH = 128
+RECEIPT_THUMBNAIL_HEIGHT = 128
+
 
 class Transaction(TimeStamp):
     class Types(TextChoices):
@@ -19,17 +31,45 @@ class Transaction(TimeStamp):
         USER_EXPENSE = 'user_expense'
         FUND_EXPENSE = 'fund_expense'
 
+    class ReceiptStatuses(TextChoices):
+        PROCESSING = 'processing'
+        READY = 'ready'
+        FAILED = 'failed'  # Receipt can't be decoded, downscaled versions will never be made
+
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='transactions')
     from_user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, related_name='transactions_paid')
     to_user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, related_name='transactions_received')
     transaction_type = models.CharField(max_length=12, choices=Types.choices)
     amount = models.PositiveIntegerField(validators=[MinValueValidator(1)])
     description = models.TextField(blank=True)
+    # Photo as uploaded, downscaled versions are made in background (see `make_receipt_thumbnails`).
+    # Indexed, files are looked up by name when served (see `EventMediaView`)
+    receipt = models.ImageField(
+        upload_to='split_the_bill/transaction/receipt/%Y/%m',
+        blank=True,
+        db_index=True,
+        validators=[validate_image_file_extension],
+    )
+    receipt_image = models.ImageField(
+        upload_to='split_the_bill/transaction/receipt_image/%Y/%m', blank=True, db_index=True,
+    )
+    receipt_thumbnail = models.ImageField(
+        upload_to='split_the_bill/transaction/receipt_thumbnail/%Y/%m', blank=True, db_index=True,
+    )
+    receipt_status = models.CharField(max_length=10, choices=ReceiptStatuses.choices, blank=True)  # Blank without receipt
 
     objects = TransactionQuerySet.as_manager()
 
     class Meta:
         ordering = ['-create_time']
+        indexes = [
+            # Listing transactions of an event, newest first
+            models.Index(fields=['event', 'create_time'], name='transaction_event_time_idx'),
+            # Sum of `amount` by `transaction_type` of an event (covering index, no table lookup)
+            models.Index(fields=['event', 'transaction_type', 'amount'], name='transaction_event_type_idx'),
+            # Delta sync
+            models.Index(fields=['event', 'update_time'], name='transaction_event_update_idx'),
+        ]
 
     def __str__(self):
         return (f'From {self.from_user} | To {self.to_user} | '
@@ -41,3 +81,67 @@ class Transaction(TimeStamp):
             cls._meta.get_field('event').attname: event_pk
         }
         return cls.objects.filter(**condition)
+
+    def set_receipt(self, receipt):
+        """
+        Store the uploaded photo as is, downscaled versions are removed until remade.
+        """
+        self.delete_receipt_files()
+        # Random name, so that an outdated receipt is never mistaken for the new one
+        receipt.name = uuid.uuid4().hex + Path(receipt.name).suffix.lower()
+        self.receipt = receipt
+        self.receipt_status = self.ReceiptStatuses.PROCESSING
+        self.save()
+
+    def delete_receipt(self):
+        self.delete_receipt_files()
+        self.receipt_status = ''
+        self.save()
+
+    def make_receipt_thumbnails(self):
+        """
+        Make downscaled versions of `receipt`, or mark it as failed if it can't be decoded.
+        Return False if receipt was changed or removed meanwhile (in which case nothing is saved), or failed.
+        """
+        if not self.receipt:
+            return False
+
+        receipt_name = self.receipt.name
+        try:
+            with self.receipt.open('rb') as f:
+                image, thumbnail = make_thumbnails(f, [
+                    (RECEIPT_IMAGE_WIDTH, RECEIPT_IMAGE_HEIGHT),
+                    (RECEIPT_THUMBNAIL_WIDTH, RECEIPT_THUMBNAIL_HEIGHT),
+                ])
+        except FileNotFoundError:
+            return False
+        except (OSError, SyntaxError, Image.DecompressionBombError):
+            # Not an image Pillow can decode or encode, although it passed validation on upload
+            self.receipt_status = self.ReceiptStatuses.FAILED
+            Transaction.objects.filter(pk=self.pk, receipt=receipt_name).update(receipt_status=self.receipt_status)
+            return False
+
+        # Named after the format they were written in, which may differ from the upload's (see `make_thumbnails`)
+        img_name = Path(receipt_name).stem + Path(image.name).suffix
+        self.receipt_image.save(img_name, image, save=False)
+        self.receipt_thumbnail.save(img_name, thumbnail, save=False)
+        self.update_time = timezone.now()
+
+        # Conditional update, so a receipt uploaded while this one was processing is not overwritten
+        updated = Transaction.objects.filter(pk=self.pk, receipt=receipt_name).update(
+            receipt_image=self.receipt_image.name,
+            receipt_thumbnail=self.receipt_thumbnail.name,
+            receipt_status=self.ReceiptStatuses.READY,
+            update_time=self.update_time,
+        )
+        if not updated:
+            self.receipt_image.delete(save=False)
+            self.receipt_thumbnail.delete(save=False)
+            return False
+        self.receipt_status = self.ReceiptStatuses.READY
+        return True
+
+    def delete_receipt_files(self):
+        self.receipt.delete(save=False)
+        self.receipt_image.delete(save=False)
+        self.receipt_thumbnail.delete(save=False)
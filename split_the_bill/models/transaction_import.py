@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.db import models
+
+from ._common import TimeStamp
+from .event import Event
+
+User = get_user_model()
+
+
+class TransactionImport(TimeStamp):
+    class Statuses(models.TextChoices):
+        PENDING = 'pending'
+        VALIDATING = 'validating'
+        IMPORTING = 'importing'
+        SUCCESS = 'success'
+        FAIL = 'fail'
+
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='transaction_imports')
+    creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='transaction_imports')
+    file = models.FileField(upload_to='split_the_bill/transaction_import/%Y/%m', blank=True)
+    status = models.CharField(max_length=10, choices=Statuses.choices, default=Statuses.PENDING)
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_rows = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        ordering = ['-create_time']
+
+    def __str__(self):
+        return f'{self.event} | {self.status}'
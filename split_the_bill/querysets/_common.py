@@ -0,0 +1,9 @@
+from django.db import models
+from django.utils import timezone
+
+
+class TimeStampQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # `auto_now` is only applied by `save()`, delta sync needs every change to bump `update_time`
+        kwargs.setdefault('update_time', timezone.now())
+        return super().update(**kwargs)
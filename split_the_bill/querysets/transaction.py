@@ -1,9 +1,10 @@
-from django.db import models
 from django.db.models import Sum, Value as V
 from django.db.models.functions import Coalesce
 
+from ._common import TimeStampQuerySet
 
-class TransactionQuerySet(models.QuerySet):
+
+class TransactionQuerySet(TimeStampQuerySet):
     def transactions_to_fund(self):
         return self.filter(transaction_type=self.model.Types.USER_TO_FUND)
 
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from django.utils.translation import gettext as _
 
 
@@ -8,6 +9,16 @@ class PkField(serializers.IntegerField):
         super().__init__(*args, **kwargs)
 
 
+class EventMediaField(serializers.ReadOnlyField):
+    """
+    URL of an event's media file, served to members of the event only (see `EventMediaView`)
+    """
+    def to_representation(self, value):
+        if not value:
+            return None
+        return reverse('event-media', kwargs={'name': value.name}, request=self.context.get('request'))
+
+
 class CustomChoiceField(serializers.ChoiceField):
     """
     Choice field with more descriptive error message
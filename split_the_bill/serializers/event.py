@@ -7,10 +7,11 @@ from split_the_bill.models import Event, EventInvitation
 from companion.utils.url import update_url_params
 from user.serializers.user import UserSerializer
 
-from ._common import PkField
+from ._common import EventMediaField, PkField
 
 
 class EventSerializer(serializers.HyperlinkedModelSerializer):
+    qr_code = EventMediaField()
     creator = UserSerializer(read_only=True)
     members = UserSerializer(many=True, read_only=True)
     transactions_url = serializers.SerializerMethodField(read_only=True)
@@ -27,7 +28,6 @@ class EventSerializer(serializers.HyperlinkedModelSerializer):
             'extra_action_urls',
         ]
         extra_kwargs = {
-            'qr_code': {'read_only': True},
             'join_token': {'read_only': True},
         }
 
@@ -59,6 +59,7 @@ class EventSerializer(serializers.HyperlinkedModelSerializer):
             'chart_info': reverse('event-chart-info', **kwargs),
             'preview_settlements': reverse('event-preview-settlements', **kwargs),
             'settle': reverse('event-settle', **kwargs),
+            'import_transactions': reverse('event-import-transactions', **kwargs),
         }
 
     def create(self, validated_data):
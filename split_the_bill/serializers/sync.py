@@ -0,0 +1,5 @@
+from rest_framework import serializers
+
+
+class SyncSerializer(serializers.Serializer):
+    token = serializers.CharField(required=False, allow_blank=True)
@@ -1,3 +1,4 @@
+from django.core.validators import validate_image_file_extension
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 from rest_framework.exceptions import NotFound, PermissionDenied
@@ -5,7 +6,53 @@ from rest_framework.exceptions import NotFound, PermissionDenied
 from split_the_bill.models import Transaction
 from user.serializers.user import UserSerializer
 
-from ._common import CustomChoiceField
+from ._common import CustomChoiceField, EventMediaField
+
+
+def validate_transaction_logic(transaction_type, from_user, to_user):
+    """
+    Check that `from_user` and `to_user` are set (or left empty) as required by `transaction_type`.
+    Users can be given as instances or as pks, only their presence matters.
+    """
+    if (
+        transaction_type == Transaction.Types.USER_TO_USER and
+        not bool(from_user and to_user)
+    ):
+        raise serializers.ValidationError(
+            _('If `transaction_type` is "user_to_user" then both `from_user` and `to_user` are required.')
+        )
+
+    elif (
+        transaction_type == Transaction.Types.USER_TO_FUND and
+        bool(not from_user or to_user)
+    ):
+        raise serializers.ValidationError(
+            _('If `transaction_type` is "user_to_fund" then `from_user` is required and `to_user` must be null.')
+        )
+
+    elif (
+        transaction_type == Transaction.Types.FUND_TO_USER and
+        bool(not to_user or from_user)
+    ):
+        raise serializers.ValidationError(
+            _('If `transaction_type` is "fund_to_user" then `to_user` is required and `from_user` must be null.')
+        )
+
+    elif (
+        transaction_type == Transaction.Types.USER_EXPENSE and
+        bool(not from_user or to_user)
+    ):
+        raise serializers.ValidationError(
+            _('If `transaction_type` is "user_expense" then `from_user` is required and `to_user` must be null.')
+        )
+
+    elif (
+        transaction_type == Transaction.Types.FUND_EXPENSE and
+        bool(from_user or to_user)
+    ):
+        raise serializers.ValidationError(
+            _('If `transaction_type` is "fund_expense" then both `from_user` and `to_user` must be null.')
+        )
 
 
 class TransactionRequestSerializer(serializers.HyperlinkedModelSerializer):
@@ -20,7 +67,12 @@ class TransactionRequestSerializer(serializers.HyperlinkedModelSerializer):
         ]
 
     def to_representation(self, transaction):
-        serializer = TransactionResponseSerializer(instance=transaction, context=self.context)
+        view = self.context.get('view')
+        if view and view.action == 'list':
+            serializer_class = TransactionResponseSerializer
+        else:
+            serializer_class = TransactionDetailResponseSerializer
+        serializer = serializer_class(instance=transaction, context=self.context)
         return serializer.data
 
     def validate_event(self, event):
@@ -65,59 +117,37 @@ class TransactionRequestSerializer(serializers.HyperlinkedModelSerializer):
             )
 
     def _validate_transaction_logic(self, attrs):
-        transaction_type = attrs['transaction_type']
-        from_user = attrs.get('from_user')
-        to_user = attrs.get('to_user')
-
-        if (
-            transaction_type == Transaction.Types.USER_TO_USER and
-            not bool(from_user and to_user)
-        ):
-            raise serializers.ValidationError(
-                _('If `transaction_type` is "user_to_user" then both `from_user` and `to_user` are required.')
-            )
-
-        elif (
-            transaction_type == Transaction.Types.USER_TO_FUND and
-            bool(not from_user or to_user)
-        ):
-            raise serializers.ValidationError(
-                _('If `transaction_type` is "user_to_fund" then `from_user` is required and `to_user` must be null.')
-            )
-
-        elif (
-            transaction_type == Transaction.Types.FUND_TO_USER and
-            bool(not to_user or from_user)
-        ):
-            raise serializers.ValidationError(
-                _('If `transaction_type` is "fund_to_user" then `to_user` is required and `from_user` must be null.')
-            )
-
-        elif (
-            transaction_type == Transaction.Types.USER_EXPENSE and
-            bool(not from_user or to_user)
-        ):
-            raise serializers.ValidationError(
-                _('If `transaction_type` is "user_expense" then `from_user` is required and `to_user` must be null.')
-            )
-
-        elif (
-            transaction_type == Transaction.Types.FUND_EXPENSE and
-            bool(from_user or to_user)
-        ):
-            raise serializers.ValidationError(
-                _('If `transaction_type` is "fund_expense" then both `from_user` and `to_user` must be null.')
-            )
+        validate_transaction_logic(
+            attrs['transaction_type'],
+            attrs.get('from_user'),
+            attrs.get('to_user'),
+        )
 
 
 class TransactionResponseSerializer(serializers.HyperlinkedModelSerializer):
     from_user = UserSerializer()
     to_user = UserSerializer()
+    receipt_thumbnail = EventMediaField()
 
     class Meta:
         model = Transaction
         fields = [
             'url', 'pk', 'event',
             'transaction_type', 'from_user', 'to_user', 'amount',
-            'description', 'create_time', 'update_time',
+            'description', 'receipt_thumbnail', 'receipt_status',
+            'create_time', 'update_time',
         ]
+
+
+class TransactionDetailResponseSerializer(TransactionResponseSerializer):
+    receipt_image = EventMediaField()
+
+    class Meta(TransactionResponseSerializer.Meta):
+        fields = TransactionResponseSerializer.Meta.fields + ['receipt_image']
+
+
+class UploadReceiptSerializer(serializers.Serializer):
+    receipt = serializers.ImageField(
+        write_only=True,
+        validators=[validate_image_file_extension],
+    )
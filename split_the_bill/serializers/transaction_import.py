@@ -0,0 +1,24 @@
+from django.core.validators import FileExtensionValidator
+from rest_framework import serializers
+
+from split_the_bill.models import TransactionImport
+
+
+class ImportTransactionsSerializer(serializers.Serializer):
+    file = serializers.FileField(
+        write_only=True,
+        validators=[FileExtensionValidator(allowed_extensions=['csv'])],
+    )
+
+
+class TransactionImportSerializer(serializers.HyperlinkedModelSerializer):
+    class Meta:
+        model = TransactionImport
+        fields = [
+            'url', 'pk', 'event', 'status',
+            'processed_rows', 'created_rows', 'errors',
+            'create_time', 'update_time',
+        ]
+        extra_kwargs = {
+            'url': {'view_name': 'transaction-import-detail'},
+        }
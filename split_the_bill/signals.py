@@ -0,0 +1,57 @@
+from django.db.models.signals import m2m_changed, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from companion.utils.storage import delete_if_unreferenced
+from split_the_bill.models import (Event, EventInvitation, Settlement,
+                                   Tombstone, Transaction)
+
+
+@receiver(post_delete, sender=Event)
+def record_event_deletion(instance, **kwargs):
+    Tombstone.create_for(instance, event_pk=instance.pk)
+
+
+@receiver(post_delete, sender=Event)
+def delete_event_qr_code(instance, **kwargs):
+    delete_if_unreferenced(Event, 'qr_code', instance.qr_code.name)
+
+
+@receiver(post_delete, sender=Transaction)
+@receiver(post_delete, sender=Settlement)
+def record_event_child_deletion(instance, **kwargs):
+    Tombstone.create_for(instance, event_pk=instance.event_id)
+
+
+@receiver(post_delete, sender=Transaction)
+def delete_transaction_receipt(instance, **kwargs):
+    instance.delete_receipt_files()
+
+
+@receiver(post_delete, sender=EventInvitation)
+def record_invitation_deletion(instance, **kwargs):
+    # Invited user is not a member of the event yet, so also address the tombstone to them
+    Tombstone.create_for(instance, event_pk=instance.event_id, user_pk=instance.user_id)
+
+
+@receiver(m2m_changed, sender=Event.members.through)
+def touch_event_on_members_changed(instance, action, reverse, pk_set, **kwargs):
+    """
+    Event's representation includes its members,
+    so let delta sync know that the event changed.
+    """
+    if action == 'pre_clear' and reverse:
+        # `pk_set` is not given when clearing, and the user's events can't be found anymore after
+        instance._cleared_event_pks = list(Event.objects.filter(members=instance).values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        event_pks = [instance.pk]
+    elif action == 'post_clear':
+        event_pks = instance.__dict__.pop('_cleared_event_pks', [])
+    else:
+        event_pks = pk_set
+
+    Event.objects.filter(pk__in=event_pks).update(update_time=timezone.now())
@@ -0,0 +1,57 @@
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from companion.utils.db import delete_in_batches
+from companion.utils.storage import sweep_unreferenced_files
+from split_the_bill.business.transaction_import import TransactionImportBusiness
+from split_the_bill.models import (Event, Tombstone, Transaction,
+                                   TransactionImport)
+
+PRUNE_BATCH_SIZE = 1000
+SWEEP_BATCH_SIZE = 1000
+
+
+@shared_task
+def import_transactions_task(transaction_import_pk):
+    return import_transactions(transaction_import_pk)
+
+def import_transactions(transaction_import_pk):
+    transaction_import = TransactionImport.objects.select_related('event')\
+                                                  .get(pk=transaction_import_pk)
+    business = TransactionImportBusiness(transaction_import)
+    with transaction_import.file.open('rb') as f:
+        business.run(f)
+
+    # Uploaded file is no longer needed once imported
+    transaction_import.file.delete(save=False)
+    transaction_import.save(update_fields=['file'])
+
+
+@shared_task
+def make_receipt_thumbnails_task(transaction_pk):
+    return make_receipt_thumbnails(transaction_pk)
+
+def make_receipt_thumbnails(transaction_pk):
+    transaction = Transaction.objects.filter(pk=transaction_pk).first()
+    if transaction is None:
+        # Deleted before being processed
+        return False
+    return transaction.make_receipt_thumbnails()
+
+
+@shared_task
+def prune_tombstones_task():
+    return prune_tombstones()
+
+def prune_tombstones(batch_size=PRUNE_BATCH_SIZE):
+    expired_time = timezone.now() - settings.SYNC_TOMBSTONE_TTL
+    return delete_in_batches(Tombstone.objects.filter(delete_time__lt=expired_time), batch_size)
+
+
+@shared_task
+def sweep_qr_code_files_task():
+    return sweep_qr_code_files()
+
+def sweep_qr_code_files(batch_size=SWEEP_BATCH_SIZE):
+    return sweep_unreferenced_files(Event, 'qr_code', settings.MEDIA_SWEEP_GRACE_PERIOD, batch_size)
@@ -0,0 +1,97 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from model_bakery import baker
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from split_the_bill.business.event import EventBusiness, SplitTheBillBusiness
+from split_the_bill.models import Event, Transaction
+
+User = get_user_model()
+
+TRANSACTION_TABLE = Transaction._meta.db_table
+
+
+class TransactionQueryPlanTestCase(APITestCase):
+    """
+    Make sure hot queries on the transaction table are served by indexes, not full table scans.
+    """
+    def setUp(self):
+        super().setUp()
+        if connection.vendor not in ('sqlite', 'mysql'):
+            self.skipTest(f'Query plan check is not implemented for {connection.vendor}.')
+
+        self.user = baker.make(User)
+        self.events = baker.make(Event, creator=self.user, _quantity=3)
+        for event in self.events:
+            event.members.add(self.user)
+            for transaction_type in Transaction.Types.values:
+                baker.make(Transaction, event=event, transaction_type=transaction_type, _quantity=3)
+
+    def test__transaction_list(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('transaction-list')
+
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, 200)
+            res = self.client.get(url, {'event': self.events[0].pk})
+            self.assertEqual(res.status_code, 200)
+
+        self.assert_no_full_scan(context.captured_queries)
+
+    def test__chart_info(self):
+        business = EventBusiness(self.events[0])
+        with CaptureQueriesContext(connection) as context:
+            business.get_total_fund()
+            business.get_total_expense()
+
+        self.assert_no_full_scan(context.captured_queries)
+
+    def test__settle(self):
+        business = SplitTheBillBusiness(self.events[0])
+        with CaptureQueriesContext(connection) as context:
+            business.get_transactions()
+
+        self.assert_no_full_scan(context.captured_queries)
+
+    def assert_no_full_scan(self, captured_queries):
+        queries = [
+            query['sql'] for query in captured_queries
+            if query['sql'].startswith('SELECT') and TRANSACTION_TABLE in query['sql']
+        ]
+        self.assertTrue(queries, 'No query on the transaction table was captured.')
+
+        for sql in queries:
+            plan = self.explain(sql)
+            self.assertFalse(
+                self.is_full_scan(plan),
+                f'Full scan on "{TRANSACTION_TABLE}".\nQuery: {sql}\nPlan:\n{plan}'
+            )
+
+    @staticmethod
+    def explain(sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                return '\n'.join(row[-1] for row in cursor.fetchall())
+            else:
+                cursor.execute(f'EXPLAIN {sql}')
+                columns = [column[0] for column in cursor.description]
+                return '\n'.join(
+                    ' '.join(f'{key}={value}' for key, value in zip(columns, row))
+                    for row in cursor.fetchall()
+                )
+
+    @staticmethod
+    def is_full_scan(plan):
+        if connection.vendor == 'sqlite':
+            # "SCAN <table>" reads every row, "SEARCH <table> USING INDEX ..." does not
+            pattern = rf'^SCAN (TABLE )?{TRANSACTION_TABLE}\b'
+        else:
+            # MySQL access type "ALL" is a full table scan
+            pattern = rf'\btable={TRANSACTION_TABLE} .*\btype=ALL\b'
+        return any(re.search(pattern, line) for line in plan.splitlines())
@@ -1,8 +1,11 @@
 import json
+import os
 import random
 from datetime import timedelta
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
 from django.utils import timezone
 from faker import Faker
 from freezegun import freeze_time
@@ -12,9 +15,12 @@ from rest_framework.reverse import reverse
 from rest_framework.test import APIRequestFactory
 
 from companion.utils.datetime import format_iso
+from companion.utils.storage import IMMUTABLE_CACHE_CONTROL
 from companion.utils.testing import MediaTestCase
 from split_the_bill.models import Event, EventInvitation
 from companion.utils.url import update_url_params
+from companion.views import serve_media
+from split_the_bill.tasks import sweep_qr_code_files
 from split_the_bill.views import EventViewSet
 
 fake = Faker()
@@ -65,7 +71,7 @@ class _EventViewSetTestCase(MediaTestCase):
             'url': reverse('event-detail', kwargs={'pk': event.pk}, request=request),
             'pk': event.pk,
             'name': event.name,
-            'qr_code': f'http://testserver{event.qr_code.url}',
+            'qr_code': reverse('event-media', kwargs={'name': event.qr_code.name}, request=request),
             'creator': self.get_user_json(event.creator, request=request),
             'members': [
                 self.get_user_json(member, request=request)
@@ -84,6 +90,7 @@ class _EventViewSetTestCase(MediaTestCase):
                 'chart_info': reverse('event-chart-info', kwargs={'pk': event.pk}, request=request),
                 'preview_settlements': reverse('event-preview-settlements', kwargs={'pk': event.pk}, request=request),
                 'settle': reverse('event-settle', kwargs={'pk': event.pk}, request=request),
+                'import_transactions': reverse('event-import-transactions', kwargs={'pk': event.pk}, request=request),
             },
         }
 
@@ -145,6 +152,21 @@ class EventReadTestCase(_EventViewSetTestCase):
 
         self.assertJSONEqual(expected, actual)
 
+    def test__qr_code_is_cached_forever(self):
+        qr_code = self.event1.qr_code
+        request = APIRequestFactory().get(qr_code.url)
+        res = serve_media(request, qr_code.name, document_root=qr_code.storage.location)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+
+    def test__same_qr_code_is_stored_once(self):
+        qr_code = self.event1.qr_code.name
+        self.event1.create_qr_code(APIRequestFactory().get(''))
+        self.assertEqual(self.event1.qr_code.name, qr_code)
+
+        self.event1.create_qr_code(APIRequestFactory().get(''), reset_token=True)
+        self.assertNotEqual(self.event1.qr_code.name, qr_code)
+
     @parameterized.expand([
         [1],
         [2],
@@ -372,6 +394,32 @@ class EventDeleteTestCase(_EventViewSetTestCase):
         self.assertEqual(res.status_code, 204)
         self.assertFalse(Event.objects.filter(pk=self.event1.pk).exists())
 
+    def test__delete__qr_code_is_removed(self):
+        self.client.force_authenticate(user=self.creator)
+        storage = self.event1.qr_code.storage
+        qr_code = self.event1.qr_code.name
+        self.assertTrue(storage.exists(qr_code))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.delete(f'{URL}{self.event1.pk}/')
+        self.assertEqual(res.status_code, 204)
+        self.assertFalse(storage.exists(qr_code))
+        self.assertTrue(storage.exists(self.event2.qr_code.name))
+
+    def test__sweep_unreferenced_qr_codes(self):
+        storage = self.event1.qr_code.storage
+        unreferenced = storage.save('split_the_bill/event/qr_code/qr_code.png', ContentFile(b'unreferenced'))
+        recent = storage.save('split_the_bill/event/qr_code/qr_code.png', ContentFile(b'recent'))
+        expired_time = (timezone.now() - settings.MEDIA_SWEEP_GRACE_PERIOD - timedelta(minutes=1)).timestamp()
+        os.utime(storage.path(unreferenced), (expired_time, expired_time))
+
+        self.assertEqual(sweep_qr_code_files(), 1)
+
+        self.assertFalse(storage.exists(unreferenced))
+        self.assertTrue(storage.exists(recent))
+        self.assertTrue(storage.exists(self.event1.qr_code.name))
+        self.assertTrue(storage.exists(self.event2.qr_code.name))
+
     def test__delete_permission(self):
         """
         Only creator can delete event
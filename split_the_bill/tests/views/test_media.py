@@ -0,0 +1,134 @@
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from model_bakery import baker
+from moto import mock_s3
+from PIL import Image
+from rest_framework.reverse import reverse
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from companion.utils.sendfile import sendfile
+from companion.utils.storage import (PRIVATE_IMMUTABLE_CACHE_CONTROL,
+                                     ContentAddressedPrivateS3Storage)
+from companion.utils.testing import MediaTestCase
+from split_the_bill.models import Event, Transaction
+from split_the_bill.tasks import make_receipt_thumbnails
+
+User = get_user_model()
+
+
+class EventMediaTestCase(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.member = baker.make(User)
+        self.other_user = baker.make(User)
+        self.event = baker.make(Event, creator=self.member)
+        self.event.members.add(self.member)
+        self.event.create_qr_code(APIRequestFactory().get(''))
+
+        self.transaction = baker.make(Transaction, event=self.event, transaction_type=Transaction.Types.FUND_EXPENSE)
+        buffer = BytesIO()
+        Image.new('RGB', (200, 100), color='white').save(buffer, format='JPEG')
+        self.transaction.set_receipt(SimpleUploadedFile('receipt.jpg', buffer.getvalue()))
+        make_receipt_thumbnails(self.transaction.pk)
+        self.transaction.refresh_from_db()
+
+    @staticmethod
+    def get_url(file):
+        return reverse('event-media', kwargs={'name': file.name})
+
+    def test__get(self):
+        self.client.force_authenticate(user=self.member)
+        qr_code = self.event.qr_code
+
+        res = self.client.get(self.get_url(qr_code))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['Content-Type'], 'image/png')
+        self.assertEqual(res['Cache-Control'], PRIVATE_IMMUTABLE_CACHE_CONTROL)
+        with qr_code.open('rb') as f:
+            self.assertEqual(b''.join(res.streaming_content), f.read())
+
+        for file in [self.transaction.receipt, self.transaction.receipt_image, self.transaction.receipt_thumbnail]:
+            # Only the field of the file is looked up, found by its directory
+            with self.assertNumQueries(1):
+                res = self.client.get(self.get_url(file))
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res['Content-Type'], 'image/jpeg')
+
+    @override_settings(PROTECTED_MEDIA_SERVER='nginx', PROTECTED_MEDIA_INTERNAL_URL='/protected-media/')
+    def test__get__nginx(self):
+        self.client.force_authenticate(user=self.member)
+        res = self.client.get(self.get_url(self.event.qr_code))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['X-Accel-Redirect'], f'/protected-media/{self.event.qr_code.name}')
+        self.assertEqual(res['Content-Type'], 'image/png')
+        self.assertEqual(res.content, b'')
+
+    @override_settings(PROTECTED_MEDIA_SERVER='apache')
+    def test__get__apache(self):
+        self.client.force_authenticate(user=self.member)
+        res = self.client.get(self.get_url(self.transaction.receipt))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['X-Sendfile'], self.transaction.receipt.path)
+        self.assertEqual(res.content, b'')
+
+    def test__get_permission(self):
+        url = self.get_url(self.event.qr_code)
+
+        # Unauthenticated user cannot access
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, 401)
+
+        # Only members of the event can access
+        self.client.force_authenticate(user=self.other_user)
+        for file in [self.event.qr_code, self.transaction.receipt, self.transaction.receipt_thumbnail]:
+            res = self.client.get(self.get_url(file))
+            self.assertEqual(res.status_code, 404)
+
+        # Only files of events can be accessed
+        self.client.force_authenticate(user=self.member)
+        res = self.client.get(reverse('event-media', kwargs={'name': '../db.sqlite3'}))
+        self.assertEqual(res.status_code, 404)
+
+
+@override_settings(AWS_PRIVATE_STORAGE_BUCKET_NAME='companion-test-private', AWS_QUERYSTRING_AUTH=False)
+class PrivateS3StorageTestCase(APITestCase):
+    """
+    Media of events stored in a S3-compatible service, `moto` stands in for it.
+    """
+    def setUp(self):
+        s3 = mock_s3()
+        s3.start()
+        self.addCleanup(s3.stop)
+
+        self.storage = ContentAddressedPrivateS3Storage(access_key='test', secret_key='test', region_name='us-east-1')
+        self.client_s3 = self.storage.connection.meta.client
+        self.client_s3.create_bucket(Bucket='companion-test-private')
+
+    def test__objects_are_private(self):
+        name = self.storage.save('split_the_bill/event/qr_code/qr_code.png', ContentFile(b'qr code'))
+
+        obj = self.client_s3.head_object(Bucket='companion-test-private', Key=name)
+        self.assertEqual(obj['CacheControl'], PRIVATE_IMMUTABLE_CACHE_CONTROL)
+
+        grants = self.client_s3.get_object_acl(Bucket='companion-test-private', Key=name)['Grants']
+        self.assertEqual([grant['Permission'] for grant in grants], ['FULL_CONTROL'])
+        self.assertNotIn('URI', grants[0]['Grantee'])  # Owner only, not a group such as AllUsers
+
+        # Signed, even though URLs of public media aren't
+        self.assertIn('Signature=', self.storage.url(name))
+
+    @override_settings(PROTECTED_MEDIA_SERVER='nginx', PROTECTED_MEDIA_URL_EXPIRE=60)
+    def test__sendfile_redirects_to_signed_url(self):
+        name = self.storage.save('split_the_bill/event/qr_code/qr_code.png', ContentFile(b'qr code'))
+
+        # Not through the proxy, it can't read the bucket
+        res = sendfile(self.storage, name)
+        self.assertEqual(res.status_code, 302)
+        self.assertIn('Signature=', res['Location'])
+        self.assertIn('Expires=', res['Location'])
+        self.assertNotIn('X-Accel-Redirect', res)
+        self.assertIn('no-store', res['Cache-Control'])
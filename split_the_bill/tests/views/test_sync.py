@@ -0,0 +1,201 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from freezegun import freeze_time
+from model_bakery import baker
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from split_the_bill.models import (Event, EventInvitation, Settlement,
+                                   Transaction)
+
+User = get_user_model()
+
+
+class _SyncTestCase(APITestCase):
+    url = reverse('sync-list')
+
+    def setUp(self):
+        super().setUp()
+        # Older than the overlap of delta syncs (see `SYNC_OVERLAP`), so that they are only returned by full syncs
+        with freeze_time(timezone.now() - settings.SYNC_OVERLAP - timedelta(seconds=1)):
+            self.make_rows()
+        self.client.force_authenticate(user=self.user)
+
+    def make_rows(self):
+        self.user = baker.make(User)
+        self.other_user = baker.make(User)
+
+        self.event = baker.make(Event, creator=self.user)
+        self.event.members.add(self.user, self.other_user)
+        self.transactions = baker.make(
+            Transaction, event=self.event,
+            transaction_type=Transaction.Types.FUND_EXPENSE, _quantity=3
+        )
+        self.settlement = baker.make(Settlement, event=self.event, from_user=self.user, to_user=self.other_user)
+
+        self.other_event = baker.make(Event, creator=self.other_user)
+        self.other_event.members.add(self.other_user)
+        baker.make(Transaction, event=self.other_event, transaction_type=Transaction.Types.FUND_EXPENSE)
+
+        self.invitation = baker.make(EventInvitation, event=self.other_event, user=self.user)
+
+    def sync(self, token=None):
+        params = {'token': token} if token else {}
+        res = self.client.get(self.url, params)
+        self.assertEqual(res.status_code, 200)
+        return res.json()
+
+    @staticmethod
+    def get_pks(data, key):
+        return sorted(item['pk'] for item in data[key]['updated'])
+
+
+class SyncTestCase(_SyncTestCase):
+    def test__first_sync(self):
+        data = self.sync()
+        self.assertTrue(data['reset'])
+        self.assertTrue(data['token'])
+        self.assertListEqual(self.get_pks(data, 'events'), [self.event.pk])
+        self.assertListEqual(self.get_pks(data, 'transactions'), sorted(t.pk for t in self.transactions))
+        self.assertListEqual(self.get_pks(data, 'settlements'), [self.settlement.pk])
+        self.assertListEqual(self.get_pks(data, 'event_invitations'), [self.invitation.pk])
+
+    def test__nothing_changed(self):
+        token = self.sync()['token']
+
+        data = self.sync(token)
+        self.assertFalse(data['reset'])
+        for key in ['events', 'transactions', 'event_invitations', 'settlements']:
+            self.assertDictEqual(data[key], {'updated': [], 'deleted': []})
+
+    def test__only_changes_are_returned(self):
+        token = self.sync()['token']
+
+        with freeze_time(timezone.now() + timedelta(seconds=1)):
+            new_transaction = baker.make(Transaction, event=self.event, transaction_type=Transaction.Types.FUND_EXPENSE)
+            updated_transaction = self.transactions[0]
+            updated_transaction.amount += 1
+            updated_transaction.save()
+            deleted_transaction_pk = self.transactions[1].pk
+            self.transactions[1].delete()
+            self.settlement.is_paid = True
+            self.settlement.save()
+            deleted_invitation_pk = self.invitation.pk
+            self.invitation.delete()
+
+        with freeze_time(timezone.now() + timedelta(seconds=2)):
+            data = self.sync(token)
+
+        self.assertFalse(data['reset'])
+        self.assertListEqual(data['events']['updated'], [])
+        self.assertListEqual(
+            self.get_pks(data, 'transactions'),
+            sorted([new_transaction.pk, updated_transaction.pk])
+        )
+        self.assertListEqual(data['transactions']['deleted'], [deleted_transaction_pk])
+        self.assertListEqual(self.get_pks(data, 'settlements'), [self.settlement.pk])
+        self.assertTrue(data['settlements']['updated'][0]['is_paid'])
+        self.assertListEqual(data['event_invitations']['deleted'], [deleted_invitation_pk])
+
+    def test__late_commits_are_returned(self):
+        # Stamped before previous sync, but committed after it
+        with freeze_time(timezone.now() - timedelta(seconds=1)):
+            late_transaction = baker.make(Transaction, event=self.event, transaction_type=Transaction.Types.FUND_EXPENSE)
+        with patch('split_the_bill.business.sync.Transaction.objects.filter', return_value=Transaction.objects.none()):
+            token = self.sync()['token']
+
+        with freeze_time(timezone.now() + timedelta(seconds=2)):
+            data = self.sync(token)
+
+        self.assertFalse(data['reset'])
+        self.assertListEqual(self.get_pks(data, 'transactions'), [late_transaction.pk])
+
+    def test__queryset_update_changes_rows(self):
+        token = self.sync()['token']
+
+        with freeze_time(timezone.now() + settings.SYNC_OVERLAP + timedelta(seconds=1)):
+            Transaction.objects.filter(pk=self.transactions[0].pk).update(amount=1)
+
+        with freeze_time(timezone.now() + settings.SYNC_OVERLAP + timedelta(seconds=2)):
+            data = self.sync(token)
+
+        self.assertListEqual(self.get_pks(data, 'transactions'), [self.transactions[0].pk])
+
+    def test__changes_of_other_events_are_not_returned(self):
+        token = self.sync()['token']
+
+        with freeze_time(timezone.now() + timedelta(seconds=1)):
+            transaction = baker.make(Transaction, event=self.other_event, transaction_type=Transaction.Types.FUND_EXPENSE)
+            transaction.delete()
+            baker.make(Transaction, event=self.other_event, transaction_type=Transaction.Types.FUND_EXPENSE)
+
+        with freeze_time(timezone.now() + timedelta(seconds=2)):
+            data = self.sync(token)
+
+        self.assertListEqual(data['transactions']['updated'], [])
+        self.assertListEqual(data['transactions']['deleted'], [])
+
+    def test__new_member_changes_event(self):
+        token = self.sync()['token']
+
+        with freeze_time(timezone.now() + timedelta(seconds=1)):
+            self.event.members.add(baker.make(User))
+
+        with freeze_time(timezone.now() + timedelta(seconds=2)):
+            data = self.sync(token)
+
+        self.assertFalse(data['reset'])
+        self.assertListEqual(self.get_pks(data, 'events'), [self.event.pk])
+        self.assertEqual(len(data['events']['updated'][0]['members']), 3)
+
+    def test__leaving_all_events_changes_them(self):
+        token = self.sync()['token']
+
+        with freeze_time(timezone.now() + timedelta(seconds=1)):
+            self.other_user.events_participated.clear()
+
+        with freeze_time(timezone.now() + timedelta(seconds=2)):
+            data = self.sync(token)
+
+        self.assertListEqual(self.get_pks(data, 'events'), [self.event.pk])
+        self.assertEqual(len(data['events']['updated'][0]['members']), 1)
+
+    def test__joining_event_resets(self):
+        token = self.sync()['token']
+
+        with freeze_time(timezone.now() + timedelta(seconds=1)):
+            self.other_event.members.add(self.user)
+
+        with freeze_time(timezone.now() + timedelta(seconds=2)):
+            data = self.sync(token)
+
+        self.assertTrue(data['reset'])
+        self.assertListEqual(self.get_pks(data, 'events'), sorted([self.event.pk, self.other_event.pk]))
+        self.assertEqual(len(data['transactions']['updated']), 4)
+
+    def test__expired_token_resets(self):
+        token = self.sync()['token']
+
+        with freeze_time(timezone.now() + settings.SYNC_TOMBSTONE_TTL + timedelta(seconds=1)):
+            data = self.sync(token)
+        self.assertTrue(data['reset'])
+
+    def test__invalid_token(self):
+        res = self.client.get(self.url, {'token': 'not-a-token'})
+        self.assertEqual(res.status_code, 400)
+        self.assertDictEqual(res.json(), {'token': ['Invalid sync token.']})
+
+    def test__warm_sync_queries(self):
+        token = self.sync()['token']
+        # Event PKs + 4 changed rows queries + tombstones
+        with self.assertNumQueries(6):
+            self.sync(token)
+
+    def test__permission(self):
+        self.client.force_authenticate(user=None)
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 401)
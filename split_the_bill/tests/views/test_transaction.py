@@ -1,18 +1,27 @@
 import json
 import random
 from datetime import timedelta
+from io import BytesIO
+from unittest.mock import patch
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.utils import timezone
 from faker import Faker
 from freezegun import freeze_time
 from model_bakery import baker
 from parameterized import parameterized
+from PIL import Image
+from PIL.JpegImagePlugin import JpegImageFile
+from PIL.PngImagePlugin import PngImageFile
 from rest_framework.reverse import reverse
 from rest_framework.test import APITestCase
 
 from split_the_bill.models import Event, Transaction
 from companion.utils.datetime import format_iso
+from companion.utils.testing import MediaTestCase
+from split_the_bill.tasks import make_receipt_thumbnails
 from split_the_bill.views import TransactionViewSet
 
 fake = Faker()
@@ -140,8 +149,8 @@ class _TransactionTestCase(APITestCase):
             'avatar_thumbnail': user.avatar_thumbnail.path if user.avatar_thumbnail else None,
         }
 
-    def get_transaction_json(self, transaction, request):
-        return {
+    def get_transaction_json(self, transaction, request, detail=True):
+        data = {
             'url': self.get_detail_url(transaction.pk, request=request),
             'pk': transaction.pk,
             'event': reverse('event-detail', kwargs={'pk': transaction.event.pk}, request=request),
@@ -150,9 +159,14 @@ class _TransactionTestCase(APITestCase):
             'to_user': self.get_user_json(transaction.to_user, request=request) if transaction.to_user else None,
             'amount': transaction.amount,
             'description': transaction.description,
+            'receipt_thumbnail': None,
+            'receipt_status': transaction.receipt_status,
             'create_time': format_iso(transaction.create_time),
             'update_time': format_iso(transaction.update_time),
         }
+        if detail:
+            data['receipt_image'] = None
+        return data
 
 
 class TransactionReadTestCase(_TransactionTestCase):
@@ -180,7 +194,7 @@ class TransactionReadTestCase(_TransactionTestCase):
 
         actual = res.json()
         expected = json.dumps(self.get_pagination_json([
-            self.get_transaction_json(transaction, res.wsgi_request)
+            self.get_transaction_json(transaction, res.wsgi_request, detail=False)
             for transaction in transactions
         ]))
 
@@ -216,6 +230,20 @@ class TransactionReadTestCase(_TransactionTestCase):
 
         self.assertJSONEqual(expected, actual)
 
+    def test__get_list_queries(self):
+        user = random.choice(self.share_members)
+        self.client.force_authenticate(user=user)
+
+        # Number of queries (count + page) does not depend on how many members events have
+        with self.assertNumQueries(2):
+            res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+
+        self.event1.members.add(*baker.make(User, _quantity=20))
+        with self.assertNumQueries(2):
+            res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+
     def test__get_list_permission(self):
         # Unauthenticated user cannot access
         self.client.force_authenticate(user=None)
@@ -472,6 +500,96 @@ class TransactionCreateTestCase(_TransactionTestCase):
         self.assertTrue(Transaction.objects.filter(amount=34658734).exists())
 
 
+class TransactionIdempotencyTestCase(_TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = random.choice(self.event1.members.all())
+        self.client.force_authenticate(user=self.user)
+        self.data = {
+            'event': self.get_event_detail_url(self.event1.pk),
+            'transaction_type': Transaction.Types.FUND_EXPENSE,
+            'from_user': None,
+            'to_user': None,
+            'amount': 34658734,
+        }
+
+    def test__retry_is_replayed(self):
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'retry-me'}
+        res1 = self.client.post(self.url, self.data, **headers)
+        self.assertEqual(res1.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', res1)
+
+        res2 = self.client.post(self.url, self.data, **headers)
+        self.assertEqual(res2.status_code, 201)
+        self.assertEqual(res2['Idempotent-Replayed'], 'true')
+        self.assertJSONEqual(json.dumps(res1.json()), res2.json())
+
+        self.assertEqual(Transaction.objects.filter(amount=34658734).count(), 1)
+
+    def test__without_key(self):
+        self.client.post(self.url, self.data)
+        self.client.post(self.url, self.data)
+        self.assertEqual(Transaction.objects.filter(amount=34658734).count(), 2)
+
+    def test__key_is_per_user(self):
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'same-key'}
+        self.client.post(self.url, self.data, **headers)
+
+        other_user = random.choice(self.event1.members.exclude(pk=self.user.pk))
+        self.client.force_authenticate(user=other_user)
+        res = self.client.post(self.url, self.data, **headers)
+        self.assertEqual(res.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', res)
+
+        self.assertEqual(Transaction.objects.filter(amount=34658734).count(), 2)
+
+    def test__key_reused_for_different_request(self):
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'reused'}
+        self.client.post(self.url, self.data, **headers)
+
+        self.data['amount'] = 1000
+        res = self.client.post(self.url, self.data, **headers)
+        self.assertEqual(res.status_code, 422)
+        self.assertFalse(Transaction.objects.filter(amount=1000).exists())
+
+    def test__failed_request_is_not_stored(self):
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'fix-and-retry'}
+        self.event1.settle()
+        res = self.client.post(self.url, self.data, **headers)
+        self.assertEqual(res.status_code, 403)
+
+        self.event1.is_settled = False
+        self.event1.save()
+        res = self.client.post(self.url, self.data, **headers)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(Transaction.objects.filter(amount=34658734).count(), 1)
+
+    def test__expired_key(self):
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'expire-me'}
+        self.client.post(self.url, self.data, **headers)
+
+        with freeze_time(timezone.now() + settings.IDEMPOTENCY_KEY_TTL + timedelta(seconds=1)):
+            res = self.client.post(self.url, self.data, **headers)
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(Transaction.objects.filter(amount=34658734).count(), 2)
+
+    def test__key_of_crashed_request_is_taken_over(self):
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'crash-me'}
+        # Worker dies while processing the request, the key is never released
+        with patch('companion.business.idempotency.IdempotencyKey.delete'),\
+             patch.object(TransactionViewSet, 'perform_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post(self.url, self.data, **headers)
+
+        res = self.client.post(self.url, self.data, **headers)
+        self.assertEqual(res.status_code, 409)
+
+        with freeze_time(timezone.now() + settings.IDEMPOTENCY_KEY_LEASE + timedelta(seconds=1)):
+            res = self.client.post(self.url, self.data, **headers)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(Transaction.objects.filter(amount=34658734).count(), 1)
+
+
 class TransactionUpdateTestCase(_TransactionTestCase):
     @parameterized.expand([
         ['put', Transaction.Types.USER_TO_USER, True, True],
@@ -603,3 +721,180 @@ class DeleteTransactionTestCase(_TransactionTestCase):
         res = self.client.delete(url)
         self.assertEqual(res.status_code, 204)
         self.assertFalse(Transaction.objects.filter(pk=transaction.pk).exists())
+
+
+class TransactionReceiptTestCase(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.member = baker.make(User)
+        self.event = baker.make(Event, creator=self.member)
+        self.event.members.add(self.member)
+        self.transaction = baker.make(
+            Transaction, event=self.event,
+            transaction_type=Transaction.Types.FUND_EXPENSE,
+        )
+        self.url = reverse('transaction-receipt', kwargs={'pk': self.transaction.pk})
+
+    @staticmethod
+    def make_receipt(width=2000, height=1500):
+        buffer = BytesIO()
+        Image.new('RGB', (width, height), color='white').save(buffer, format='JPEG')
+        return SimpleUploadedFile('receipt.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def upload(self, receipt):
+        return self.client.put(self.url, {'receipt': receipt}, format='multipart')
+
+    @staticmethod
+    def get_media_url(file):
+        return reverse('event-media', kwargs={'name': file.name})
+
+    @patch('split_the_bill.views.transaction.make_receipt_thumbnails_task.delay', make_receipt_thumbnails)
+    def test__upload(self):
+        self.client.force_authenticate(user=self.member)
+        res = self.upload(self.make_receipt())
+        self.assertEqual(res.status_code, 202)
+
+        self.transaction.refresh_from_db()
+        self.assertTrue(self.transaction.receipt)
+        self.assertEqual(self.transaction.receipt.width, 2000)
+        self.assertEqual(self.transaction.receipt_image.width, 1280)
+        self.assertEqual(self.transaction.receipt_image.height, 960)
+        self.assertEqual(self.transaction.receipt_thumbnail.width, 128)
+        self.assertEqual(self.transaction.receipt_thumbnail.height, 96)
+
+        # List only has thumbnail, detail also has downscaled photo, raw photo is never returned
+        res = self.client.get(reverse('transaction-list'))
+        data = res.json()['results'][0]
+        self.assertEqual(data['receipt_status'], 'ready')
+        self.assertTrue(data['receipt_thumbnail'].endswith(self.get_media_url(self.transaction.receipt_thumbnail)))
+        self.assertNotIn('receipt_image', data)
+        self.assertNotIn('receipt', data)
+
+        res = self.client.get(reverse('transaction-detail', kwargs={'pk': self.transaction.pk}))
+        data = res.json()
+        self.assertTrue(data['receipt_image'].endswith(self.get_media_url(self.transaction.receipt_image)))
+        self.assertNotIn('receipt', data)
+
+    @patch('split_the_bill.views.transaction.make_receipt_thumbnails_task.delay', make_receipt_thumbnails)
+    def test__upload_mpo(self):
+        # Pillow reads MPO (JPEG with more pictures, from some cameras) but can't write it
+        self.client.force_authenticate(user=self.member)
+        with patch.object(JpegImageFile, 'format', 'MPO'):
+            self.upload(self.make_receipt())
+
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.receipt_status, Transaction.ReceiptStatuses.READY)
+        with Image.open(self.transaction.receipt_image) as image:
+            self.assertEqual(image.format, 'JPEG')
+
+    @parameterized.expand([
+        ['RGB', 'JPEG'],
+        ['RGBA', 'PNG'],
+    ])
+    @patch('split_the_bill.views.transaction.make_receipt_thumbnails_task.delay', make_receipt_thumbnails)
+    def test__upload_unwritable_format(self, mode, expected_format):
+        # Pillow reads PSD (or e.g. FLI, DCX, CUR) but can't write it
+        buffer = BytesIO()
+        Image.new(mode, (200, 100)).save(buffer, format='PNG')
+        self.client.force_authenticate(user=self.member)
+        with patch.object(PngImageFile, 'format', 'PSD'):
+            self.upload(SimpleUploadedFile('receipt.psd', buffer.getvalue()))
+
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.receipt_status, Transaction.ReceiptStatuses.READY)
+        self.assertTrue(self.transaction.receipt_image.name.endswith(f'.{expected_format.lower()}'))
+        with Image.open(self.transaction.receipt_image) as image:
+            self.assertEqual(image.format, expected_format)
+
+    @patch('split_the_bill.views.transaction.make_receipt_thumbnails_task.delay', make_receipt_thumbnails)
+    def test__upload_undecodable(self):
+        receipt = self.make_receipt()
+        truncated = SimpleUploadedFile('receipt.jpg', receipt.read()[:1000], content_type='image/jpeg')
+
+        self.client.force_authenticate(user=self.member)
+        res = self.upload(truncated)
+        self.assertEqual(res.status_code, 202)
+
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.receipt_status, Transaction.ReceiptStatuses.FAILED)
+        self.assertFalse(self.transaction.receipt_image)
+
+        res = self.client.get(reverse('transaction-detail', kwargs={'pk': self.transaction.pk}))
+        self.assertEqual(res.json()['receipt_status'], 'failed')
+
+    @patch('split_the_bill.views.transaction.make_receipt_thumbnails_task.delay')
+    def test__idempotent_upload(self, mock_delay):
+        self.client.force_authenticate(user=self.member)
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'upload-me'}
+        res = self.client.put(self.url, {'receipt': self.make_receipt()}, format='multipart', **headers)
+        self.assertEqual(res.status_code, 202)
+
+        res = self.client.put(self.url, {'receipt': self.make_receipt()}, format='multipart', **headers)
+        self.assertEqual(res['Idempotent-Replayed'], 'true')
+
+        # Same file name, different content
+        receipt = self.make_receipt(width=1000)
+        res = self.client.put(self.url, {'receipt': receipt}, format='multipart', **headers)
+        self.assertEqual(res.status_code, 422)
+
+    @patch('split_the_bill.views.transaction.make_receipt_thumbnails_task.delay')
+    def test__upload_is_processed_in_background(self, mock_delay):
+        self.client.force_authenticate(user=self.member)
+        res = self.upload(self.make_receipt())
+        self.assertEqual(res.status_code, 202)
+        mock_delay.assert_called_once_with(self.transaction.pk)
+
+        data = res.json()
+        self.assertIsNone(data['receipt_image'])
+        self.assertIsNone(data['receipt_thumbnail'])
+        self.assertEqual(data['receipt_status'], 'processing')
+
+    @patch('split_the_bill.views.transaction.make_receipt_thumbnails_task.delay')
+    def test__receipt_changed_while_processing(self, mock_delay):
+        self.client.force_authenticate(user=self.member)
+        self.upload(self.make_receipt())
+        outdated_transaction = Transaction.objects.get(pk=self.transaction.pk)
+
+        self.upload(self.make_receipt())
+        self.assertFalse(outdated_transaction.make_receipt_thumbnails())
+
+        self.transaction.refresh_from_db()
+        self.assertFalse(self.transaction.receipt_image)
+        self.assertTrue(make_receipt_thumbnails(self.transaction.pk))
+
+    @patch('split_the_bill.views.transaction.make_receipt_thumbnails_task.delay', make_receipt_thumbnails)
+    def test__delete(self):
+        self.client.force_authenticate(user=self.member)
+        self.upload(self.make_receipt())
+        self.transaction.refresh_from_db()
+        storage = self.transaction.receipt.storage
+        names = [
+            self.transaction.receipt.name,
+            self.transaction.receipt_image.name,
+            self.transaction.receipt_thumbnail.name,
+        ]
+
+        res = self.client.delete(self.url)
+        self.assertEqual(res.status_code, 204)
+
+        self.transaction.refresh_from_db()
+        self.assertFalse(self.transaction.receipt)
+        self.assertFalse(self.transaction.receipt_image)
+        self.assertFalse(self.transaction.receipt_thumbnail)
+        for name in names:
+            self.assertFalse(storage.exists(name))
+
+    @patch('split_the_bill.views.transaction.make_receipt_thumbnails_task.delay')
+    def test__permission(self, mock_delay):
+        res = self.upload(self.make_receipt())
+        self.assertEqual(res.status_code, 401)
+
+        self.client.force_authenticate(user=baker.make(User))
+        res = self.upload(self.make_receipt())
+        self.assertEqual(res.status_code, 404)
+
+        self.event.settle()
+        self.client.force_authenticate(user=self.member)
+        res = self.upload(self.make_receipt())
+        self.assertEqual(res.status_code, 403)
+        mock_delay.assert_not_called()
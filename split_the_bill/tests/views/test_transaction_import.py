@@ -0,0 +1,150 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.test import override_settings
+from model_bakery import baker
+from rest_framework.reverse import reverse
+
+from companion.utils.testing import MediaTestCase
+from split_the_bill.models import Event, Transaction, TransactionImport
+from split_the_bill.tasks import import_transactions
+
+User = get_user_model()
+
+HEADER = 'transaction_type,from_user,to_user,amount,description\n'
+
+
+class _TransactionImportTestCase(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.creator = baker.make(User)
+        self.members = baker.make(User, _quantity=2)
+        self.event = baker.make(Event, creator=self.creator)
+        self.event.members.add(self.creator, *self.members)
+        self.url = reverse('event-import-transactions', kwargs={'pk': self.event.pk})
+
+    def post_csv(self, content):
+        file = SimpleUploadedFile('transactions.csv', content.encode(), content_type='text/csv')
+        return self.client.post(self.url, {'file': file}, format='multipart')
+
+    def get_valid_csv(self):
+        member1, member2 = self.members
+        return (
+            HEADER +
+            f'user_to_user,{member1.email},{member2.email},1000,Lunch\n'
+            f'user_to_fund,{member1.email},,20000,\n'
+            f'fund_to_user,,{member2.email},3000,\n'
+            f'user_expense,{member2.email},,4000,"Taxi, airport"\n'
+            f'fund_expense,,,5000,\n'
+        )
+
+
+class TransactionImportTestCase(_TransactionImportTestCase):
+    def test__import(self):
+        self.client.force_authenticate(user=self.creator)
+        res = self.post_csv(self.get_valid_csv())
+        self.assertEqual(res.status_code, 201)
+
+        data = res.json()
+        self.assertEqual(data['status'], TransactionImport.Statuses.SUCCESS)
+        self.assertEqual(data['processed_rows'], 5)
+        self.assertEqual(data['created_rows'], 5)
+
+        transactions = Transaction.objects.filter(event=self.event)
+        self.assertEqual(transactions.count(), 5)
+        expense = transactions.get(transaction_type=Transaction.Types.USER_EXPENSE)
+        self.assertEqual(expense.from_user, self.members[1])
+        self.assertIsNone(expense.to_user)
+        self.assertEqual(expense.amount, 4000)
+        self.assertEqual(expense.description, 'Taxi, airport')
+
+    @patch('split_the_bill.business.transaction_import.TransactionImportBusiness.batch_size', 2)
+    def test__import_in_batches(self):
+        self.client.force_authenticate(user=self.creator)
+        bulk_create = Transaction.objects.bulk_create
+        with patch.object(Transaction.objects, 'bulk_create', wraps=bulk_create) as mock_bulk_create:
+            res = self.post_csv(self.get_valid_csv())
+
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(mock_bulk_create.call_count, 3)  # 2 + 2 + 1 rows
+        self.assertEqual(Transaction.objects.filter(event=self.event).count(), 5)
+
+    def test__invalid_rows_import_nothing(self):
+        member1, member2 = self.members
+        outsider = baker.make(User)
+        content = (
+            HEADER +
+            f'user_to_user,{member1.email},{member2.email},1000,\n'
+            f'user_to_user,{member1.email},,1000,\n'
+            f'user_to_fund,{outsider.email},,1000,\n'
+            f'fund_expense,,,-5,\n'
+            f'borrow,,,5,\n'
+        )
+
+        self.client.force_authenticate(user=self.creator)
+        res = self.post_csv(content)
+        self.assertEqual(res.status_code, 400)
+
+        data = res.json()
+        self.assertEqual(data['status'], TransactionImport.Statuses.FAIL)
+        self.assertListEqual(
+            [error['line'] for error in data['errors']],
+            [3, 4, 5, 6]
+        )
+        self.assertFalse(Transaction.objects.filter(event=self.event).exists())
+
+    def test__amount_out_of_range(self):
+        # Integer range of the DB, e.g. PostgreSQL (SQLite has none)
+        amount_field = Transaction._meta.get_field('amount')
+        validators = [MinValueValidator(1), MaxValueValidator(2147483647)]
+        self.client.force_authenticate(user=self.creator)
+        with patch.object(amount_field, 'validators', validators):
+            res = self.post_csv(HEADER + 'fund_expense,,,2147483648,\n')
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(
+            res.json()['errors'],
+            [{'line': 2, 'errors': ['Ensure this value is less than or equal to 2147483647.']}]
+        )
+        self.assertFalse(Transaction.objects.filter(event=self.event).exists())
+
+    def test__missing_columns(self):
+        self.client.force_authenticate(user=self.creator)
+        res = self.post_csv('transaction_type,amount\nfund_expense,1000\n')
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(
+            res.json()['errors'],
+            [{'line': 1, 'errors': ['Missing columns: from_user, to_user, description.']}]
+        )
+
+    @override_settings(TRANSACTION_IMPORT_ASYNC_MIN_SIZE=1)
+    @patch('split_the_bill.views.event.import_transactions_task.delay', import_transactions)
+    def test__import_large_file_in_background(self):
+        self.client.force_authenticate(user=self.creator)
+        res = self.post_csv(self.get_valid_csv())
+        self.assertEqual(res.status_code, 202)
+
+        status_url = res.json()['url']
+        res = self.client.get(status_url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['status'], TransactionImport.Statuses.SUCCESS)
+        self.assertEqual(Transaction.objects.filter(event=self.event).count(), 5)
+
+        # Uploaded file is removed after importing
+        self.assertFalse(TransactionImport.objects.get().file)
+
+    def test__permission(self):
+        self.client.force_authenticate(user=self.members[0])
+        res = self.post_csv(self.get_valid_csv())
+        self.assertEqual(res.status_code, 403)
+
+        self.client.force_authenticate(user=baker.make(User))
+        res = self.post_csv(self.get_valid_csv())
+        self.assertEqual(res.status_code, 404)
+
+        self.event.settle()
+        self.client.force_authenticate(user=self.creator)
+        res = self.post_csv(self.get_valid_csv())
+        self.assertEqual(res.status_code, 403)
+        self.assertFalse(Transaction.objects.filter(event=self.event).exists())
@@ -1,3 +1,4 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
 
 from split_the_bill import views
@@ -9,7 +10,7 @@ from split_the_bill import views
 # app_name = 'split_the_bill'
 
 urlpatterns = [
-
+    path('media/<path:name>', views.EventMediaView.as_view(), name='event-media'),
 ]
 
 router = DefaultRouter()
@@ -18,5 +19,7 @@ router.register('groups', views.GroupViewSet, basename='group')
 router.register('transactions', views.TransactionViewSet, basename='transaction')
 router.register('event-invitations', views.EventInvitationViewSet, basename='event-invitation')
 router.register('settlements', views.SettlementViewSet, basename='settlement')
+router.register('transaction-imports', views.TransactionImportViewSet, basename='transaction-import')
+router.register('sync', views.SyncViewSet, basename='sync')
 
 urlpatterns.extend(router.urls)
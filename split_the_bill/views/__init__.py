@@ -1,5 +1,8 @@
 from .event import EventViewSet
 from .event_invitation import EventInvitationViewSet
 from .group import GroupViewSet
+from .media import EventMediaView
 from .settlement import SettlementViewSet
 from .transaction import TransactionViewSet
+from .transaction_import import TransactionImportViewSet
+from .sync import SyncViewSet
@@ -1,12 +1,20 @@
+from django.conf import settings
+from django.utils.translation import gettext as _
+from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
-from companion.utils.api import extra_action_urls
+from companion.utils.api import extra_action_urls, idempotent
+from companion.utils.request_metrics import SerializationTimingMixin
 from split_the_bill.business.event import EventBusiness, SplitTheBillBusiness
+from split_the_bill.business.transaction_import import \
+    TransactionImportBusiness
 from split_the_bill.filters import EventFilter
-from split_the_bill.models import Event, Settlement
+from split_the_bill.models import Event, Settlement, TransactionImport
 from split_the_bill.permissions import IsEventCreatorOrReadonly
 from split_the_bill.serializers.event import (CancelInviteMembersSerializer,
                                               ChartInfoSerializer,
@@ -17,15 +25,21 @@ from split_the_bill.serializers.event import (CancelInviteMembersSerializer,
                                               RemoveMembersSerializer,
                                               ResetQRCodeSerializer,
                                               SettleExpenseSerializer)
+from split_the_bill.serializers.transaction_import import (
+    ImportTransactionsSerializer, TransactionImportSerializer)
+from split_the_bill.tasks import import_transactions_task
 
 
 @extra_action_urls
-class EventViewSet(ModelViewSet):
+@idempotent
+class EventViewSet(SerializationTimingMixin,
+                   ModelViewSet):
     serializer_class = EventSerializer
     filterset_class = EventFilter
     permission_classes = [IsEventCreatorOrReadonly]
     ordering_fields = ['name', 'create_time', 'update_time']
     ordering = ['-create_time']
+    throttle_scope = None  # Set per action, see `ScopedRateThrottle`
 
     def get_queryset(self):
         return self.request.user.events_participated.all()
@@ -165,6 +179,7 @@ class EventViewSet(ModelViewSet):
     @action(
         methods=['POST'], detail=True, url_path='settle',
         serializer_class=SettleExpenseSerializer,
+        throttle_scope='settle',
     )
     def settle(self, request, pk):
         """
@@ -186,3 +201,49 @@ class EventViewSet(ModelViewSet):
         Settlement.create_from_cashflows(event, cash_flows)
 
         return Response()
+
+    @action(
+        methods=['POST'], detail=True, url_path='import-transactions',
+        serializer_class=ImportTransactionsSerializer,
+        parser_classes=[MultiPartParser],
+    )
+    def import_transactions(self, request, pk):
+        """
+        Import transactions from a CSV file (Content-Type = multipart/form-data).
+
+        Columns: "transaction_type", "from_user", "to_user", "amount", "description".
+        "from_user" and "to_user" are emails of event's members, leave empty for null.
+
+        Either all rows are imported, or none are (when any row is invalid).
+        Small files are imported immediately, response with HTTP 201 (or 400 with errors of each line).
+        Large files are imported in background, response with HTTP 202,
+        use "url" in the response to track progress.
+        """
+        event = self.get_object()
+        if event.is_settled:
+            raise PermissionDenied(
+                _("This event is already settled and won't accept anymore transactions.")
+            )
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        file = serializer.validated_data['file']
+
+        transaction_import = TransactionImport(event=event, creator=request.user)
+
+        if file.size >= settings.TRANSACTION_IMPORT_ASYNC_MIN_SIZE:
+            transaction_import.file = file
+            transaction_import.save()
+            import_transactions_task.delay(transaction_import.pk)
+            response_status = status.HTTP_202_ACCEPTED
+        else:
+            transaction_import.save()
+            business = TransactionImportBusiness(transaction_import)
+            business.run(file)
+            if transaction_import.status == TransactionImport.Statuses.SUCCESS:
+                response_status = status.HTTP_201_CREATED
+            else:
+                response_status = status.HTTP_400_BAD_REQUEST
+
+        serializer = TransactionImportSerializer(instance=transaction_import, context=self.get_serializer_context())
+        return Response(serializer.data, status=response_status)
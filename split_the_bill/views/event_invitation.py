@@ -1,7 +1,8 @@
 from rest_framework import mixins
 from rest_framework.viewsets import GenericViewSet
 
-from companion.utils.api import extra_action_urls
+from companion.utils.api import extra_action_urls, idempotent
+from companion.utils.request_metrics import SerializationTimingMixin
 from split_the_bill.filters import EventInvitationFilter
 from split_the_bill.models import EventInvitation
 from split_the_bill.serializers.event_invitation import \
@@ -10,7 +11,9 @@ from split_the_bill.permissions import IsEventCreatorOrReadonly
 
 
 @extra_action_urls
-class EventInvitationViewSet(mixins.ListModelMixin,
+@idempotent
+class EventInvitationViewSet(SerializationTimingMixin,
+                             mixins.ListModelMixin,
                              mixins.RetrieveModelMixin,
                              mixins.CreateModelMixin,
                              mixins.DestroyModelMixin,
@@ -1,12 +1,15 @@
 from rest_framework.viewsets import ModelViewSet
 
-from companion.utils.api import extra_action_urls
+from companion.utils.api import extra_action_urls, idempotent
+from companion.utils.request_metrics import SerializationTimingMixin
 from split_the_bill.permissions import IsGroupOwnerOrReadonly
 from split_the_bill.serializers.group import GroupSerializer
 
 
 @extra_action_urls
-class GroupViewSet(ModelViewSet):
+@idempotent
+class GroupViewSet(SerializationTimingMixin,
+                   ModelViewSet):
     serializer_class = GroupSerializer
     permission_classes = [IsGroupOwnerOrReadonly]
     ordering_fields = ['name', 'create_time', 'update_time']
@@ -0,0 +1,45 @@
+from django.http import Http404
+from rest_framework.views import APIView
+
+from companion.utils.sendfile import sendfile
+from split_the_bill.models import Event, Transaction
+
+# (model, file field, lookup from model to event)
+EVENT_MEDIA_FIELDS = [
+    (Event, 'qr_code', ''),
+    (Transaction, 'receipt_thumbnail', 'event__'),
+    (Transaction, 'receipt_image', 'event__'),
+    (Transaction, 'receipt', 'event__'),
+]
+
+
+def get_event_media_field(name):
+    """
+    Return (model, file field, lookup from model to event) of file `name`, found by its directory
+    (each field has its own `upload_to`), or None if it isn't a media file of events.
+    """
+    for model, field_name, event_lookup in EVENT_MEDIA_FIELDS:
+        upload_to = model._meta.get_field(field_name).upload_to
+        directory = upload_to.split('%', 1)[0].rstrip('/') + '/'  # Without date placeholders, e.g. "%Y/%m"
+        if name.startswith(directory):
+            return model, field_name, event_lookup
+    return None
+
+
+class EventMediaView(APIView):
+    """
+    Media of events (QR codes, receipt photos), only members of the event can get them.
+    """
+    def get(self, request, name):
+        media_field = get_event_media_field(name)
+        if media_field is None:
+            raise Http404
+
+        model, field_name, event_lookup = media_field
+        is_member = model.objects.filter(**{
+            field_name: name,
+            f'{event_lookup}members': request.user,
+        }).exists()
+        if not is_member:
+            raise Http404
+        return sendfile(model._meta.get_field(field_name).storage, name)
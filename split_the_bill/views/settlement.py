@@ -1,12 +1,16 @@
 from rest_framework import mixins
 from rest_framework.viewsets import GenericViewSet
 
+from companion.utils.api import idempotent
+from companion.utils.request_metrics import SerializationTimingMixin
 from split_the_bill.filters import SettlementFilter
 from split_the_bill.models import Settlement
 from split_the_bill.serializers.settlement import SettlementSerializer
 
 
-class SettlementViewSet(mixins.ListModelMixin,
+@idempotent
+class SettlementViewSet(SerializationTimingMixin,
+                        mixins.ListModelMixin,
                         mixins.RetrieveModelMixin,
                         mixins.UpdateModelMixin,
                         GenericViewSet):
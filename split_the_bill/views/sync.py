@@ -0,0 +1,66 @@
+from django.utils.translation import gettext as _
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.viewsets import ViewSet
+
+from companion.utils.db import read_from_primary
+from companion.utils.request_metrics import time_serialization
+from split_the_bill.business.sync import SyncBusiness, SyncTokenInvalid
+from split_the_bill.serializers.event import EventSerializer
+from split_the_bill.serializers.event_invitation import \
+    EventInvitationResponseSerializer
+from split_the_bill.serializers.settlement import SettlementSerializer
+from split_the_bill.serializers.sync import SyncSerializer
+from split_the_bill.serializers.transaction import \
+    TransactionResponseSerializer
+
+
+class SyncViewSet(ViewSet):
+    """
+    Delta sync for offline-first clients.
+
+    First sync: call without "?token=", all events, transactions, invitations and settlements
+    of the logged-in user are returned, together with a "token".
+    Next syncs: call with "?token=<token of previous sync>",
+    only rows created/updated ("updated") or deleted ("deleted", list of pks) since then are returned.
+
+    When "reset" is true, the response contains everything (like first sync),
+    client should replace all of its local data with it.
+    Otherwise, "updated" may contain rows the client already has (from the end of previous sync),
+    and "deleted" rows it already deleted.
+    """
+    changes_serializer_classes = {
+        'events': EventSerializer,
+        'transactions': TransactionResponseSerializer,
+        'event_invitations': EventInvitationResponseSerializer,
+        'settlements': SettlementSerializer,
+    }
+
+    # A lagging replica would miss changes made just before the token's time, for good
+    @read_from_primary()
+    def list(self, request):
+        serializer = SyncSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        token = serializer.validated_data.get('token')
+
+        business = SyncBusiness(request.user)
+        try:
+            changes = business.get_changes(token)
+        except SyncTokenInvalid:
+            raise serializers.ValidationError({'token': [_('Invalid sync token.')]})
+
+        context = {'request': request}
+        data = {
+            'token': changes['token'],
+            'reset': changes['reset'],
+        }
+        for key, serializer_class in self.changes_serializer_classes.items():
+            serializer = time_serialization(
+                serializer_class(instance=changes[key]['updated'], many=True, context=context)
+            )
+            data[key] = {
+                'updated': serializer.data,
+                'deleted': changes[key]['deleted'],
+            }
+
+        return Response(data)
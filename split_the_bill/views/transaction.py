@@ -1,15 +1,59 @@
+from django.utils.translation import gettext as _
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
-from companion.utils.api import extra_action_urls
+from companion.utils.api import extra_action_urls, idempotent
+from companion.utils.request_metrics import SerializationTimingMixin
 from split_the_bill.filters import TransactionFilter
 from split_the_bill.models import Transaction
-from split_the_bill.serializers.transaction import TransactionRequestSerializer
+from split_the_bill.serializers.transaction import (
+    TransactionRequestSerializer, UploadReceiptSerializer)
+from split_the_bill.tasks import make_receipt_thumbnails_task
 
 
 @extra_action_urls
-class TransactionViewSet(ModelViewSet):
+@idempotent
+class TransactionViewSet(SerializationTimingMixin,
+                         ModelViewSet):
     queryset = Transaction.objects.all()
     serializer_class = TransactionRequestSerializer
     filterset_class = TransactionFilter
     ordering_fields = ['amount', 'create_time', 'update_time']
     ordering = ['-create_time']
+
+    @action(
+        methods=['PUT', 'DELETE'], detail=True, url_path='receipt',
+        serializer_class=UploadReceiptSerializer,
+        parser_classes=[MultiPartParser],
+    )
+    def receipt(self, request, pk):
+        """
+        PUT: upload receipt photo (Content-Type = multipart/form-data), replacing the current one.
+        Photo is stored as is and response with HTTP 202,
+        "receipt_image" and "receipt_thumbnail" will be available once processed in background
+        ("receipt_status" is "ready"), or never if the photo can't be decoded ("receipt_status" is "failed").
+
+        DELETE: remove receipt photo.
+        """
+        transaction = self.get_object()
+        if transaction.event.is_settled:
+            raise PermissionDenied(
+                _("This event is already settled and won't accept anymore transactions.")
+            )
+
+        if request.method == 'DELETE':
+            transaction.delete_receipt()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        transaction.set_receipt(serializer.validated_data['receipt'])
+        make_receipt_thumbnails_task.delay(transaction.pk)
+
+        serializer = TransactionRequestSerializer(instance=transaction, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
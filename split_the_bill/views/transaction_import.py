@@ -0,0 +1,20 @@
+from rest_framework.viewsets import ReadOnlyModelViewSet
+
+from companion.utils.request_metrics import SerializationTimingMixin
+from split_the_bill.filters import TransactionImportFilter
+from split_the_bill.models import TransactionImport
+from split_the_bill.serializers.transaction_import import \
+    TransactionImportSerializer
+
+
+class TransactionImportViewSet(SerializationTimingMixin,
+                               ReadOnlyModelViewSet):
+    """
+    Track progress of transaction imports.
+    To import transactions, use the "import-transactions" action of an event.
+    """
+    queryset = TransactionImport.objects.all()
+    serializer_class = TransactionImportSerializer
+    filterset_class = TransactionImportFilter
+    ordering_fields = ['create_time', 'update_time']
+    ordering = ['-create_time']
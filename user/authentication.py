@@ -0,0 +1,114 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.connection import ConnectionProxy
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+User = get_user_model()
+
+cache = ConnectionProxy(caches, 'jwt_user')
+
+USER_CACHE_KEY = 'user:{}'
+LOCAL_CACHE_MAX_SIZE = 10000
+# Only what authentication and permission checks need (e.g. not the password hash),
+# other fields of cached users are loaded from DB when accessed.
+# Ordered like the model's fields, as `Model.from_db` expects
+CACHED_USER_FIELDS = [
+    field.attname for field in User._meta.concrete_fields
+    if field.attname in {'id', 'is_active', 'is_staff', 'is_superuser'}
+]
+
+# Process-local cache: user id -> (expire time, values of `CACHED_USER_FIELDS`)
+_local_cache = {}
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    Like `JWTAuthentication`, but users are resolved from cache instead of DB:
+    first from a process-local cache (`JWT_USER_LOCAL_CACHE_TTL`), then from the shared cache (`JWT_USER_CACHE_TTL`).
+
+    Cached users are invalidated whenever they are saved (e.g. password changed, deactivated) or deleted,
+    see `invalidate_cached_user`. Other processes may still see the old user until their local cache expires.
+    """
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        return user
+
+
+def get_cached_user(user_id):
+    """
+    Return user with `USER_ID_FIELD` = `user_id` (a new instance on each call), or None if not found.
+    Only `CACHED_USER_FIELDS` are loaded, others are deferred.
+    """
+    now = time.monotonic()
+    expire_time, values = _local_cache.get(user_id, (0, None))
+    if expire_time <= now:
+        key = USER_CACHE_KEY.format(user_id)
+        values = cache.get(key)
+        if values is None:
+            # From primary, even inside `read_from_replicas`: a lagging replica would cache an outdated user
+            values = User.objects.using(DEFAULT_DB_ALIAS).filter(
+                **{api_settings.USER_ID_FIELD: user_id}
+            ).values_list(*CACHED_USER_FIELDS).first()
+            if values is None:
+                return None
+            cache.set(key, values, timeout=settings.JWT_USER_CACHE_TTL)
+
+        if settings.JWT_USER_LOCAL_CACHE_TTL:
+            if len(_local_cache) >= LOCAL_CACHE_MAX_SIZE:
+                _local_cache.clear()
+            _local_cache[user_id] = (now + settings.JWT_USER_LOCAL_CACHE_TTL, values)
+
+    # Built each time, so that requests never share (and mutate) the same instance
+    return User.from_db(DEFAULT_DB_ALIAS, CACHED_USER_FIELDS, values)
+
+
+def invalidate_cached_user(user):
+    """
+    Remove `user` from cache, now and once current transaction is committed
+    (a request in between could cache the old row again).
+    """
+    user_id = getattr(user, api_settings.USER_ID_FIELD)
+
+    def invalidate():
+        _local_cache.pop(user_id, None)
+        cache.delete(USER_CACHE_KEY.format(user_id))
+
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+def get_token_user_id(request):
+    """
+    Return user id of the request's access token, without authenticating the user (no DB access),
+    or None if there is no valid token.
+    """
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        return None
+    raw_token = authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+    try:
+        validated_token = authentication.get_validated_token(raw_token)
+    except InvalidToken:
+        return None
+    return validated_token.get(api_settings.USER_ID_CLAIM)
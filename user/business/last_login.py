@@ -0,0 +1,77 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Case, DateTimeField, F, Max, Q, Value, When
+from django.utils import timezone
+
+from user.models import PendingLastLogin
+
+User = get_user_model()
+
+
+class LastLoginBusiness:
+    """
+    Deferred `last_login` updates, so that logins don't write hot user rows one by one.
+
+    A login only inserts a row in a log table (`PendingLastLogin`), which no other write contends with.
+    `flush` periodically reads the log in batches, updates `last_login` of each batch at once and removes it.
+    Rows committed late (e.g. by a slow transaction) are simply picked up by the next flush.
+
+    `PasswordResetTokenGenerator` hashes `last_login`, so that reset tokens are invalidated by logging in:
+    `flush_user` must be called before making or checking such tokens.
+    """
+    @staticmethod
+    def record(user, login_time=None):
+        login_time = login_time or timezone.now()
+        PendingLastLogin.objects.create(user_id=user.pk, login_time=login_time)
+
+    @staticmethod
+    def flush_user(user):
+        """
+        Write pending `last_login` of `user` now.
+        """
+        login_time = PendingLastLogin.objects.filter(user_id=user.pk).aggregate(
+            login_time=Max('login_time'),
+        )['login_time']
+        if login_time is None:
+            return
+        if _is_later(login_time, user.last_login):
+            User.objects.filter(_is_later_q(login_time), pk=user.pk).update(last_login=login_time)
+            user.last_login = login_time
+
+    @staticmethod
+    def flush(batch_size):
+        """
+        Write pending `last_login` of all users, `batch_size` logins at a time.
+        Return number of `last_login` updates.
+        """
+        updated_count = 0
+        while True:
+            logins = list(
+                PendingLastLogin.objects.order_by('pk').values_list('pk', 'user_id', 'login_time')[:batch_size]
+            )
+            if not logins:
+                return updated_count
+
+            login_times = {}
+            for _pk, user_pk, login_time in logins:
+                login_times[user_pk] = max(login_time, login_times.get(user_pk, login_time))
+
+            # A single guarded update: never set an older login time than the current one,
+            # even if `flush_user` wrote a later one meanwhile
+            is_later = Q()
+            for user_pk, login_time in login_times.items():
+                is_later |= Q(pk=user_pk) & _is_later_q(login_time)
+            updated_count += User.objects.filter(is_later).update(last_login=Case(
+                *[When(pk=user_pk, then=Value(login_time)) for user_pk, login_time in login_times.items()],
+                default=F('last_login'),
+                output_field=DateTimeField(),
+            ))
+
+            PendingLastLogin.objects.filter(pk__in=[pk for pk, _user_pk, _login_time in logins]).delete()
+
+
+def _is_later(login_time, last_login):
+    return last_login is None or last_login < login_time
+
+
+def _is_later_q(login_time):
+    return Q(last_login__isnull=True) | Q(last_login__lt=login_time)
@@ -6,6 +6,7 @@ from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 
 from companion.utils.url import update_url_params
+from user.business.last_login import LastLoginBusiness
 from user.serializers.user import EmailResetPasswordLinkTaskSerializer
 from user.tasks import send_email_reset_password_link_task
 
@@ -33,6 +34,7 @@ class ResetPasswordBusiness:
         self.user.save()
 
     def get_link(self):
+        LastLoginBusiness.flush_user(self.user)  # Token hashes `last_login`
         token = self.token_generator.make_token(self.user)
         uid = urlsafe_base64_encode(force_bytes(self.user.pk))
         url = settings.WEBSITE_RESET_PASSWORD_URL
@@ -40,6 +42,7 @@ class ResetPasswordBusiness:
         return url
 
     def check_token(self, token):
+        LastLoginBusiness.flush_user(self.user)  # Token hashes `last_login`
         is_valid = self.token_generator.check_token(self.user, token)
         if not is_valid:
             raise ResetPasswordTokenInvalid
@@ -0,0 +1,156 @@
+import hashlib
+import math
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count
+
+from user.models import (SEARCH_CACHE_VERSION_KEY, UserSearchToken,
+                         get_query_tokens, get_search_tokens, search_cache)
+
+User = get_user_model()
+
+
+class UserSearchBusiness:
+    """
+    Rank users matching a search query, for the invite-member autocomplete.
+
+    Each query's entry is cached for `USER_SEARCH_CACHE_TTL` seconds,
+    least recently used entries are evicted by the cache backend.
+    Whenever a user's search tokens change, all entries are invalidated (see `UserSearchToken.update_for`).
+
+    Besides ranked matches, an entry keeps candidates (pk, nickname, email): every user with at least
+    `min_matches` of the query's tokens, fewer than needed to match (see `get_candidate_min_matches`).
+    As users type, a query which extends a cached one is answered by narrowing down its candidates in memory,
+    without querying the DB, as long as they are sure to include all of the longer query's candidates:
+    fuzzy matching isn't monotone, a longer query may match users with few of the shorter query's tokens.
+
+    Queries with more than `max_candidates` candidates only keep the ones with most tokens,
+    such entries are not narrowed down since candidates may be missing from them.
+    """
+    max_candidates = 500
+
+    def search(self, query):
+        """
+        Return pks of matched users, best matches first.
+        """
+        query = normalize_query(query)
+        version = search_cache.get(SEARCH_CACHE_VERSION_KEY, '')
+        keys = {
+            prefix: self._make_key(version, prefix)
+            for prefix in self._get_prefixes(query)
+        }
+        entries = search_cache.get_many(keys.values())
+
+        entry = entries.get(keys[query])
+        if entry is None:
+            entry = self._narrow(query, keys, entries) or self._query(query)
+            search_cache.set(keys[query], entry, settings.USER_SEARCH_CACHE_TTL)
+
+        return entry['pks']
+
+    def rank(self, query, candidates):
+        tokens, min_matches = get_query_tokens(query)
+
+        ranked = []
+        for pk, nickname, email in candidates:
+            matches = len(tokens & get_search_tokens(nickname, email))
+            if matches < min_matches:
+                continue
+            is_prefix = nickname.lower().startswith(query) or email.lower().startswith(query)
+            ranked.append(((not is_prefix, -matches, nickname.lower(), pk), pk))
+
+        ranked.sort(key=lambda item: item[0])
+        return [pk for _key, pk in ranked]
+
+    def _narrow(self, query, keys, entries):
+        """
+        Narrow down candidates of the longest cached query that `query` starts with,
+        if they include all of `query`'s candidates.
+        """
+        tokens, min_matches = get_query_tokens(query)
+        for prefix in reversed(list(keys)):
+            entry = entries.get(keys[prefix])
+            if prefix == query or not entry or not entry['complete']:
+                continue
+
+            prefix_tokens, _prefix_min_matches = get_query_tokens(prefix)
+            if is_prefix_query(query):
+                # Users with a word starting with "ab" also have one starting with "a"
+                if not is_prefix_query(prefix) or not next(iter(tokens)).startswith(next(iter(prefix_tokens))):
+                    continue
+                candidate_min_matches = min_matches
+            else:
+                # A user with n of `query`'s tokens has at least n - (number of new tokens) of `prefix`'s
+                new_tokens = len(tokens - prefix_tokens)
+                candidate_min_matches = max(get_candidate_min_matches(query), entry['min_matches'] + new_tokens)
+                if candidate_min_matches > min_matches:
+                    continue
+
+            candidates = [
+                (pk, nickname, email) for pk, nickname, email in entry['candidates']
+                if len(tokens & get_search_tokens(nickname, email)) >= candidate_min_matches
+            ]
+            return self._make_entry(query, candidates, candidate_min_matches, complete=True)
+        return None
+
+    def _query(self, query):
+        tokens, _min_matches = get_query_tokens(query)
+        candidate_min_matches = get_candidate_min_matches(query)
+        pks = UserSearchToken.objects.filter(token__in=tokens)\
+                                     .values('user')\
+                                     .annotate(matches=Count('token'))\
+                                     .filter(matches__gte=candidate_min_matches)\
+                                     .order_by('-matches')\
+                                     .values_list('user', flat=True)
+        pks = list(pks[:self.max_candidates + 1])
+
+        candidates = User.objects.filter(pk__in=pks[:self.max_candidates])\
+                                 .values_list('pk', 'nickname', 'email')
+        return self._make_entry(
+            query, list(candidates), candidate_min_matches,
+            complete=len(pks) <= self.max_candidates,
+        )
+
+    def _make_entry(self, query, candidates, min_matches, complete):
+        return {
+            'pks': self.rank(query, candidates),
+            'candidates': candidates,
+            'min_matches': min_matches,
+            'complete': complete,
+        }
+
+    @staticmethod
+    def _get_prefixes(query):
+        """
+        Queries whose candidates may be narrowed down to `query`'s (`query` itself last).
+        """
+        return [query[:i] for i in range(1, len(query) + 1)]
+
+    @staticmethod
+    def _make_key(version, query):
+        query_hash = hashlib.sha256(query.encode()).hexdigest()
+        return f'{version}:{query_hash}'
+
+
+def normalize_query(query):
+    return ' '.join(query.lower().split())
+
+
+def get_candidate_min_matches(query):
+    """
+    How many of `query`'s tokens a user must have to be kept as a candidate of `query`:
+    half of what a match needs, so that a few more characters typed can still be narrowed down.
+    """
+    _tokens, min_matches = get_query_tokens(query)
+    if is_prefix_query(query):
+        return min_matches
+    return math.ceil(min_matches / 2)
+
+
+def is_prefix_query(query):
+    """
+    Whether `query` only matches beginning of words (no fuzzy matching).
+    """
+    tokens, _min_matches = get_query_tokens(query)
+    return all(token.startswith('^') for token in tokens)
@@ -1,9 +1,14 @@
 import django_filters
 from django.contrib.auth import get_user_model
+from django.db.models import Case, Exists, IntegerField, OuterRef, Value, When
 from django.db.models.query_utils import Q
 from django_filters import rest_framework as filters
 
+from split_the_bill.models import Event
+from user.business.user_search import UserSearchBusiness
+
 User = get_user_model()
+Membership = Event.members.through
 
 
 class UserFilter(filters.FilterSet):
@@ -20,15 +25,13 @@ class UserFilter(filters.FilterSet):
         Filter only users who participated the same events as the logged in user.
         """
         parent = super().qs
-        events = self.request.user.events_participated.all().prefetch_related('members')
-        members = []
-        for event in events:
-            members.extend(event.members.all())
-        member_pks = [member.pk for member in members]
-
-        pks = member_pks + [self.request.user.pk]
-        pks = list(set(pks))  # Make unique
-        return parent.filter(pk__in=pks)
+        user = self.request.user
+        # Single query, no matter how many events or members the logged in user has
+        events = Membership.objects.filter(user=user).values('event')
+        is_co_member = Exists(
+            Membership.objects.filter(event__in=events, user=OuterRef('pk'))
+        )
+        return parent.filter(Q(is_co_member) | Q(pk=user.pk))
 
 
 class UserSearchFilter(filters.FilterSet):
@@ -50,9 +53,21 @@ class UserSearchFilter(filters.FilterSet):
         return parent.exclude(pk=self.request.user.pk)
 
     def filter_nickname_or_email(self, queryset, name, value):
-        # TODO: fuzzy search using MATCH AGAINST?
-        condition = Q(nickname__icontains=value) | Q(email__icontains=value)
-        return queryset.filter(condition)
+        """
+        Look up the search index (see `UserSearchBusiness`), so users with typos are also found.
+        Best matches first: nickname or email starts with `value`, then most tokens in common.
+        """
+        pks = UserSearchBusiness().search(value)
+        if not pks:
+            return queryset.none()
+
+        rank = Case(
+            *[When(pk=pk, then=Value(i)) for i, pk in enumerate(pks)],
+            output_field=IntegerField(),
+        )
+        return queryset.filter(pk__in=pks)\
+                       .annotate(search_rank=rank)\
+                       .order_by('search_rank')
 
     def filter_exclude_emails(self, queryset, name, value):
         emails_to_exclude = map(str.strip, value.split(','))
@@ -0,0 +1,57 @@
+# Generated by Django 3.2.7 on 2026-10-19 10:37
+
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def get_trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def get_search_tokens(nickname, email):
+    # Frozen copy of `user.models.get_search_tokens` as of this migration
+    tokens = set()
+    for text in [nickname, email.split('@')[0]]:
+        text = text.lower()
+        tokens |= get_trigrams(text)
+        for word in re.split(r'[\W_]+', text):
+            if word:
+                tokens.add('^' + word[:1])
+                tokens.add('^' + word[:2])
+    return tokens
+
+
+def index_users(apps, schema_editor):
+    User = apps.get_model('user', 'User')
+    UserSearchToken = apps.get_model('user', 'UserSearchToken')
+
+    for user in User.objects.only('nickname', 'email').iterator():
+        UserSearchToken.objects.bulk_create([
+            UserSearchToken(user=user, token=token)
+            for token in get_search_tokens(user.nickname, user.email)
+        ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0012_auto_20220103_2256'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=3)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('token', 'user')},
+            },
+        ),
+        migrations.RunPython(index_users, migrations.RunPython.noop),
+    ]
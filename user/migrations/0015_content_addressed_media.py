@@ -0,0 +1,25 @@
+# Generated by Django 3.2.7 on 2026-10-19 10:49
+
+import companion.utils.storage
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0014_avatar_dimensions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=models.ImageField(blank=True, storage=companion.utils.storage.content_addressed_storage, upload_to='users/avatar', validators=[django.core.validators.validate_image_file_extension], verbose_name='avatar'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='avatar_thumbnail',
+            field=models.ImageField(blank=True, storage=companion.utils.storage.content_addressed_storage, upload_to='users/avatar_thumbnail', validators=[django.core.validators.validate_image_file_extension]),
+        ),
+    ]
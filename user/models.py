@@ -1,19 +1,87 @@
+import math
+import re
+import uuid
+from pathlib import Path
+
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser, UserManager
+from django.core.cache import caches
 from django.core.validators import validate_image_file_extension
-from django.db import models
+from django.db import models, transaction
+from django.utils.connection import ConnectionProxy
 from django.utils.translation import gettext_lazy as _
 from PIL import Image
 
+from companion.utils.image import make_thumbnails, validate_image_header
+from companion.utils.storage import content_addressed_storage
+
 AVATAR_WIDTH = 256
 AVATAR_HEIGHT = 256
 AVATAR_THUMBNAIL_WIDTH = 64
 AVATAR_THUMBNAIL_HEIGHT = 64
+AVATAR_FORMATS = ['JPEG', 'PNG', 'GIF', 'WEBP']
+
+SEARCH_MIN_SIMILARITY = 0.5  # Fraction of query's trigrams a user must have to be a (fuzzy) match
+SEARCH_CACHE_VERSION_KEY = 'version'
+
+search_cache = ConnectionProxy(caches, 'user_search')
+
+
+def validate_avatar(avatar):
+    return validate_image_header(avatar, formats=AVATAR_FORMATS, max_pixels=settings.AVATAR_MAX_PIXELS)
 
 
 def get_first_part_of_email(email):
     return email.split('@')[0]
 
 
+def get_trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def get_search_tokens(nickname, email):
+    """
+    Tokens to index a user by:
+    trigrams of nickname and of first part of email for (fuzzy) substring matching,
+    and "^" + first 1 or 2 characters of each word, so that short queries can match prefixes of words.
+    Domain of email is left out, its trigrams (e.g. "gma", "com") would match almost every user.
+    """
+    tokens = set()
+    for text in [nickname, get_first_part_of_email(email)]:
+        text = text.lower()
+        tokens |= get_trigrams(text)
+        for word in re.split(r'[\W_]+', text):
+            if word:
+                tokens.add('^' + word[:1])
+                tokens.add('^' + word[:2])
+    return tokens
+
+
+def get_query_tokens(query):
+    """
+    Return tokens to look up for `query`, and how many of them a user must have to be a match.
+    Like indexed emails, domain of an email in `query` is left out.
+    """
+    query = get_first_part_of_email(query.strip().lower())
+    if len(query) < 3:
+        return {'^' + query}, 1
+
+    trigrams = get_trigrams(query)
+    return trigrams, max(1, math.ceil(len(trigrams) * SEARCH_MIN_SIMILARITY))
+
+
+def invalidate_search_cache():
+    """
+    Drop cached search results (see `UserSearchBusiness`), now and once current transaction is committed
+    (a search in between could cache results without the change again).
+    """
+    def invalidate():
+        search_cache.set(SEARCH_CACHE_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
 class CustomUserManager(UserManager):
     """
     Customize to allow creating user with just email, no need username
@@ -47,15 +115,29 @@ class User(AbstractUser):
     )
     avatar = models.ImageField(
         _('avatar'),
-        upload_to='users/avatar/%Y/%m',
+        upload_to='users/avatar',
+        storage=content_addressed_storage,
         blank=True,
         validators=[validate_image_file_extension],
     )
     avatar_thumbnail = models.ImageField(
-        upload_to='users/avatar_thumbnail/%Y/%m',
+        upload_to='users/avatar_thumbnail',
+        storage=content_addressed_storage,
         blank=True,
         validators=[validate_image_file_extension]
     )
+    # Uploaded avatar as is, until it replaces `avatar` once processed (see `make_avatar_thumbnails`):
+    # meanwhile the previous avatar is still served, not this possibly huge file
+    avatar_upload = models.ImageField(
+        upload_to='users/avatar_upload',
+        storage=content_addressed_storage,
+        blank=True,
+    )
+    # Stored so that image files never need to be opened to know their size
+    avatar_width = models.PositiveIntegerField(null=True, blank=True)
+    avatar_height = models.PositiveIntegerField(null=True, blank=True)
+    avatar_thumbnail_width = models.PositiveIntegerField(null=True, blank=True)
+    avatar_thumbnail_height = models.PositiveIntegerField(null=True, blank=True)
     social_avatar_url = models.URLField(blank=True)
 
     objects = CustomUserManager()
@@ -69,22 +151,130 @@ class User(AbstractUser):
     def save(self, *args, **kwargs):
         self.set_default_nickname()
         super().save(*args, **kwargs)
-        self._make_thumbnail(self.avatar, AVATAR_WIDTH, AVATAR_HEIGHT)
-        self._make_thumbnail(self.avatar_thumbnail, AVATAR_THUMBNAIL_WIDTH, AVATAR_THUMBNAIL_HEIGHT)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'nickname', 'email'} & set(update_fields):
+            UserSearchToken.update_for(self)
 
     def set_default_nickname(self):
         if not self.nickname:
             self.nickname = get_first_part_of_email(self.email)
 
-    @staticmethod
-    def _make_thumbnail(image, width, height):
-        if image and (
-            image.width > width or
-            image.height > height
-        ):
-            with Image.open(image.path) as f:
-                f.thumbnail((width, height))
-                f.save(image.path)
+    def set_avatar(self, avatar):
+        """
+        Set uploaded `avatar` (or None to remove),
+        it is stored as is and only replaces the current avatar once `make_avatar_thumbnails` is called.
+        """
+        self.avatar_upload = avatar
+        if avatar is None:
+            self.avatar = None
+            self.avatar_thumbnail = None
+            self.avatar_width = None
+            self.avatar_height = None
+            self.avatar_thumbnail_width = None
+            self.avatar_thumbnail_height = None
+
+    def set_social_avatar(self, avatar, social_avatar_url):
+        """
+        Store downloaded social avatar (see `social_avatar_url`) as the user's avatar,
+        it is processed like uploaded ones by `make_avatar_thumbnails`.
+        Return False if user has set an avatar, or their social avatar changed meanwhile.
+        """
+        self.avatar_upload.save(avatar.name, avatar, save=False)
+        # Conditional update, so an avatar uploaded while downloading this one is not overwritten
+        updated = User.objects.filter(
+            pk=self.pk, avatar='', avatar_upload='', social_avatar_url=social_avatar_url,
+        ).update(avatar_upload=self.avatar_upload.name)
+        return bool(updated)
+
+    def make_avatar_thumbnails(self):
+        """
+        Replace avatar with downscaled versions of every size of the uploaded one, decoding it only once.
+        An uploaded avatar which can't be decoded is dropped, the previous avatar is kept.
+        Return False if there is no uploaded avatar (e.g. already processed), or it was changed or removed meanwhile,
+        or dropped.
+        """
+        if not self.avatar_upload:
+            return False
+
+        image_format = 'WEBP' if settings.AVATAR_WEBP else None
+        original_name = self.avatar_upload.name
+        try:
+            with self.avatar_upload.open('rb') as f:
+                avatar, avatar_thumbnail = make_thumbnails(f, [
+                    (AVATAR_WIDTH, AVATAR_HEIGHT),
+                    (AVATAR_THUMBNAIL_WIDTH, AVATAR_THUMBNAIL_HEIGHT),
+                ], image_format=image_format)
+        except FileNotFoundError:
+            return False
+        except (OSError, SyntaxError, Image.DecompressionBombError):
+            # Not an image Pillow can decode or encode, although it passed validation on upload.
+            # Dropped, so that it isn't processed again and doesn't keep a social avatar from being cached
+            self.avatar_upload = ''
+            User.objects.filter(pk=self.pk, avatar_upload=original_name).update(avatar_upload='')
+            return False
+
+        suffix = '.webp' if image_format else Path(original_name).suffix.lower()
+        img_name = 'avatar' + suffix  # Files are named by their content, see `content_addressed_storage`
+        # Before saving, some storages close files once written (e.g. S3)
+        self.avatar_width, self.avatar_height = avatar.width, avatar.height
+        self.avatar_thumbnail_width, self.avatar_thumbnail_height = avatar_thumbnail.width, avatar_thumbnail.height
+        self.avatar.save(img_name, avatar, save=False)
+        self.avatar_thumbnail.save(img_name, avatar_thumbnail, save=False)
+
+        # Conditional update, so an avatar uploaded while this one was processing is not overwritten.
+        # Files no longer used (e.g. the uploaded one) are removed by `sweep_avatar_files_task`
+        updated = User.objects.filter(pk=self.pk, avatar_upload=original_name).update(
+            avatar_upload='',
+            avatar=self.avatar.name,
+            avatar_thumbnail=self.avatar_thumbnail.name,
+            avatar_width=self.avatar_width,
+            avatar_height=self.avatar_height,
+            avatar_thumbnail_width=self.avatar_thumbnail_width,
+            avatar_thumbnail_height=self.avatar_thumbnail_height,
+        )
+        return bool(updated)
+
+
+class UserSearchToken(models.Model):
+    """
+    Search index of users' nickname and email (see `get_search_tokens`),
+    so searching only reads index entries of the query's tokens instead of scanning all users.
+    Kept up to date by `User.save`.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=3)
+
+    class Meta:
+        unique_together = ['token', 'user']
+
+    @classmethod
+    def update_for(cls, user):
+        tokens = get_search_tokens(user.nickname, user.email)
+        current_tokens = set(cls.objects.filter(user=user).values_list('token', flat=True))
+
+        removed_tokens = current_tokens - tokens
+        added_tokens = tokens - current_tokens
+        if not removed_tokens and not added_tokens:
+            return
+
+        if removed_tokens:
+            cls.objects.filter(user=user, token__in=removed_tokens).delete()
+
+        # Ignore conflicts: tokens different in Python may be equal under the DB's collation
+        cls.objects.bulk_create([
+            cls(user=user, token=token)
+            for token in added_tokens
+        ], ignore_conflicts=True)
+
+        invalidate_search_cache()
+
+
+class PendingLastLogin(models.Model):
+    """
+    Login not written to `User.last_login` yet, see `LastLoginBusiness`.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    login_time = models.DateTimeField()
 
 
 class FacebookDataDeletionRequest(models.Model):
@@ -98,3 +288,12 @@ class FacebookDataDeletionRequest(models.Model):
     status = models.CharField(max_length=7, choices=Statuses.choices, default=Statuses.PENDING)
     issued_at = models.DateTimeField(null=True)
     expires = models.DateTimeField(null=True)
+
+
+class RevokedToken(models.Model):
+    """
+    Refresh tokens which can't be used anymore (e.g. rotated ones), by their "jti" claim.
+    Only kept until they expire, as expired tokens are rejected anyway (see `prune_revoked_tokens_task`).
+    """
+    jti = models.CharField(max_length=255, primary_key=True)
+    expire_time = models.DateTimeField(db_index=True)
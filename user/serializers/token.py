@@ -0,0 +1,46 @@
+from django.db import IntegrityError, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import serializers
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from companion.utils.db import mark_user_wrote
+from user.business.last_login import LastLoginBusiness
+from user.models import RevokedToken
+
+
+class TokenObtainPairSerializer(serializers.TokenObtainPairSerializer):
+    """
+    Like simplejwt's, but `last_login` is written later in batch (see `LastLoginBusiness`),
+    so `UPDATE_LAST_LOGIN` must be False.
+    """
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        LastLoginBusiness.record(self.user)
+        # Next requests authenticate the user, who may have just registered
+        mark_user_wrote(self.user.pk)
+        return data
+
+
+class TokenRefreshSerializer(serializers.TokenRefreshSerializer):
+    """
+    Like simplejwt's, but refresh tokens are revoked after rotation (see `RevokedToken`),
+    without `token_blacklist` app, which keeps every token ever issued.
+    """
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs['refresh'])
+        jti = refresh[api_settings.JTI_CLAIM]
+
+        if api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION:
+            # Check and revoke in a single INSERT, so that concurrent requests can't both use the same token
+            try:
+                with transaction.atomic():
+                    RevokedToken.objects.create(jti=jti, expire_time=datetime_from_epoch(refresh['exp']))
+            except IntegrityError:
+                raise InvalidToken(_('Token is blacklisted'))
+        elif RevokedToken.objects.filter(jti=jti).exists():
+            raise InvalidToken(_('Token is blacklisted'))
+
+        return super().validate(attrs)
@@ -1,31 +1,42 @@
-from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from django.core.validators import validate_image_file_extension
+from django.db import transaction
 from django.utils.translation import gettext as _
 from rest_framework import serializers
 from rest_framework.reverse import reverse
 
+from user.models import validate_avatar
+from user.tasks import process_avatar_task
+
 User = get_user_model()
 
 
 USER_SERIALIZER_FIELDS = ['url', 'pk', 'nickname', 'email', 'avatar', 'avatar_thumbnail']
 
+
 class UserSerializer(serializers.HyperlinkedModelSerializer):
+    # Not `ImageField`, which verifies uploaded images by decoding them,
+    # only the header is checked here, avatars are decoded in background (see `User.make_avatar_thumbnails`)
+    avatar = serializers.FileField(
+        required=False,
+        allow_null=True,
+        validators=[validate_image_file_extension, validate_avatar],
+    )
+
     class Meta:
         model = User
         fields = USER_SERIALIZER_FIELDS
         extra_kwargs = {
             'url': {'read_only': True},
             'pk': {'read_only': True},
-            'avatar': {'allow_null': True},
             'avatar_thumbnail': {'read_only': True},
         }
 
-    def validate(self, attrs):
-        attrs = super().validate(attrs)
-        if 'avatar' in attrs:
-            attrs['avatar_thumbnail'] = attrs['avatar']
-        return attrs
+    def update(self, instance, validated_data):
+        if 'avatar' in validated_data:
+            instance.set_avatar(validated_data.pop('avatar'))
+        return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         repr_ = super().to_representation(instance)
@@ -35,9 +46,16 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
         return repr_
 
     def save(self, **kwargs):
-        if 'avatar' in self.validated_data and self.validated_data['avatar'] is None:
+        avatar = self.validated_data.get('avatar')
+        if 'avatar' in self.validated_data and avatar is None:
             kwargs['social_avatar_url'] = ''
-        return super().save(**kwargs)
+
+        user = super().save(**kwargs)
+        if avatar:
+            # Resizing is slow for large images, don't let the request wait for it.
+            # Once committed, so that the task sees the uploaded avatar
+            transaction.on_commit(lambda: process_avatar_task.delay(user.pk))
+        return user
 
 
 class RegisterSerializer(serializers.ModelSerializer):
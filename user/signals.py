@@ -1,7 +1,15 @@
 from allauth.socialaccount.models import SocialAccount
-from django.db.models.signals import post_save
+from django.contrib.auth import get_user_model, user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+from user.authentication import invalidate_cached_user
+from user.business.last_login import LastLoginBusiness
+from user.tasks import cache_social_avatar_task
+
+User = get_user_model()
+
 
 @receiver(post_save, sender=SocialAccount)
 def update_avatar(**kwargs):
@@ -22,3 +30,24 @@ def update_avatar(**kwargs):
     if user.social_avatar_url != social_avatar_url:
         user.social_avatar_url = social_avatar_url
         user.save()
+        if social_avatar_url and not user.avatar and not user.avatar_upload:
+            # Once committed, so that the task sees the new URL
+            transaction.on_commit(lambda: cache_social_avatar_task.delay(user.pk))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_authenticated_user(instance, **kwargs):
+    """
+    Password changed, deactivated, .etc: don't authenticate with the outdated user anymore.
+    """
+    invalidate_cached_user(instance)
+
+
+# Replaces `django.contrib.auth.models.update_last_login`, which writes user row on every login
+user_logged_in.disconnect(dispatch_uid='update_last_login')
+
+
+@receiver(user_logged_in)
+def record_last_login(user, **kwargs):
+    LastLoginBusiness.record(user)
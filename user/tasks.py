@@ -1,10 +1,31 @@
+import logging
+
+import requests
 from celery import shared_task
 from dateutil.parser import isoparse
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
 from django.core.mail import send_mail
 from django.template import loader
-from django.utils import formats
+from django.utils import formats, timezone
 from django.utils.translation import gettext_lazy as _
 
+from companion.utils.db import delete_in_batches
+from companion.utils.download import DownloadTooLarge, download
+from companion.utils.storage import sweep_unreferenced_files
+from user.authentication import invalidate_cached_user
+from user.business.last_login import LastLoginBusiness
+from user.models import RevokedToken, validate_avatar
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+PRUNE_BATCH_SIZE = 1000
+SWEEP_BATCH_SIZE = 1000
+FLUSH_BATCH_SIZE = 1000
+SOCIAL_AVATAR_DOWNLOAD_TIMEOUT = 10  # seconds
+
 
 @shared_task
 def send_email_reset_password_link_task(recipient, url):
@@ -26,3 +47,83 @@ def send_email_reset_password_link(recipient, url):
     message = loader.render_to_string('user/reset_password/email_body.txt', context)
     html_message = loader.render_to_string('user/reset_password/email_body.html', context)
     send_mail(title, message, None, [recipient['email']], html_message=html_message)
+
+
+@shared_task
+def prune_revoked_tokens_task():
+    return prune_revoked_tokens()
+
+def prune_revoked_tokens(batch_size=PRUNE_BATCH_SIZE):
+    """
+    Delete expired revoked tokens (they are rejected anyway), `batch_size` rows at a time.
+    """
+    expired_tokens = RevokedToken.objects.filter(expire_time__lt=timezone.now())
+    return delete_in_batches(expired_tokens, batch_size)
+
+
+@shared_task
+def flush_last_logins_task():
+    return flush_last_logins()
+
+def flush_last_logins(batch_size=FLUSH_BATCH_SIZE):
+    return LastLoginBusiness.flush(batch_size)
+
+
+@shared_task
+def process_avatar_task(user_pk):
+    return process_avatar(user_pk)
+
+def process_avatar(user_pk):
+    user = User.objects.filter(pk=user_pk).first()
+    if user is None:
+        return False
+    processed = user.make_avatar_thumbnails()
+    # Saved by `update()`, no signal sent (also when the uploaded avatar is dropped)
+    invalidate_cached_user(user)
+    return processed
+
+
+@shared_task
+def cache_social_avatar_task(user_pk):
+    return cache_social_avatar(user_pk)
+
+def cache_social_avatar(user_pk):
+    """
+    Download user's social avatar (Google, Facebook) once and store it as their avatar,
+    so that clients get our cacheable images instead of hotlinking third-party URLs, which expire.
+    Return False if user has an avatar already, or the download isn't a valid avatar.
+    """
+    user = User.objects.filter(pk=user_pk).first()
+    if user is None or user.avatar or user.avatar_upload or not user.social_avatar_url:
+        return False
+
+    social_avatar_url = user.social_avatar_url
+    try:
+        avatar = download(
+            social_avatar_url, name='avatar',
+            max_size=settings.AVATAR_MAX_UPLOAD_SIZE, timeout=SOCIAL_AVATAR_DOWNLOAD_TIMEOUT,
+        )
+        image_format = validate_avatar(avatar)
+    except (requests.RequestException, DownloadTooLarge, ValidationError) as e:
+        logger.warning('Cannot cache social avatar of user %s: %r', user.pk, e)
+        return False
+
+    avatar.name = f'avatar.{image_format.lower()}'
+    if not user.set_social_avatar(avatar, social_avatar_url):
+        return False
+    processed = user.make_avatar_thumbnails()
+    invalidate_cached_user(user)  # Saved by `update()`, no signal sent
+    if not processed and not user.avatar_upload:
+        logger.warning('Cannot cache social avatar of user %s: cannot decode image', user.pk)
+    return processed
+
+
+@shared_task
+def sweep_avatar_files_task():
+    return sweep_avatar_files()
+
+def sweep_avatar_files(batch_size=SWEEP_BATCH_SIZE):
+    return sum(
+        sweep_unreferenced_files(User, field_name, settings.MEDIA_SWEEP_GRACE_PERIOD, batch_size)
+        for field_name in ['avatar', 'avatar_thumbnail', 'avatar_upload']
+    )
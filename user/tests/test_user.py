@@ -1,26 +1,58 @@
 import json
+import os
 import random
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
 from pathlib import Path
 from unittest.mock import patch
 
 from django.conf import settings
 from django.contrib.auth import authenticate, get_user_model
 from django.core import mail
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import (SimpleUploadedFile,
+                                            TemporaryUploadedFile)
+from django.db import connection
 from django.template import loader
-from django.utils import formats
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import formats, timezone
 from faker import Faker
+from freezegun import freeze_time
 from model_bakery import baker
+from moto import mock_s3
 from parameterized import parameterized
+from PIL import Image
 from rest_framework.reverse import reverse
 from rest_framework.test import APITestCase
+from rest_framework.throttling import SimpleRateThrottle
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 
 from companion.utils.datetime import format_iso
+from companion.utils.db import read_from_replicas
+from companion.utils.image import validate_image_header
+from companion.utils.storage import (IMMUTABLE_CACHE_CONTROL,
+                                     ContentAddressedS3Storage)
 from companion.utils.testing import MediaTestCase
+from companion.utils.throttling import SlidingWindowRateThrottle
 from companion.utils.url import get_url_params
 from split_the_bill.models import Event, EventInvitation
-from user.business.reset_password import ResetPasswordBusiness
+from user.authentication import CachedJWTAuthentication
+from user.business.reset_password import (ResetPasswordBusiness,
+                                          ResetPasswordTokenInvalid)
 from user.serializers.user import EmailResetPasswordLinkTaskSerializer
-from user.tasks import send_email_reset_password_link
+from user.models import (PendingLastLogin, RevokedToken, UserSearchToken,
+                         search_cache)
+from user.tasks import (cache_social_avatar, flush_last_logins,
+                        process_avatar, prune_revoked_tokens,
+                        send_email_reset_password_link, sweep_avatar_files)
 from user.views import UserEventInvitationViewSet
 
 User = get_user_model()
@@ -154,6 +186,29 @@ class UserReadTestCase(_UserTestCase):
         )
         self.assertJSONEqual(expected, actual)
 
+    def test__get_list__user_with_many_events(self):
+        user = baker.make(User)
+        other_users = baker.make(User, _quantity=20)
+        events = baker.make(Event, _quantity=500)
+        Membership = Event.members.through
+        Membership.objects.bulk_create([
+            Membership(event=event, user=member)
+            for event in events
+            for member in [user, *random.sample(other_users, 5)]
+        ])
+
+        self.client.force_authenticate(user=user)
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(self.url, {'limit': 100})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['count'], 21)
+
+        # Count + page, co-members are found with a subquery instead of a list of pks,
+        # so neither the number nor the size of queries grow with events or members
+        self.assertEqual(len(context.captured_queries), 2)
+        for query in context.captured_queries:
+            self.assertLess(len(query['sql']), 2000)
+
     def test__get_list_permission(self):
         # Unauthenticated user cannot access
         self.client.force_authenticate(user=None)
@@ -197,6 +252,7 @@ class UserReadTestCase(_UserTestCase):
         self.assertEqual(res.status_code, 200)
 
 
+@patch('user.serializers.user.process_avatar_task.delay', process_avatar)
 class UserUpdateTestCase(MediaTestCase, _UserTestCase):
     @parameterized.expand([
         ['put'],
@@ -235,10 +291,13 @@ class UserUpdateTestCase(MediaTestCase, _UserTestCase):
         url = self.get_detail_url(user.pk)
 
         avatar_path = Path(__file__).parent / 'assets' / 'avatar.jpg'
-        with open(avatar_path, 'rb') as avatar:
+        with open(avatar_path, 'rb') as avatar, self.captureOnCommitCallbacks(execute=True):
             data = {'avatar': avatar}
             res = self.client.patch(url, data, format='multipart')
+        self.assertEqual(res.status_code, 200)
 
+        # Avatar is resized in background, it's done by now
+        res = self.client.get(url)
         results = res.json()
 
         # Check if resizing works
@@ -248,6 +307,13 @@ class UserUpdateTestCase(MediaTestCase, _UserTestCase):
         self.assertLessEqual(user.avatar_thumbnail.width, 64)
         self.assertLessEqual(user.avatar_thumbnail.height, 64)
 
+        # Sizes are stored
+        self.assertEqual((user.avatar_width, user.avatar_height), (user.avatar.width, user.avatar.height))
+        self.assertEqual(
+            (user.avatar_thumbnail_width, user.avatar_thumbnail_height),
+            (user.avatar_thumbnail.width, user.avatar_thumbnail.height)
+        )
+
         # Check if path returned to client is correct
         avatar_path = Path(user.avatar.path).relative_to(settings.MEDIA_ROOT)
         avatar_path = str(avatar_path).replace('\\', '/')
@@ -259,15 +325,141 @@ class UserUpdateTestCase(MediaTestCase, _UserTestCase):
         avatar_thumbnail_url = 'http://testserver' + settings.MEDIA_URL + avatar_thumbnail_path
         self.assertEqual(avatar_thumbnail_url, results['avatar_thumbnail'])
 
+    def test__same_avatar_is_stored_once(self):
+        users = baker.make(User, _quantity=2)
+        avatar_path = Path(__file__).parent / 'assets' / 'avatar.jpg'
+        for user in users:
+            self.client.force_authenticate(user=user)
+            with open(avatar_path, 'rb') as avatar, self.captureOnCommitCallbacks(execute=True):
+                res = self.client.patch(self.get_detail_url(user.pk), {'avatar': avatar}, format='multipart')
+            self.assertEqual(res.status_code, 200)
+            user.refresh_from_db()
+
+        self.assertTrue(users[0].avatar)
+        self.assertEqual(users[0].avatar.name, users[1].avatar.name)
+        self.assertEqual(users[0].avatar_thumbnail.name, users[1].avatar_thumbnail.name)
+
+    def test__avatar_is_only_processed_when_changed(self):
+        user = baker.make(User)
+        self.client.force_authenticate(user=user)
+        url = self.get_detail_url(user.pk)
+
+        patcher = patch('user.serializers.user.process_avatar_task.delay')
+        mock_delay = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        avatar_path = Path(__file__).parent / 'assets' / 'avatar.jpg'
+        with open(avatar_path, 'rb') as avatar, self.captureOnCommitCallbacks(execute=True):
+            res = self.client.patch(url, {'avatar': avatar}, format='multipart')
+            # Only enqueued once the upload is committed
+            mock_delay.assert_not_called()
+        self.assertEqual(res.status_code, 200)
+        mock_delay.assert_called_once_with(user.pk)
+
+        # Not processed yet, avatar is stored as uploaded, until then there is no avatar to serve
+        user.refresh_from_db()
+        self.assertTrue(user.avatar_upload)
+        self.assertFalse(user.avatar)
+        self.assertFalse(user.avatar_thumbnail)
+        self.assertIsNone(user.avatar_width)
+
+        mock_delay.reset_mock()
+        res = self.client.patch(url, {'nickname': 'Tenpenny'})
+        self.assertEqual(res.status_code, 200)
+        mock_delay.assert_not_called()
+
+        self.assertTrue(process_avatar(user.pk))
+        # Already processed
+        self.assertFalse(process_avatar(user.pk))
+
+    def test__previous_avatar_is_served_until_new_one_is_processed(self):
+        user = baker.make(User)
+        self.client.force_authenticate(user=user)
+        url = self.get_detail_url(user.pk)
+
+        avatar_path = Path(__file__).parent / 'assets' / 'avatar.jpg'
+        with open(avatar_path, 'rb') as avatar, self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {'avatar': avatar}, format='multipart')
+        previous = self.client.get(url).json()
+        self.assertIsNotNone(previous['avatar'])
+
+        buffer = BytesIO()
+        Image.new('RGB', (300, 300)).save(buffer, format='PNG')
+        new_avatar = SimpleUploadedFile('avatar.png', buffer.getvalue())
+        with patch('user.serializers.user.process_avatar_task.delay') as mock_delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            res = self.client.patch(url, {'avatar': new_avatar}, format='multipart')
+        self.assertEqual(res.status_code, 200)
+        mock_delay.assert_called_once_with(user.pk)
+        self.assertEqual(res.json()['avatar'], previous['avatar'])
+        self.assertEqual(res.json()['avatar_thumbnail'], previous['avatar_thumbnail'])
+
+        self.assertTrue(process_avatar(user.pk))
+        res = self.client.get(url)
+        self.assertNotEqual(res.json()['avatar'], previous['avatar'])
+
+    def test__undecodable_avatar_is_dropped(self):
+        user = baker.make(User)
+        self.client.force_authenticate(user=user)
+        url = self.get_detail_url(user.pk)
+
+        avatar_path = Path(__file__).parent / 'assets' / 'avatar.jpg'
+        with open(avatar_path, 'rb') as avatar, self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {'avatar': avatar}, format='multipart')
+        previous = self.client.get(url).json()
+
+        # Valid header, but pixel data is cut off
+        truncated = avatar_path.read_bytes()[:avatar_path.stat().st_size // 2]
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.patch(url, {'avatar': SimpleUploadedFile('avatar.jpg', truncated)}, format='multipart')
+        self.assertEqual(res.status_code, 200)
+
+        user.refresh_from_db()
+        self.assertFalse(user.avatar_upload)
+        res = self.client.get(url)
+        self.assertEqual(res.json()['avatar'], previous['avatar'])
+
+    @override_settings(AVATAR_WEBP=True)
+    def test__update_avatar__webp(self):
+        user = baker.make(User)
+        self.client.force_authenticate(user=user)
+        url = self.get_detail_url(user.pk)
+
+        avatar_path = Path(__file__).parent / 'assets' / 'avatar.jpg'
+        with open(avatar_path, 'rb') as avatar, self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {'avatar': avatar}, format='multipart')
+
+        user.refresh_from_db()
+        self.assertTrue(user.avatar.name.endswith('.webp'))
+        self.assertTrue(user.avatar_thumbnail.name.endswith('.webp'))
+
+    @override_settings(AVATAR_WEBP=True)
+    def test__update_avatar__webp__cmyk(self):
+        user = baker.make(User)
+        self.client.force_authenticate(user=user)
+
+        buffer = BytesIO()
+        Image.new('CMYK', (300, 300)).save(buffer, format='JPEG')
+        avatar = SimpleUploadedFile('avatar.jpg', buffer.getvalue())
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.patch(self.get_detail_url(user.pk), {'avatar': avatar}, format='multipart')
+        self.assertEqual(res.status_code, 200)
+
+        user.refresh_from_db()
+        self.assertTrue(user.avatar.name.endswith('.webp'))
+        with Image.open(user.avatar) as image:
+            self.assertEqual(image.mode, 'RGB')
+
     def test__remove_avatar(self):
         user = baker.make(User)
         self.client.force_authenticate(user=user)
         url = self.get_detail_url(user.pk)
 
         avatar_path = Path(__file__).parent / 'assets' / 'avatar.jpg'
-        with open(avatar_path, 'rb') as avatar:
+        with open(avatar_path, 'rb') as avatar, self.captureOnCommitCallbacks(execute=True):
             data = {'avatar': avatar}
-            res = self.client.patch(url, data, format='multipart')
+            self.client.patch(url, data, format='multipart')
+        res = self.client.get(url)
 
         user.refresh_from_db()
         self.assertIsNotNone(user.avatar)
@@ -380,6 +572,7 @@ class UserRegisterTestCase(APITestCase):
         self.assertEqual(res.status_code, 200)
 
 
+@patch('user.serializers.user.process_avatar_task.delay', process_avatar)
 class UserMyInfoTestCase(MediaTestCase, _UserTestCase):
     url = reverse('user-list')
     my_info_url = reverse('user-my-info')
@@ -470,7 +663,7 @@ class UserMyInfoTestCase(MediaTestCase, _UserTestCase):
         url = self.my_info_url
 
         avatar_path = Path(__file__).parent / 'assets' / 'avatar.jpg'
-        with open(avatar_path, 'rb') as avatar:
+        with open(avatar_path, 'rb') as avatar, self.captureOnCommitCallbacks(execute=True):
             data = {'avatar': avatar}
             self.client.patch(url, data, format='multipart')
 
@@ -486,12 +679,59 @@ class UserMyInfoTestCase(MediaTestCase, _UserTestCase):
         self.assertEqual(self.user.avatar_thumbnail, '')
         self.assertEqual(self.user.social_avatar_url, '')
 
+    @staticmethod
+    def make_avatar(width, height, image_format='PNG', name='avatar.png'):
+        buffer = BytesIO()
+        Image.new('RGB', (width, height)).save(buffer, format=image_format)
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def test__avatar_is_streamed_to_temporary_file(self):
+        with patch('user.models.validate_image_header', wraps=validate_image_header) as mock_validate:
+            res = self.client.patch(self.my_info_url, {'avatar': self.make_avatar(10, 10)}, format='multipart')
+        self.assertEqual(res.status_code, 200)
+
+        avatar = mock_validate.call_args[0][0]
+        self.assertIsInstance(avatar, TemporaryUploadedFile)
+
+    @override_settings(AVATAR_MAX_UPLOAD_SIZE=1000)
+    def test__avatar_too_large(self):
+        avatar = SimpleUploadedFile('avatar.png', b'0' * 1001)
+        res = self.client.patch(self.my_info_url, {'avatar': avatar}, format='multipart')
+        self.assertEqual(res.status_code, 413)
+
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.avatar)
+
+    @override_settings(AVATAR_MAX_PIXELS=100 * 100)
+    def test__avatar_too_many_pixels(self):
+        # Compressed, the file is small, but decoding it would need a lot more memory
+        avatar = self.make_avatar(101, 100)
+        with patch.object(Image.Image, 'load') as mock_load:
+            res = self.client.patch(self.my_info_url, {'avatar': avatar}, format='multipart')
+        self.assertEqual(res.status_code, 400)
+        self.assertIn('avatar', res.json())
+        mock_load.assert_not_called()
+
+        res = self.client.patch(self.my_info_url, {'avatar': self.make_avatar(100, 100)}, format='multipart')
+        self.assertEqual(res.status_code, 200)
+
+    def test__avatar_invalid_image(self):
+        avatar = SimpleUploadedFile('avatar.png', b'not an image')
+        res = self.client.patch(self.my_info_url, {'avatar': avatar}, format='multipart')
+        self.assertEqual(res.status_code, 400)
+
+        # Format not supported
+        avatar = self.make_avatar(10, 10, image_format='BMP', name='avatar.bmp')
+        res = self.client.patch(self.my_info_url, {'avatar': avatar}, format='multipart')
+        self.assertEqual(res.status_code, 400)
+
 
 class UserSearchTestCase(_UserTestCase):
     url = reverse('user-search')
 
     def setUp(self):
         super().setUp(create_data=False)
+        search_cache.clear()
         baker.make(User, nickname='Carl Johnson', email='johnson@grove.street')
         baker.make(User, nickname='BigSmoke', email='bigsmoke@grove.street')
         baker.make(User, nickname='Sweet', email='king@grove.street')
@@ -501,12 +741,21 @@ class UserSearchTestCase(_UserTestCase):
         baker.make(User, nickname='LittleBear', email='littlebear@grove.street')
 
     @parameterized.expand([
-        ['big', ['bigsmoke@grove.street', 'bigbear@grove.street']],
+        ['big', ['bigbear@grove.street', 'bigsmoke@grove.street']],
         ['bear', ['bigbear@grove.street', 'littlebear@grove.street']],
         ['arl', ['johnson@grove.street']],
         ['The Truth', []],
         ['king', ['king@grove.street']],
-        ['sweet', ['king@grove.street', 'brian@sweet.street']],
+        ['sweet', ['king@grove.street']],
+        # Domain of emails is not searched, it would match almost everyone
+        ['street', []],
+        ['king@sweet.street', ['king@grove.street']],
+        # Typos
+        ['johnsin', ['johnson@grove.street']],
+        ['bigsmokr', ['bigsmoke@grove.street']],
+        # Short queries match beginning of words
+        ['b', ['bigbear@grove.street', 'bigsmoke@grove.street', 'brian@sweet.street']],
+        ['ry', ['ryder@grove.street']],
     ])
     def test__search(self, query, expected_emails):
         user = baker.make(User)
@@ -515,7 +764,7 @@ class UserSearchTestCase(_UserTestCase):
         res = self.client.get(self.url, data)
         self.assertEqual(res.status_code, 200)
 
-        users = User.objects.filter(email__in=expected_emails).order_by('nickname')
+        users = sorted(User.objects.filter(email__in=expected_emails), key=lambda u: expected_emails.index(u.email))
         actual = res.json()
         expected = json.dumps(self.get_pagination_json([
             {
@@ -538,6 +787,148 @@ class UserSearchTestCase(_UserTestCase):
         expected = json.dumps(self.get_pagination_json([], extra_actions=False))
         self.assertJSONEqual(expected, actual)
 
+    def test__search__ordering(self):
+        user = baker.make(User)
+        self.client.force_authenticate(user=user)
+        data = {'nickname_or_email__icontains': 'bear', 'ordering': '-nickname'}
+        res = self.client.get(self.url, data)
+        self.assertEqual(res.status_code, 200)
+        emails = [result['email'] for result in res.json()['results']]
+        self.assertListEqual(emails, ['littlebear@grove.street', 'bigbear@grove.street'])
+
+    def test__search__exclude_emails(self):
+        user = baker.make(User)
+        self.client.force_authenticate(user=user)
+        data = {
+            'nickname_or_email__icontains': 'big',
+            'exclude_emails': 'bigsmoke@grove.street, ryder@grove.street',
+        }
+        res = self.client.get(self.url, data)
+        self.assertEqual(res.status_code, 200)
+        emails = [result['email'] for result in res.json()['results']]
+        self.assertListEqual(emails, ['bigbear@grove.street'])
+
+    def test__search_index_follows_changes(self):
+        user = User.objects.get(email='ryder@grove.street')
+        user.nickname = 'Madd Dogg'
+        user.save()
+
+        self.client.force_authenticate(user=baker.make(User))
+        res = self.client.get(self.url, {'nickname_or_email__icontains': 'dogg'})
+        self.assertEqual([result['email'] for result in res.json()['results']], ['ryder@grove.street'])
+        res = self.client.get(self.url, {'nickname_or_email__icontains': 'ryder'})
+        self.assertEqual([result['email'] for result in res.json()['results']], ['ryder@grove.street'])
+
+        user.email = 'madd@dogg.com'
+        user.save(update_fields=['email'])
+        res = self.client.get(self.url, {'nickname_or_email__icontains': 'ryder'})
+        self.assertEqual(res.json()['results'], [])
+
+    def search_token_queries(self, query):
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(self.url, {'nickname_or_email__icontains': query})
+        self.assertEqual(res.status_code, 200)
+        emails = [result['email'] for result in res.json()['results']]
+        queries = [q for q in context.captured_queries if UserSearchToken._meta.db_table in q['sql']]
+        return emails, len(queries)
+
+    def test__search_cache(self):
+        self.client.force_authenticate(user=baker.make(User))
+        emails, queries = self.search_token_queries('b')
+        self.assertListEqual(emails, ['bigbear@grove.street', 'bigsmoke@grove.street', 'brian@sweet.street'])
+        self.assertEqual(queries, 1)
+
+        # Same query
+        emails, queries = self.search_token_queries('B ')
+        self.assertListEqual(emails, ['bigbear@grove.street', 'bigsmoke@grove.street', 'brian@sweet.street'])
+        self.assertEqual(queries, 0)
+
+        # Longer queries matching beginning of words narrow down cached candidates
+        emails, queries = self.search_token_queries('bi')
+        self.assertListEqual(emails, ['bigbear@grove.street', 'bigsmoke@grove.street'])
+        self.assertEqual(queries, 0)
+
+        # Fuzzy queries can't be narrowed down from queries matching beginning of words
+        emails, queries = self.search_token_queries('big')
+        self.assertListEqual(emails, ['bigbear@grove.street', 'bigsmoke@grove.street'])
+        self.assertEqual(queries, 1)
+
+        emails, queries = self.search_token_queries('bigsm')
+        self.assertListEqual(emails, ['bigsmoke@grove.street'])
+        self.assertEqual(queries, 1)
+
+        # Candidates of "bigsm" include every user with enough of its trigrams to match "bigsmo"
+        emails, queries = self.search_token_queries('bigsmo')
+        self.assertListEqual(emails, ['bigsmoke@grove.street'])
+        self.assertEqual(queries, 0)
+
+        # Cache is invalidated when nickname or email changes
+        user = User.objects.get(email='ryder@grove.street')
+        user.nickname = 'BigRyder'
+        user.save()
+        emails, queries = self.search_token_queries('big')
+        self.assertIn('ryder@grove.street', emails)
+        self.assertEqual(queries, 1)
+
+        # But not when search tokens stay the same
+        user.nickname = 'bigryder'
+        user.save()
+        emails, queries = self.search_token_queries('big')
+        self.assertIn('ryder@grove.street', emails)
+        self.assertEqual(queries, 0)
+
+    def test__search_cache__fuzzy_match_of_longer_query(self):
+        user = baker.make(User, nickname='cdefgh', email='zz@x.io')
+        self.client.force_authenticate(user=baker.make(User))
+
+        emails, queries = self.search_token_queries('abcd')
+        self.assertListEqual(emails, [])
+
+        # Not a match of "abcd", but a (fuzzy) match of "abcdefgh"
+        emails, queries = self.search_token_queries('abcdefgh')
+        self.assertListEqual(emails, [user.email])
+
+    @patch('user.business.user_search.UserSearchBusiness.max_candidates', 1)
+    def test__search_cache__too_many_candidates(self):
+        self.client.force_authenticate(user=baker.make(User))
+        emails, queries = self.search_token_queries('b')
+        self.assertEqual(len(emails), 1)
+
+        # Candidates of "b" are incomplete, so cannot be narrowed down
+        emails, queries = self.search_token_queries('bi')
+        self.assertEqual(len(emails), 1)
+        self.assertEqual(queries, 1)
+
+    @patch('user.business.user_search.UserSearchBusiness.max_candidates', 2)
+    def test__search_cache__narrow_from_complete_candidates(self):
+        self.client.force_authenticate(user=baker.make(User))
+        emails, queries = self.search_token_queries('b')
+        self.assertEqual(len(emails), 2)
+
+        emails, queries = self.search_token_queries('bear')
+        self.assertListEqual(emails, ['bigbear@grove.street', 'littlebear@grove.street'])
+        self.assertEqual(queries, 1)
+
+        # Candidates of "b" are incomplete, but those of "bear" are not
+        emails, queries = self.search_token_queries('bears')
+        self.assertListEqual(emails, ['bigbear@grove.street', 'littlebear@grove.street'])
+        self.assertEqual(queries, 0)
+
+    def test__search_does_not_scan_users(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest(f'Query plan check is not implemented for {connection.vendor}.')
+
+        self.client.force_authenticate(user=baker.make(User))
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(self.url, {'nickname_or_email__icontains': 'sweet'})
+        self.assertEqual(res.status_code, 200)
+
+        for query in context.captured_queries:
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                plan = '\n'.join(row[-1] for row in cursor.fetchall())
+            self.assertNotRegex(plan, rf'SCAN (TABLE )?{User._meta.db_table}\b')
+
     def test__search_permission(self):
         data = {'nickname_or_email__icontains': 'something'}
 
@@ -554,6 +945,39 @@ class UserSearchTestCase(_UserTestCase):
         self.assertEqual(res.status_code, 400)
         self.assertDictEqual(res.json(), {'nickname_or_email__icontains': ['This field is required.']})
 
+    @patch.object(SimpleRateThrottle, 'THROTTLE_RATES', {'user_search': '4/min'})
+    @patch.object(SlidingWindowRateThrottle, 'timer')
+    def test__search_throttle(self, timer):
+        cache.clear()
+        self.client.force_authenticate(user=baker.make(User))
+        data = {'nickname_or_email__icontains': 'big'}
+
+        timer.return_value = 600
+        for _ in range(4):
+            res = self.client.get(self.url, data)
+            self.assertEqual(res.status_code, 200)
+        res = self.client.get(self.url, data)
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(res['Retry-After'], '60')
+
+        # Half of next window: requests of previous window still count for half
+        timer.return_value = 690
+        for _ in range(2):
+            res = self.client.get(self.url, data)
+            self.assertEqual(res.status_code, 200)
+        res = self.client.get(self.url, data)
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(res['Retry-After'], '15')
+
+        timer.return_value = 705
+        res = self.client.get(self.url, data)
+        self.assertEqual(res.status_code, 200)
+
+        # Other users have their own limit
+        self.client.force_authenticate(user=baker.make(User))
+        res = self.client.get(self.url, data)
+        self.assertEqual(res.status_code, 200)
+
 
 class UserChangePasswordTestCase(_UserTestCase):
     url = reverse('user-change-password')
@@ -903,3 +1327,358 @@ class UserMyEventInvitationTestCase(_UserTestCase):
         self.client.force_authenticate(user=self.user)
         res = req_method(url)
         self.assertEqual(res.status_code, 200)
+
+
+class SweepAvatarFilesTestCase(MediaTestCase):
+    def test__sweep_unreferenced_files_in_batches(self):
+        user = baker.make(User)
+        storage = user.avatar.storage
+        user.avatar = storage.save('users/avatar/avatar.jpg', ContentFile(b'referenced'))
+        user.save()
+        recent = storage.save('users/avatar/avatar.jpg', ContentFile(b'recent'))
+        unreferenced = [
+            storage.save('users/avatar/avatar.jpg', ContentFile(f'unreferenced {i}'.encode()))
+            for i in range(2)
+        ]
+        expired_time = (timezone.now() - settings.MEDIA_SWEEP_GRACE_PERIOD - timedelta(minutes=1)).timestamp()
+        for name in [user.avatar.name, *unreferenced]:
+            os.utime(storage.path(name), (expired_time, expired_time))
+
+        # 4 files in avatar directory (2 batches), nothing in avatar_thumbnail directory
+        with self.assertNumQueries(2):
+            deleted_count = sweep_avatar_files(batch_size=2)
+
+        self.assertEqual(deleted_count, 2)
+        for name in unreferenced:
+            self.assertFalse(storage.exists(name))
+        self.assertTrue(storage.exists(user.avatar.name))
+        self.assertTrue(storage.exists(recent))
+
+
+class AvatarS3StorageTestCase(_UserTestCase):
+    """
+    Avatars stored in a S3-compatible service, `moto` stands in for it.
+    """
+    bucket_name = 'companion-test'
+
+    def setUp(self):
+        super().setUp()
+        s3 = mock_s3()
+        s3.start()
+        self.addCleanup(s3.stop)
+
+        self.storage = ContentAddressedS3Storage(
+            bucket_name=self.bucket_name, access_key='test', secret_key='test', region_name='us-east-1',
+        )
+        self.storage.connection.meta.client.create_bucket(Bucket=self.bucket_name)
+
+        patchers = [
+            patch.object(User._meta.get_field(field_name), 'storage', self.storage)
+            for field_name in ['avatar', 'avatar_upload', 'avatar_thumbnail']
+        ]
+        patchers.append(patch('user.serializers.user.process_avatar_task.delay', process_avatar))
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test__avatar(self):
+        users = baker.make(User, _quantity=2)
+        avatar_path = Path(__file__).parent / 'assets' / 'avatar.jpg'
+        for user in users:
+            self.client.force_authenticate(user=user)
+            with open(avatar_path, 'rb') as avatar, self.captureOnCommitCallbacks(execute=True):
+                res = self.client.patch(self.get_detail_url(user.pk), {'avatar': avatar}, format='multipart')
+            self.assertEqual(res.status_code, 200)
+            user.refresh_from_db()
+
+        # Processed and deduplicated in the bucket
+        user = users[0]
+        self.assertEqual(user.avatar.name, users[1].avatar.name)
+        self.assertLessEqual(user.avatar.width, 256)
+        self.assertLessEqual(user.avatar_thumbnail.width, 64)
+        obj = self.storage.connection.meta.client.head_object(Bucket=self.bucket_name, Key=user.avatar.name)
+        self.assertEqual(obj['CacheControl'], IMMUTABLE_CACHE_CONTROL)
+
+        # Only the uploaded avatar is no longer referenced
+        with freeze_time(timezone.now() + settings.MEDIA_SWEEP_GRACE_PERIOD + timedelta(minutes=1)):
+            self.assertEqual(sweep_avatar_files(), 1)
+        self.assertTrue(self.storage.exists(user.avatar.name))
+        self.assertTrue(self.storage.exists(user.avatar_thumbnail.name))
+
+
+class _QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class CacheSocialAvatarTestCase(MediaTestCase):
+    """
+    A local HTTP server stands in for Google/Facebook CDN.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        shutil.copy(Path(__file__).parent / 'assets' / 'avatar.jpg', cls.directory.name)
+        (Path(cls.directory.name) / 'not_an_image.jpg').write_text('Hello')
+        avatar = (Path(cls.directory.name) / 'avatar.jpg').read_bytes()
+        (Path(cls.directory.name) / 'truncated.jpg').write_bytes(avatar[:len(avatar) // 2])
+
+        handler = partial(_QuietHTTPRequestHandler, directory=cls.directory.name)
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def get_url(self, filename):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}/{filename}'
+
+    def test__cache_social_avatar(self):
+        user = baker.make(User, social_avatar_url=self.get_url('avatar.jpg'))
+        self.assertTrue(cache_social_avatar(user.pk))
+
+        user.refresh_from_db()
+        self.assertTrue(user.avatar.name.endswith('.jpeg'))
+        self.assertLessEqual(user.avatar.width, 256)
+        self.assertLessEqual(user.avatar_thumbnail.width, 64)
+        self.assertEqual(user.avatar_width, user.avatar.width)
+
+        # Downloaded once only
+        self.assertFalse(cache_social_avatar(user.pk))
+
+    def test__uploaded_avatar_is_kept(self):
+        user = baker.make(User, social_avatar_url=self.get_url('avatar.jpg'), avatar='users/avatar/uploaded.jpg')
+        self.assertFalse(cache_social_avatar(user.pk))
+        user.refresh_from_db()
+        self.assertEqual(user.avatar.name, 'users/avatar/uploaded.jpg')
+
+    @parameterized.expand([
+        ['not_found.jpg'],  # HTTP 404
+        ['not_an_image.jpg'],
+    ])
+    def test__invalid_social_avatar(self, filename):
+        user = baker.make(User, social_avatar_url=self.get_url(filename))
+        with self.assertLogs('user.tasks', 'WARNING'):
+            self.assertFalse(cache_social_avatar(user.pk))
+        user.refresh_from_db()
+        self.assertFalse(user.avatar)
+
+    def test__undecodable_social_avatar(self):
+        user = baker.make(User, social_avatar_url=self.get_url('truncated.jpg'))
+        with self.assertLogs('user.tasks', 'WARNING'):
+            self.assertFalse(cache_social_avatar(user.pk))
+        user.refresh_from_db()
+        self.assertFalse(user.avatar)
+        self.assertFalse(user.avatar_upload)
+
+    @override_settings(AVATAR_MAX_UPLOAD_SIZE=1000)
+    def test__social_avatar_too_large(self):
+        user = baker.make(User, social_avatar_url=self.get_url('avatar.jpg'))
+        with self.assertLogs('user.tasks', 'WARNING'):
+            self.assertFalse(cache_social_avatar(user.pk))
+
+
+class CachedJWTAuthenticationTestCase(APITestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        super().setUp()
+        self.user = baker.make(User)
+        self.user.set_password('old password')
+        self.user.save()
+        self.token = AccessToken.for_user(self.user)
+        self.authentication = CachedJWTAuthentication()
+
+    def test__user_is_cached(self):
+        with self.assertNumQueries(1):
+            self.authentication.get_user(self.token)
+        with self.assertNumQueries(0):
+            user = self.authentication.get_user(self.token)
+        self.assertEqual(user, self.user)
+
+        # Process-local cache is enough
+        cache.clear()
+        with self.assertNumQueries(0):
+            self.authentication.get_user(self.token)
+
+        # Each request gets its own instance
+        self.assertIsNot(self.authentication.get_user(self.token), user)
+
+    def test__password_hash_is_not_cached(self):
+        user = self.authentication.get_user(self.token)
+        self.assertIn('password', user.get_deferred_fields())
+        self.assertNotIn(self.user.password, caches['jwt_user'].get(f'user:{self.user.pk}'))
+
+        # Loaded when needed
+        self.assertTrue(user.check_password('old password'))
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test__loaded_from_primary(self):
+        # Replica isn't replicated in tests, the user isn't there
+        with read_from_replicas():
+            user = self.authentication.get_user(self.token)
+        self.assertEqual(user, self.user)
+
+    def test__request_does_not_query_user(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        url = reverse('user-my-info')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(queries), 1)  # My info only
+
+    def test__invalidated_on_save(self):
+        self.authentication.get_user(self.token)
+        self.user.nickname = 'Tenpenny'
+        self.user.save()
+        with self.assertNumQueries(1):
+            user = self.authentication.get_user(self.token)
+        self.assertEqual(user.nickname, 'Tenpenny')
+
+    def test__invalidated_on_deactivation(self):
+        self.authentication.get_user(self.token)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(self.token)
+
+    def test__invalidated_on_delete(self):
+        self.authentication.get_user(self.token)
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(self.token)
+
+    def test__invalidated_on_password_change(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        url = reverse('user-change-password')
+        data = {'current_password': 'old password', 'new_password': 'Tenpenny 1234'}
+        res = self.client.post(url, data)
+        self.assertEqual(res.status_code, 200)
+
+        self.assertTrue(self.authentication.get_user(self.token).check_password('Tenpenny 1234'))
+        # Old password can't be used anymore
+        res = self.client.post(url, data)
+        self.assertEqual(res.status_code, 403)
+
+
+class TokenRefreshTestCase(APITestCase):
+    url = reverse('token_refresh')
+
+    def setUp(self):
+        super().setUp()
+        self.user = baker.make(User)
+        self.refresh = str(RefreshToken.for_user(self.user))
+
+    def test__refresh_token_is_rotated(self):
+        res = self.client.post(self.url, {'refresh': self.refresh})
+        self.assertEqual(res.status_code, 200)
+        new_refresh = res.json()['refresh']
+        self.assertNotEqual(new_refresh, self.refresh)
+
+        # Rotated token is revoked
+        res = self.client.post(self.url, {'refresh': self.refresh})
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(RevokedToken.objects.count(), 1)
+
+        res = self.client.post(self.url, {'refresh': new_refresh})
+        self.assertEqual(res.status_code, 200)
+
+    def test__single_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(self.url, {'refresh': self.refresh})
+        self.assertEqual(res.status_code, 200)
+        # Revoking is the check
+        statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith('INSERT INTO "user_revokedtoken"'))
+
+    def test__prune_expired_tokens_in_batches(self):
+        with freeze_time(timezone.now() - settings.SIMPLE_JWT['REFRESH_TOKEN_LIFETIME'] - timedelta(minutes=1)):
+            for _i in range(3):
+                res = self.client.post(self.url, {'refresh': str(RefreshToken.for_user(self.user))})
+                self.assertEqual(res.status_code, 200)
+        self.client.post(self.url, {'refresh': self.refresh})
+
+        with self.assertNumQueries(2 * 2 + 1):  # 2 batches of select + delete, then nothing left
+            deleted_count = prune_revoked_tokens(batch_size=2)
+        self.assertEqual(deleted_count, 3)
+        self.assertEqual(RevokedToken.objects.count(), 1)
+
+
+class LastLoginTestCase(APITestCase):
+    login_url = reverse('token_obtain_pair')
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.users = baker.make(User, _quantity=3)
+        for user in self.users:
+            user.set_password('Tenpenny 1234')
+            user.save()
+
+    def login(self, user):
+        res = self.client.post(self.login_url, {'email': user.email, 'password': 'Tenpenny 1234'})
+        self.assertEqual(res.status_code, 200)
+
+    def test__last_login_is_flushed_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.login(self.users[0])
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE')])
+        self.login(self.users[1])
+        self.login(self.users[0])
+
+        login_time = timezone.now()
+        with freeze_time(login_time):
+            self.login(self.users[2])
+        for user in self.users:
+            user.refresh_from_db()
+            self.assertIsNone(user.last_login)
+
+        # 2 batches of logins: (user 0, user 1), (user 0, user 2), each read, applied and removed, then nothing left
+        with self.assertNumQueries(2 * 3 + 1):
+            updated_count = flush_last_logins(batch_size=2)
+        self.assertEqual(updated_count, 4)
+        for user in self.users:
+            user.refresh_from_db()
+            self.assertIsNotNone(user.last_login)
+        self.assertEqual(self.users[2].last_login, login_time)
+
+        # Nothing left
+        self.assertFalse(PendingLastLogin.objects.exists())
+        self.assertEqual(flush_last_logins(), 0)
+
+    def test__pending_logins_survive_cache_clear(self):
+        self.login(self.users[0])
+        cache.clear()
+        self.assertEqual(flush_last_logins(), 1)
+        self.users[0].refresh_from_db()
+        self.assertIsNotNone(self.users[0].last_login)
+
+    def test__flush_never_sets_older_login_time(self):
+        user = self.users[0]
+        login_time = timezone.now()
+        with freeze_time(login_time - timedelta(minutes=1)):
+            self.login(user)
+        User.objects.filter(pk=user.pk).update(last_login=login_time)
+
+        self.assertEqual(flush_last_logins(), 0)
+        user.refresh_from_db()
+        self.assertEqual(user.last_login, login_time)
+
+    def test__login_invalidates_reset_password_token_before_flush(self):
+        user = self.users[0]
+        business = ResetPasswordBusiness(user)
+        token = business.token_generator.make_token(user)
+        business.check_token(token)
+
+        self.login(user)
+        business = ResetPasswordBusiness(User.objects.get(pk=user.pk))
+        with self.assertRaises(ResetPasswordTokenInvalid):
+            business.check_token(token)
@@ -7,6 +7,7 @@ from rest_framework_simplejwt.views import (
 from rest_framework.routers import DefaultRouter
 
 from . import views
+from .serializers.token import TokenObtainPairSerializer, TokenRefreshSerializer
 
 
 # NOTE: DRF has bug involve app's namespace and viewset's extra_actions,
@@ -15,8 +16,8 @@ from . import views
 # app_name = 'user'
 
 urlpatterns = [
-    path('login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('token-refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('login/', TokenObtainPairView.as_view(serializer_class=TokenObtainPairSerializer), name='token_obtain_pair'),
+    path('token-refresh/', TokenRefreshView.as_view(serializer_class=TokenRefreshSerializer), name='token_refresh'),
     path('me/info/', views.MyInfoViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update'}), name='user-my-info'),
     path('social-account/', include('user.views.social_account.urls')),
 ]
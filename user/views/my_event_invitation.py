@@ -2,7 +2,8 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
-from companion.utils.api import extra_action_urls
+from companion.utils.api import extra_action_urls, idempotent
+from companion.utils.request_metrics import SerializationTimingMixin
 from split_the_bill.models import EventInvitation
 from user.business.event_invitation import EventInvitationBusiness
 from user.filters import UserEventInvitationFilter
@@ -10,7 +11,9 @@ from user.serializers.event_invitation import UserEventInvitationSerializer
 
 
 @extra_action_urls
-class UserEventInvitationViewSet(ReadOnlyModelViewSet):
+@idempotent
+class UserEventInvitationViewSet(SerializationTimingMixin,
+                                 ReadOnlyModelViewSet):
     queryset = EventInvitation.objects.all()
     filterset_class = UserEventInvitationFilter
     serializer_class = UserEventInvitationSerializer
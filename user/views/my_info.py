@@ -1,15 +1,22 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.viewsets import GenericViewSet
 from rest_framework.generics import get_object_or_404
 from rest_framework import mixins
 
+from companion.utils.api import idempotent
+from companion.utils.request_metrics import SerializationTimingMixin
+from companion.utils.upload import TemporaryFileUploadMixin
 from user.serializers.user import MyInfoSerializer
 
 User = get_user_model()
 
 
-class MyInfoViewSet(mixins.RetrieveModelMixin,
+@idempotent
+class MyInfoViewSet(SerializationTimingMixin,
+                    TemporaryFileUploadMixin,
+                    mixins.RetrieveModelMixin,
                     mixins.UpdateModelMixin,
                     GenericViewSet):
     """
@@ -20,6 +27,7 @@ class MyInfoViewSet(mixins.RetrieveModelMixin,
 
     Maximum avatar size: 10MB.
     If exceed, will response with HTTP 413 Payload Too Large.
+    Images with too many pixels (more than 16 megapixels by default, see `AVATAR_MAX_PIXELS`) are rejected with HTTP 400.
     """
     queryset = User.objects.all()
     serializer_class = MyInfoSerializer
@@ -27,5 +35,8 @@ class MyInfoViewSet(mixins.RetrieveModelMixin,
     ordering_fields = []
     ordering = []
 
+    def get_max_upload_size(self):
+        return settings.AVATAR_MAX_UPLOAD_SIZE
+
     def get_object(self):
         return get_object_or_404(self.get_queryset(), pk=self.request.user.pk)
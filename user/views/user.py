@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model, login
 from django.utils.decorators import method_decorator
 from django.utils.translation import gettext as _
@@ -11,6 +12,8 @@ from rest_framework.reverse import reverse_lazy
 from rest_framework.viewsets import GenericViewSet
 
 from companion.utils.api import extra_action_urls
+from companion.utils.request_metrics import SerializationTimingMixin
+from companion.utils.upload import TemporaryFileUploadMixin
 from user.business.reset_password import (ResetPasswordBusiness,
                                           ResetPasswordTokenInvalid)
 from user.filters import UserFilter, UserSearchFilter
@@ -33,7 +36,9 @@ User = get_user_model()
     ),
     name='dispatch'
 )
-class UserViewSet(mixins.RetrieveModelMixin,
+class UserViewSet(SerializationTimingMixin,
+                  TemporaryFileUploadMixin,
+                  mixins.RetrieveModelMixin,
                   mixins.UpdateModelMixin,
                   mixins.ListModelMixin,
                   GenericViewSet):
@@ -50,6 +55,10 @@ class UserViewSet(mixins.RetrieveModelMixin,
     permission_classes = [IsSelfOrReadOnly]
     ordering_fields = ['nickname', 'email']
     ordering = ['nickname']
+    throttle_scope = None  # Set per action, see `ScopedRateThrottle`
+
+    def get_max_upload_size(self):
+        return settings.AVATAR_MAX_UPLOAD_SIZE
 
     @action(
         detail=False, methods=['POST'], url_path='register',
@@ -76,11 +85,15 @@ class UserViewSet(mixins.RetrieveModelMixin,
         serializer_class=UserSearchSerializer,
         filterset_class=UserSearchFilter,
         pagination_class=UserSearchPagination,
-        ordering_fields=['nickname', 'email']
+        ordering_fields=['nickname', 'email'],
+        ordering=None,  # Best matches first, unless `ordering` is given
+        throttle_scope='user_search',
     )
     def search(self, request):
         """
-        Search for user by nickname or email.
+        Search for user by nickname or email, best matches first.
+        Also find users with typos in the query (fuzzy search).
+        Queries shorter than 3 characters only match beginning of words.
         """
         queryset = self.filter_queryset(self.get_queryset())
         page = self.paginate_queryset(queryset)
@@ -102,6 +115,7 @@ class UserViewSet(mixins.RetrieveModelMixin,
         new_password = serializer.validated_data['new_password']
 
         user = self.request.user
+        user.refresh_from_db()  # Authenticated user may be cached, check against the latest password
         if not user.check_password(current_password):
             raise PermissionDenied(_('Wrong password.'))
 